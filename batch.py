@@ -0,0 +1,92 @@
+"""
+Finds the wavefront in many experiment folders without a display, e.g.
+
+``python -m batch "experiments/*" --line line.csv --output results``
+
+The line is an annotation saved from the viewer with Save... > Annotation.
+For each folder, ``<output>/<folder>.csv`` and ``.pdf`` are written, where
+``<folder>`` is its path relative to the parent folder all of them share,
+e.g. ``a/day1`` and ``b/day1``. The statistics of its frames are kept next
+to them, in ``<output>/<folder>.stats.npz``, so that the input folders are
+never written to.
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List
+
+import src.pipeline
+from src.frame_stats import SIDECAR
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Finds the wavefront along a saved annotation in every "
+                    "image of each folder.")
+    parser.add_argument("folders", nargs="+",
+                        help="folders of images, or glob patterns")
+    parser.add_argument("--line", required=True,
+                        help="the annotation, as saved by the viewer")
+    parser.add_argument("--output", default=".",
+                        help="where to write the CSV files and plots")
+    parser.add_argument("--mode", type=int, default=0, choices=range(4),
+                        help="0: gradient, 1: moving average, "
+                             "2: both multiplied, 3: gaussian filter")
+    parser.add_argument("--window-size", type=int, default=20)
+    parser.add_argument("--sigma", type=float, default=5)
+    parser.add_argument("--weight-factor", type=float, default=0.)
+    parser.add_argument("--line-thickness", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of folders processed at once")
+    return parser.parse_args(argv)
+
+
+def output_names(folders: List[str]) -> List[str]:
+    """
+    :return: the path of each of ``folders`` relative to the deepest parent
+     folder they share, so that folders of the same name in different places
+     get different names.
+    """
+    folders = [os.path.abspath(folder) for folder in folders]
+    root = os.path.commonpath([os.path.dirname(f) for f in folders])
+    return [os.path.relpath(folder, root) for folder in folders]
+
+
+def main(argv=None) -> int:
+    """ :return: the number of folders that failed. """
+    args = parse_args(argv)
+    folders = sorted({f for pattern in args.folders
+                      for f in glob.glob(pattern) or [pattern]
+                      if os.path.isdir(f)})
+    if not folders:
+        print("No folders to process")
+        return 1
+
+    line = src.pipeline.load_line(args.line)
+    outputs = [os.path.join(args.output, name)
+               for name in output_names(folders)]
+    for output in outputs: os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    failed = 0
+    with ProcessPoolExecutor(args.workers) as executor:
+        futures = {executor.submit(
+            src.pipeline.process_folder, folder, line, output,
+            args.mode, args.window_size, args.sigma, args.weight_factor,
+            args.line_thickness, output + SIDECAR): folder
+            for folder, output in zip(folders, outputs)}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Failed to process {futures[future]}: {e}")
+
+    print(f"Processed {len(folders) - failed} of {len(folders)} folders")
+    return failed
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    raise SystemExit(main() != 0)
@@ -0,0 +1,57 @@
+"""
+Compares plain Dijkstra against A* and bidirectional search, reporting the
+number of pixels each engine settles and its wall time, both searching the
+whole frame and tracing through ``Searcher`` as the viewer does.
+
+Usage: ``python benchmarks/engine_bench.py [size]``
+"""
+import sys
+
+import init
+import numpy as np
+from lib.point import Point
+from search_bench import make_frame, timed
+from src.cost_map import ExpDecayWeight
+from src.search_engines import (AStarSearchEngine, BidirectionalSearchEngine,
+                                CSGraphSearchEngine, HeapSearchEngine,
+                                to_index, to_point)
+from src.searcher import Searcher
+
+
+def main(size):
+    data = make_frame(size)
+    weights = ExpDecayWeight()(data)
+    y = (size / 2 + size / 4 * np.sin(np.arange(size) / size * 2 * np.pi)
+         ).astype(int).tolist()
+    cases = {
+        "short, on filament": (Point(size // 4, y[size // 4]),
+                               Point(size // 4 + 30, y[size // 4 + 30])),
+        "long, on filament": (Point(0, y[0]), Point(size - 1, y[-1])),
+        "corner to corner": (Point(0, 0), Point(size - 1, size - 1)),
+    }
+    engines = [HeapSearchEngine(), CSGraphSearchEngine(), AStarSearchEngine(),
+               BidirectionalSearchEngine()]
+
+    # flatten the weights outside the timed runs
+    for engine in engines: engine.search(weights, 0, 1)
+
+    print(f"{size}x{size} frame")
+    for name, (orig, dest) in cases.items():
+        print(f"\n{name}: {orig} -> {dest}")
+        for engine in engines:
+            path, t = timed(engine.search, weights, to_index(orig, size),
+                            to_index(dest, size))
+            cost = sum(weights[to_point(i, size).t] for i in path)
+            print(f"{type(engine).__name__:>36}: {engine.expanded:>9} "
+                  f"pixels settled, {t:7.3f}s, cost {cost:.6g}")
+        for engine in engines:
+            searcher = Searcher(engine)
+            line, t = timed(searcher.trace, orig, dest, data)
+            cost = sum(weights[p.y, p.x] for p in line)
+            print(f"{'Searcher, ' + type(engine).__name__:>36}: "
+                  f"{engine.expanded:>9} pixels settled, {t:7.3f}s, "
+                  f"cost {cost:.6g}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1024)
@@ -0,0 +1,75 @@
+"""
+Times showing the first frame of a folder of 16-bit TIFFs, decoding every
+frame up front like ``ImageViewer.open`` used to, and with ``ImageStack``.
+Then times passes over the whole stack, converting each shrunk PIL image
+to an array like the viewer used to, and reading the cached frames, and
+showing a frame from the display pyramid.
+
+Usage: ``python benchmarks/image_stack_bench.py [size]``
+"""
+import os
+import sys
+import tempfile
+
+import init
+import numpy as np
+from PIL import Image
+from search_bench import timed
+from src.image_stack import ImageStack, list_images
+from src.pyramid import DISPLAY_SIZE
+
+
+def make_folder(folder, frames, size):
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 4096, (size, size), dtype=np.uint16)
+    for i in range(frames):
+        Image.fromarray(data).save(os.path.join(folder, f"{i:04}.tif"))
+
+
+def eager(folder):
+    images = [Image.open(path) for path in list_images(folder)]
+    max_brightness = max(np.max(np.array(image)) for image in images)
+    for image in images:
+        image.thumbnail(DISPLAY_SIZE, Image.Resampling.LANCZOS)
+    return images, max_brightness
+
+
+def lazy(folder):
+    stack = ImageStack(list_images(folder))
+    try:
+        return stack[0], stack.max_brightness
+    finally:
+        stack.close()
+
+
+def main(size):
+    for frames in (10, 100, 400):
+        with tempfile.TemporaryDirectory() as folder:
+            make_folder(folder, frames, size)
+            _, t_eager = timed(eager, folder)
+            _, t_lazy = timed(lazy, folder)
+            print(f"{frames} frames of {size}x{size}: first frame after "
+                  f"{t_eager:.3f}s decoding all, {t_lazy:.3f}s lazily")
+
+    with tempfile.TemporaryDirectory() as folder:
+        make_folder(folder, 100, size)
+        images, _ = eager(folder)
+        _, t_pil = timed(lambda: [np.max(np.array(i)) for i in images])
+
+        stack = ImageStack(list_images(folder))
+        try:
+            _, t_first = timed(lambda: [np.max(f) for f in stack])
+            _, t_second = timed(lambda: [np.max(f) for f in stack])
+            _, t_build = timed(stack.pyramid.show, 50)
+            _, t_shown = timed(stack.pyramid.show, 50)
+        finally:
+            stack.close()
+        print(f"a pass over 100 frames: {t_pil:.3f}s from shrunk PIL images, "
+              f"{t_first:.3f}s decoding, {t_second:.4f}s from the cache "
+              f"at full resolution")
+        print(f"showing a frame: {t_build * 1000:.1f} ms building its "
+              f"rendition, {t_shown * 1000:.2f} ms once built")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1024)
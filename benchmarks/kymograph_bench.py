@@ -0,0 +1,70 @@
+"""
+Compares saving a new figure per frame to a PDF, as the viewer used to,
+against reusing one figure, and both against drawing and saving the
+kymograph of the whole stack or its profiles as CSV.
+
+Usage: ``python benchmarks/kymograph_bench.py [frames] [pixels]``
+"""
+import os
+import sys
+import tempfile
+
+import init
+from matplotlib import pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+from search_bench import timed
+from src.graph_analyzer import GraphAnalyzer
+from src.pipeline import (plot_kymograph, save_graphs, save_kymograph,
+                          save_profiles)
+from wavefront_bench import make_profiles
+
+
+def legacy_save_graphs(file_path, profiles):
+    """ How ``ImageViewer.save_graphs`` saved a page per frame. """
+    with PdfPages(file_path) as pdf:
+        for i, brightness_values in enumerate(profiles):
+            plt.figure()
+            plt.xlabel('Number of pixels from origin')
+            plt.ylabel('Brightness')
+            plt.title(f'Brightness Along Selected Line in Image {i + 1}')
+            plt.plot(range(len(brightness_values)), brightness_values)
+            pdf.savefig()
+            plt.close()
+
+
+def main(frames, pixels):
+    profiles = make_profiles(frames, pixels)
+    analyzer = GraphAnalyzer()
+    analyzer.mode = 1
+    res = analyzer.max_sum(analyzer.moving_average(profiles), 0.)
+
+    def draw():
+        fig = Figure()
+        plot_kymograph(fig.add_subplot(), profiles, res)
+        fig.canvas.draw()
+
+    with tempfile.TemporaryDirectory() as folder:
+        _, t_legacy = timed(legacy_save_graphs,
+                            os.path.join(folder, "legacy.pdf"), profiles)
+        _, t_pdf = timed(save_graphs, os.path.join(folder, "graphs.pdf"),
+                         profiles)
+        _, t_csv = timed(save_profiles, os.path.join(folder, "p.csv"),
+                         profiles)
+        _, t_draw = timed(draw)
+        _, t_tif = timed(save_kymograph, os.path.join(folder, "k.tif"),
+                         profiles)
+        _, t_npy = timed(save_kymograph, os.path.join(folder, "k.npy"),
+                         profiles)
+    print(f"{frames} frames, line of {pixels} pixels: {t_legacy:.2f}s saving "
+          f"a new figure per frame, {t_pdf:.2f}s reusing one "
+          f"({t_legacy / t_pdf:.1f}x), {t_csv * 1000:.0f} ms saving the "
+          f"profiles as CSV")
+    print(f"kymograph: {t_draw * 1000:.0f} ms drawing it, "
+          f"{t_tif * 1000:.1f} ms saving it as TIFF, {t_npy * 1000:.1f} ms "
+          f"as NPY")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
@@ -0,0 +1,36 @@
+"""
+Times growing a livewire tree, and previewing paths to random cursors.
+
+Usage: ``python benchmarks/livewire_bench.py [size] [radius]``
+"""
+import sys
+
+import init
+import numpy as np
+from lib.point import Point
+from search_bench import make_frame, timed
+from src.livewire import Livewire
+
+
+def main(size, radius):
+    data = make_frame(size)
+    orig = Point(size // 2, size // 2)
+    livewire = Livewire(radius)
+    _, t = timed(livewire.start, data, orig, 0)
+    print(f"{size}x{size} frame, {radius} px radius: tree grown in {t:.3f}s")
+
+    rng = np.random.default_rng(0)
+    times, lengths = [], []
+    for _ in range(200):
+        dest = Point(*(int(v) for v in rng.integers(
+            max(orig.x - radius, 0), min(orig.x + radius + 1, size), 2)))
+        path, t = timed(livewire.path_to, dest)
+        times.append(t * 1000)
+        lengths.append(0 if path is None else len(path))
+    print(f"preview: {np.mean(times):.2f} ms mean, {max(times):.2f} ms max, "
+          f"paths of up to {max(lengths)} px")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2048,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 1024)
@@ -0,0 +1,76 @@
+"""
+Compares the direct convolution ``GraphAnalyzer.take_avg`` used to run
+against OpenCV at several radii, smoothing the whole frame and then
+reading the line against averaging the disk around each pixel of the line
+only, and reading the line frame by frame against sampling a memory-mapped
+stack at once.
+
+Usage: ``python benchmarks/profile_bench.py [size] [radius] [frames]``
+"""
+import os
+import sys
+import tempfile
+
+import init
+import numpy as np
+from search_bench import make_frame, timed
+from src.graph_analyzer import GraphAnalyzer
+from tests.graph_analyzer_test import legacy_take_avg
+
+
+def legacy(data, radius, line):
+    """ How brightness profiles were read before ``sample_avg``. """
+    data = legacy_take_avg(data, radius)
+    return [data[p[1], p[0]] for p in line]
+
+
+def main(size, radius):
+    data = make_frame(size)
+    for r in (1, radius, 4 * radius):
+        expected, t_direct = timed(legacy_take_avg, data, r)
+        res, t = timed(GraphAnalyzer.take_avg, data, r)
+        assert np.allclose(expected, res)
+        print(f"{size}x{size} frame, radius {r}: {t_direct * 1000:.0f} ms "
+              f"convolving directly, {t * 1000:.1f} ms with OpenCV "
+              f"({t_direct / t:.0f}x)")
+    analyzer = GraphAnalyzer()
+    analyzer.smooth(0, data, radius)
+    _, t = timed(analyzer.smooth, 0, data, radius)
+    print(f"smoothing the same frame again: {t * 1e6:.0f} us")
+    for length in (size // 4, size):
+        x = np.linspace(0, size - 1, length).astype(int)
+        line = np.stack((x, (size / 2 + x / 4).astype(int)), axis=1)
+        expected, t_full = timed(legacy, data, radius, line)
+        res, t = timed(GraphAnalyzer.sample_avg, data, radius, line)
+        assert np.allclose(expected, res)
+        print(f"{size}x{size} frame, radius {radius}, line of {length} "
+              f"pixels: {t_full * 1000:.1f} ms smoothing the frame, "
+              f"{t * 1000:.2f} ms sampling the line ({t_full / t:.0f}x)")
+
+
+def stack(size, radius, n):
+    x = np.arange(size)
+    line = np.stack((x, (size / 2 + x / 4).astype(int)), axis=1)
+    with tempfile.TemporaryDirectory() as folder:
+        frames = np.memmap(os.path.join(folder, "frames.raw"), np.uint16,
+                           'w+', shape=(n, size, size))
+        for i in range(n): frames[i] = make_frame(size, i)
+
+        def one_by_one():
+            return [GraphAnalyzer.sample_avg(data, radius, line)
+                    for data in frames]
+
+        expected, t_loop = timed(one_by_one)
+        res, t = timed(GraphAnalyzer.sample_stack, frames, radius, line)
+        assert np.allclose(expected, res)
+        del frames
+    print(f"{n} frames of {size}x{size}, line of {size} pixels: "
+          f"{t_loop * 1000:.0f} ms frame by frame, {t * 1000:.0f} ms "
+          f"sampling the stack at once ({t_loop / t:.1f}x)")
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    radius = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    main(size, radius)
+    stack(size, radius, int(sys.argv[3]) if len(sys.argv) > 3 else 50)
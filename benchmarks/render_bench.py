@@ -0,0 +1,87 @@
+"""
+Times drawing a frame while the brightness slider is dragged, coloring the
+whole float frame and drawing the annotations each time like
+``ImageViewer._draw`` used to, and with ``Renderer``.
+
+Then compares the time and peak memory of coloring a 16-bit frame in
+floats and through the lookup table of ``Colorizer``.
+
+Usage: ``python benchmarks/render_bench.py [size]``
+"""
+import sys
+import tracemalloc
+
+import init
+import cv2
+import numpy as np
+from matplotlib import colormaps
+from search_bench import make_frame, timed
+from src.colorizer import Colorizer
+from src.pyramid import Pyramid
+from src.renderer import Renderer
+
+
+def draw(layer, color=(255, 0, 0, 255)):
+    rng = np.random.default_rng(0)
+    points = rng.integers(0, min(layer.shape[:2]), (20, 2))
+    for p in points: cv2.circle(layer, tuple(map(int, p)), 3, color, -1)
+    cv2.polylines(layer, [points.astype(np.int32)], False, color, 1)
+
+
+def legacy(data, brightness):
+    data = np.clip(data / 4096 * brightness, 0, 1)
+    data = (colormaps['viridis'](data)[:, :, :3] * 255).astype(np.uint8)
+    draw(data, (255, 0, 0))
+    return data
+
+
+def peak(f, *args):
+    """ :return: the peak memory allocated while running ``f``, in MB. """
+    tracemalloc.start()
+    f(*args)
+    res = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return res / 2 ** 20
+
+
+def colorize(frame):
+    colorizer = Colorizer(colormaps['viridis'])
+    colorizer.table(frame.dtype, 4096, 1)
+    floats = lambda: (colormaps['viridis'](np.clip(
+        frame / 4096 * 1, 0, 1))[:, :, :3] * 255).astype(np.uint8)
+    table = lambda: colorizer(frame, 4096, 1)
+
+    _, t_floats = timed(floats)
+    _, t_table = timed(table)
+    print(f"coloring {frame.shape[1]}x{frame.shape[0]} 16-bit: "
+          f"{t_floats * 1000:.1f} ms and {peak(floats):.0f} MB in floats, "
+          f"{t_table * 1000:.1f} ms and {peak(table):.0f} MB through a "
+          f"table ({t_floats / t_table:.1f}x)")
+
+
+def main(size):
+    frame = (make_frame(size).astype(np.uint16) * 16)
+    data, _ = Pyramid(lambda i: frame).show(0)
+    ticks = np.linspace(0.5, 3, 60)
+
+    _, t_full = timed(lambda: [legacy(frame, b) for b in ticks])
+    _, t_legacy = timed(lambda: [legacy(data, b) for b in ticks])
+    renderer = Renderer(colormaps['viridis'])
+    _, t_layers = timed(lambda: [
+        renderer.render(0, data, 4096, b, 0, draw) for b in ticks])
+    # e.g. a click, which only changes the annotations
+    _, t_overlay = timed(lambda: [
+        renderer.render(0, data, 4096, 1, k, draw) for k in range(len(ticks))])
+    print(f"{size}x{size} frame shown at {data.shape[1]}x{data.shape[0]}, "
+          f"per slider tick: {t_full / len(ticks) * 1000:.1f} ms coloring "
+          f"the full frame, {t_legacy / len(ticks) * 1000:.1f} ms coloring "
+          f"the rendition in floats, {t_layers / len(ticks) * 1000:.1f} ms "
+          f"with layers; per change of annotations: "
+          f"{t_overlay / len(ticks) * 1000:.2f} ms")
+
+    colorize(frame)
+    colorize(data)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2048)
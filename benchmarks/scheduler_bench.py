@@ -0,0 +1,55 @@
+"""
+Compares ten segments queued at once in the ``SearchScheduler`` against the
+slowest of them traced alone. The queued segments can only take about as
+long as the slowest one with a core per segment; on fewer cores, the workers
+share them.
+
+Usage: ``python benchmarks/scheduler_bench.py [size] [workers]``
+"""
+import multiprocessing
+import sys
+import threading
+
+import init
+from lib.point import Point
+from search_bench import make_frame, timed
+from src.line_tracers import LineTracerTypes as ltt
+from src.scheduler import SearchScheduler
+from src.search_engines import SearchToken
+
+
+def run(scheduler, data, segments):
+    """ Queues ``segments`` and waits for all of them. """
+    done = threading.Semaphore(0)
+    for orig, dest in segments:
+        scheduler.submit(ltt.BRIGHTEST, orig, dest, data, 0, 1, SearchToken(),
+                         lambda line: done.release())
+    for _ in segments: done.acquire()
+
+
+def main(size, workers):
+    data = make_frame(size)
+    # segments across the filament, far enough apart not to share boxes
+    segments = [(Point(x, size // 8), Point(x + size // 20, 7 * size // 8))
+                for x in range(0, size - size // 20, size // 10)][:10]
+    scheduler = SearchScheduler(max_workers=workers)
+    print(f"{size}x{size} frame, {scheduler.max_workers} workers, "
+          f"{multiprocessing.cpu_count()} cores")
+
+    try:
+        # start the workers and compute the shared weights
+        _, t = timed(run, scheduler, data, segments[:1])
+        print(f"{'first segment':>20}: {t:8.3f}s")
+
+        slowest = max(timed(run, scheduler, data, [s])[1] for s in segments)
+        _, t_all = timed(run, scheduler, data, segments)
+        print(f"{'slowest alone':>20}: {slowest:8.3f}s")
+        print(f"{'ten queued':>20}: {t_all:8.3f}s "
+              f"({t_all / slowest:4.1f}x the slowest)")
+    finally:
+        scheduler.shutdown()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2048,
+         int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,77 @@
+"""
+Compares the old ``Point``-based Dijkstra loop against the search engines.
+
+Usage: ``python benchmarks/search_bench.py [size]``
+"""
+import sys
+import time
+
+import init
+import numpy as np
+from lib.point import Point
+from src.cost_map import ExpDecayWeight
+from src.search_engines import CSGraphSearchEngine, HeapSearchEngine, to_index
+from src.searcher import Searcher
+from tests.search_engine_test import legacy_search
+
+
+def make_frame(size, seed=0):
+    """ A noisy dark frame with a bright sine-shaped filament. """
+    rng = np.random.default_rng(seed)
+    data = rng.normal(20, 5, size=(size, size)).clip(0, 255)
+    x = np.arange(size)
+    y = (size / 2 + size / 4 * np.sin(x / size * 2 * np.pi)).astype(int)
+    for dy in range(-2, 3): data[(y + dy).clip(0, size - 1), x] = 60
+    return data
+
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    res = f(*args, **kwargs)
+    return res, time.perf_counter() - start
+
+
+def main(size):
+    data = make_frame(size)
+    orig, dest = Point(0, 0), Point(size - 1, size - 1)
+    weights = ExpDecayWeight()(data)
+    print(f"{size}x{size} frame, {orig} -> {dest}")
+
+    expected, legacy = timed(legacy_search, orig, dest, data)
+    print(f"legacy loop: {legacy:8.3f}s")
+
+    for engine in HeapSearchEngine(), CSGraphSearchEngine():
+        path, t = timed(engine.search, weights, to_index(orig, size),
+                        to_index(dest, size))
+        same = path == [to_index(p, size) for p in expected]
+        print(f"{type(engine).__name__:>20}: {t:8.3f}s "
+              f"({legacy / t:5.1f}x, same path: {same})")
+
+        # a second click on the same frame reuses the cached weights
+        _, t = timed(engine.search, weights, to_index(orig, size),
+                     to_index(dest, size))
+        print(f"{'same frame again':>20}: {t:8.3f}s ({legacy / t:5.1f}x)")
+
+    # a short segment only needs a small box around its ends
+    orig, dest = Point(size // 2, size // 2), Point(size // 2 + 30, size // 2)
+    roi, full = Searcher(), Searcher()
+    full.padding = size
+    for searcher in roi, full: searcher.trace(orig, dest, data, key=0)
+    _, t_roi = timed(roi.trace, orig, dest, data, None, key=0)
+    _, t_full = timed(full.trace, orig, dest, data, None, key=0)
+    print(f"30 px segment: {t_roi:.4f}s in a box, {t_full:.4f}s on the whole "
+          f"frame")
+
+    # a polyline along the filament, segment by segment and all at once
+    xs = np.linspace(0, size - 1, 9).astype(int)
+    points = [Point(int(x), int(size / 2 + size / 4 *
+                                np.sin(x / size * 2 * np.pi))) for x in xs]
+    _, t_each = timed(lambda: [roi.trace(a, b, data, key=0)
+                               for a, b in zip(points, points[1:])])
+    _, t_all = timed(roi.trace_polyline, points, data, key=0)
+    print(f"{len(points) - 1} segments: {t_each:.4f}s one by one, "
+          f"{t_all:.4f}s in one call")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2048)
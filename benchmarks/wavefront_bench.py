@@ -0,0 +1,71 @@
+"""
+Compares the old triple loop of ``GraphAnalyzer._max_sum`` against the
+vectorized float solver of ``src.wavefront``, and times the solver on a
+full-size stack, and smoothing its profiles one by one against smoothing
+them at once.
+
+Usage: ``python benchmarks/wavefront_bench.py [frames] [pixels]``
+"""
+import sys
+
+import init
+import numpy as np
+import src.wavefront
+from search_bench import timed
+from src.graph_analyzer import GraphAnalyzer
+from tests.graph_analyzer_test import legacy_max_sum, legacy_moving_average
+
+
+def make_profiles(frames, pixels, seed=0):
+    """ Brightness profiles of a front moving along the line. """
+    rng = np.random.default_rng(seed)
+    x = np.arange(pixels)
+    front = np.linspace(pixels / 10, pixels * 9 / 10, frames)[:, None]
+    return (50 * (1 - np.tanh((x - front) / 20)) +
+            rng.normal(0, 5, (frames, pixels)))
+
+
+def objective(l, indices):
+    return sum(l[i][j] for i, j in indices)
+
+
+def main(frames, pixels):
+    l = make_profiles(30, 300)
+    expected, legacy = timed(legacy_max_sum, l, 0.)
+    res, t = timed(GraphAnalyzer._max_sum, l, 0.)
+    print(f"30x300: legacy loop {legacy:.3f}s, vectorized {t:.4f}s "
+          f"({legacy / t:.0f}x)")
+    # the loop truncated sums to integers, so it may miss the best choice
+    print(f"sum of the chosen values: {objective(l, expected[0]):.3f} by the "
+          f"legacy loop, {objective(l, res[0]):.3f} by the solver")
+
+    l = make_profiles(frames, pixels)
+    _, t = timed(GraphAnalyzer._max_sum, l, 0.)
+    print(f"{frames}x{pixels}: vectorized {t:.3f}s, legacy loop would take "
+          f"about {legacy * frames * pixels ** 2 / (30 * 300 ** 2):.0f}s")
+
+    # `GraphAnalyzer.max_sum` used to solve four times, reversing rows twice
+    rows = list(l)
+    _, t_four = timed(lambda: [
+        src.wavefront.max_sum(rows, 0.),
+        src.wavefront.max_sum([line[::-1] for line in rows], 0.),
+        src.wavefront.max_sum(rows, .1),
+        src.wavefront.max_sum([line[::-1] for line in rows], .1)])
+    _, t_both = timed(src.wavefront.max_sum_both, rows, .1)
+    print(f"both directions: {t_four:.3f}s in four solves, {t_both:.3f}s in "
+          f"one sweep ({t_four / t_both:.1f}x)")
+
+    analyzer = GraphAnalyzer()
+    for mode in range(4):
+        analyzer.mode = mode
+        expected, t_rows = timed(lambda: [legacy_moving_average(row, mode)
+                                          for row in l])
+        res, t = timed(analyzer.moving_average, l)
+        assert np.array_equal(expected, res)
+        print(f"moving average, mode {mode}: {t_rows * 1000:.1f} ms row by "
+              f"row, {t * 1000:.1f} ms at once ({t_rows / t:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
@@ -18,6 +18,8 @@ class Point(tuple):
 
     def __new__(cls, x, y): return super().__new__(cls, (x, y))
 
+    def __getnewargs__(self): return tuple(self)
+
     @property
     def x(self) -> int: return self[0]
 
@@ -1,4 +1,7 @@
+import multiprocessing
+
 import src.app
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     src.app.ImageViewer().mainloop()
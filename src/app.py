@@ -1,4 +1,3 @@
-import os
 import queue
 import threading
 import tkinter as tk
@@ -6,25 +5,56 @@ from argparse import ArgumentError
 from tkinter import filedialog, messagebox
 
 import cv2
+import matplotlib
 import numpy as np
-from PIL import Image, ImageFile, ImageTk
+from PIL import Image, ImageTk
 from matplotlib import pyplot as plt
-from matplotlib.backends.backend_pgf import PdfPages
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.cm import get_cmap
+from matplotlib.figure import Figure
 
+import src.frame_stats
 import src.graph_analyzer
 import src.history
+import src.image_stack
 import src.line_tracers
+import src.livewire
+import src.pipeline
+import src.renderer
+import src.scheduler
 import src.settings
+import src.tracker
 from lib.doubly_linked_list import DoublyLinkedList, DoublyLinkedNode
 from lib.point import Point
-from src.line_tracers import LineTracerTypes as ltt
+from src.line_tracers import BRIGHTEST_TYPES, LineTracerTypes as ltt
+from src.search_engines import SearchToken
 
 SIZE_RATIO = 0.75
+# how long the frame and waypoints must stay the same before the livewire is
+# grown, in ms
+LIVEWIRE_DELAY = 150
 
 
-class ImageNode(DoublyLinkedNode[ImageFile.ImageFile]): pass
+class ImageNode(DoublyLinkedNode[np.ndarray]):
+    """
+    A frame of an ``ImageStack``, decoded when its value is read. The value
+    is a read-only view of the frame.
+    """
+
+    def __init__(self, stack: src.image_stack.ImageStack, index: int):
+        self.prev = self.next = self.child = None
+        self.stack = stack
+        self.index = index
+        # the file and page, which stay the same when frames are numbered
+        # again, see `ImageStack.on_pages`
+        self.page = stack.pages[index]
+
+    # the list compares nodes while moving its cursor, which must not decode
+    # any frame
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    @property
+    def value(self) -> np.ndarray: return self.stack[self.index]
 
 
 class ImageList(DoublyLinkedList[ImageNode]): pass
@@ -130,6 +160,12 @@ class ImageViewer(tk.Tk):
         self.save_menu.add_command(label="All images", command=self.save_all)
         self.save_menu.add_command(label="Save Graphs",
                                    command=self.save_graphs)
+        self.save_menu.add_command(label="Brightness Profiles",
+                                   command=self.save_profiles)
+        self.save_menu.add_command(label="Kymograph",
+                                   command=self.save_kymograph)
+        self.save_menu.add_command(label="Annotation",
+                                   command=self.save_line)
         self.save_button.pack(side='left', padx=5)
 
         self.clear_button = (
@@ -141,6 +177,10 @@ class ImageViewer(tk.Tk):
                       command=self.cancel_search))
         self.cancel_search_button.pack(side='left', padx=5)
 
+        self.search_label = tk.Label(self.button_frame, text="", width=30,
+                                     anchor='w')
+        self.search_label.pack(side='left', padx=5)
+
         self.settings_button = tk.Button(self.button_frame, text="Settings...",
                                          command=self.show_settings)
         self.settings_button.pack(side='left', padx=5)
@@ -179,6 +219,16 @@ class ImageViewer(tk.Tk):
                                        command=self.recalc_max_brightness)
         self.recalc_button.pack(side='right', padx=5)
 
+        self.kymograph_button = tk.Button(self.button_frame,
+                                          text="Kymograph",
+                                          command=self.show_kymograph)
+        self.kymograph_button.pack(side='right', padx=5)
+
+        self.track_button = tk.Button(self.button_frame,
+                                      text="Track Across Stack",
+                                      command=self.track_stack)
+        self.track_button.pack(side='right', padx=5)
+
         self.analyzer_button = tk.Menubutton(self.button_frame,
                                              text="Change Analyzing Method...")
         self.analyzer_menu = tk.Menu(self.analyzer_button, tearoff=0)
@@ -216,6 +266,14 @@ class ImageViewer(tk.Tk):
         self.line_tracer_menu.add_command(
             label="Brightest path searcher",
             command=lambda: self.line_tracers.set_curr_type(ltt.BRIGHTEST))
+        self.line_tracer_menu.add_command(
+            label="Brightest path searcher (A*)",
+            command=lambda: self.line_tracers.set_curr_type(
+                ltt.BRIGHTEST_ASTAR))
+        self.line_tracer_menu.add_command(
+            label="Brightest path searcher (bidirectional)",
+            command=lambda: self.line_tracers.set_curr_type(
+                ltt.BRIGHTEST_BIDIRECTIONAL))
         self.line_tracer_button.pack(side='right', padx=5)
 
         self.y_slider = tk.Scale(self.button_frame, from_=1,
@@ -228,14 +286,31 @@ class ImageViewer(tk.Tk):
         self.y_slider.pack(side='right', padx=5)
 
         self.image_list = ImageList()
+        self.stack = None  # the frames of the opened file or folder
         self.curr_image = None
-        self.orig_image = None
+        self.orig_image = None  # the current frame, at full resolution
+        # maps the shown frame to `orig_image`, see `src.pyramid.DisplayMap`
+        self.display_map = None
         self.lock = threading.Lock()
 
         self.playing = False
         self.searching = 0
-        self.max_brightness = 1
+        self.opened = 0  # number of times a file or folder has been opened
+        self.search_tokens = set()  # tokens of searches still running
         self.line_tracers = src.line_tracers.LineTracers(ltt.LINE)
+        # brightest-path searches run in worker processes
+        self.scheduler = src.scheduler.SearchScheduler(dispatch=self.after_idle)
+        self.tracker = src.tracker.StackTracker()
+        self.tracked = {}  # paths tracked on each frame, by frame index
+        self.track_token = None  # token of the last run of `track_stack`
+        self.livewire = src.livewire.Livewire()
+        self.livewire_token = None
+        self.livewire_after = None  # id of the pending `_grow_livewire`
+        self.rendered = None  # the current frame as drawn, without preview
+        self.renderer = src.renderer.Renderer(
+            matplotlib.colormaps['viridis'])
+        self.plotted = None  # what the graph was last plotted for
+        self.kymograph = None  # (key, kymograph) of the annotated line
         self.history = src.history.PointsList()
         self.graph_analyzer = src.graph_analyzer.GraphAnalyzer()
         self.settings = src.settings.Settings()
@@ -259,11 +334,15 @@ class ImageViewer(tk.Tk):
 
     def undo(self):
         self.history.prev()
+        self.tracked.clear()
+        self._start_livewire()
         self._draw()
         self._config_button()
 
     def redo(self):
         self.history.next()
+        self.tracked.clear()
+        self._start_livewire()
         self._draw()
         self._config_button()
 
@@ -287,43 +366,56 @@ class ImageViewer(tk.Tk):
 
         self.cancel_search()
         self.history.clear()
+        self.tracked.clear()
         self.image_list.clear()
+        self.opened += 1
+        self.renderer.clear()
+
+        # frames are only decoded once shown, see `ImageStack`
+        if self.stack: self.stack.close()
+        self.stack = src.image_stack.ImageStack(
+            src.image_stack.list_images(file_path) if is_folder else [file_path],
+            on_max_brightness=lambda _: self.after_idle(self._draw),
+            cache_dir=self.settings.cache_dir,
+            stats_file=src.frame_stats.sidecar_path(file_path),
+            on_pages=lambda _: self.after_idle(self._list_frames))
+        if not len(self.stack):
+            self.image_label.configure(image=tk.PhotoImage())
+            messagebox.showerror("Open folder",
+                                 "This folder does not contain any image files.")
+            return
 
-        # push images to list
-        if is_folder:
-            count = self.image_list.push_all(
-                [ImageNode(Image.open(os.path.join(file_path, f)))
-                 for f in sorted(
-                    [f for f in os.listdir(file_path)
-                     if f.lower().endswith(
-                        (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif",
-                         ".tiff"))],
-                    key=lambda x: os.path.getmtime(os.path.join(file_path, x)))
-                 ])
-
-            if count == 0:
-                self.image_label.configure(image=tk.PhotoImage())
-                messagebox.showerror("Open folder",
-                                     "This folder does not contain any image files.")
-                return
-
-            self.image_slider.config(to=count)
-        else:
-            self.image_list.push(ImageNode(Image.open(file_path)))
-
-        self.max_brightness = 1
-        for node in self.image_list:
-            self.max_brightness = max(np.max(np.array(node.value)),
-                                      self.max_brightness)
-
-        # Ensure every image has been opened, so program doesn't have to open
-        # it during runtime
-        while not self.image_list.curr_at_first():
-            self._change_image(self.image_list.prev().value)
+        count = self.image_list.push_all(
+            ImageNode(self.stack, i) for i in range(len(self.stack)))
+        self.image_slider.config(to=count)
+        self._change_image(self.image_list.goto(0).value)
+        self.image_slider.set(1)
 
-        self._change_image(self.image_list.peek().value)
+        self.cancel_search()
+        self._config_button()
 
+    def _list_frames(self):
+        """
+        Lists the frames of the stack again once pages were found in its
+        files, still showing the same frame.
+        """
+        if not self.stack or self.image_list.is_empty(): return
+        # the cursor may be before the first frame
+        page = getattr(self.image_list.peek(), "page", None)
         self.cancel_search()
+        self.tracked.clear()
+        self.graph_analyzer.last = None
+        # weights and renditions are cached by frame index
+        self.opened += 1
+        self.renderer.clear()
+
+        self.image_list.clear()
+        count = self.image_list.push_all(
+            ImageNode(self.stack, i) for i in range(len(self.stack)))
+        self.image_slider.config(to=count)
+        i = self.stack.pages.index(page) if page in self.stack.pages else 0
+        self._change_image(self.image_list.goto(i).value)
+        self.image_slider.set(i + 1)
         self._config_button()
 
     def save(self):
@@ -391,34 +483,17 @@ class ImageViewer(tk.Tk):
         self._draw()
 
     def save_graphs(self):
-        self.searching += 1
-        self._config_button()
-
         file_path = filedialog.asksaveasfilename(
             defaultextension=".pdf",
             filetypes=[("PDF files", "*.pdf")])
+        if not file_path: return
 
-        try:
-            with PdfPages(file_path) as pdf:
-                for i, image in enumerate(self.image_list):
-                    plt.figure()
-
-                    data = np.array(image.value)
-                    data = np.mean(data, axis=2) if len(
-                        data.shape) == 3 else data
-
-                    brightness_values = self._get_brightness_values(data)
-
-                    plt.xlabel('Number of pixels from origin')
-                    plt.ylabel('Brightness')
-                    plt.title(
-                        f'Brightness Along Selected Line in Image {i + 1}')
-                    plt.plot(
-                        range(len(brightness_values)), brightness_values)
-
-                    pdf.savefig()
-                    plt.close()
+        self.searching += 1
+        self._config_button()
 
+        try:
+            src.pipeline.save_graphs(file_path,
+                                     self._get_all_brightness_values())
             messagebox.showinfo("Success", "Graphs saved successfully.")
 
         except (OSError, RuntimeError) as e:
@@ -439,14 +514,21 @@ class ImageViewer(tk.Tk):
     def clear(self):
         self.cancel_search()
         self.history.undo_all()
+        self.tracked.clear()
         self._draw()
         self._config_button()
         print("Cleared annotations")
 
-    def cancel_search(self):
+    def cancel_search(self, token: SearchToken = None):
+        """
+        Cancels a running search, or all of them if ``token`` is ``None``.
+        Each one stops within a bounded number of steps and then updates
+        ``self.searching`` itself.
+        """
         with self.lock:
-            self.searching = 0
-            # self.searcher.canceled = True
+            for t in [token] if token else self.search_tokens: t.cancel()
+            self.search_tokens.difference_update([token] if token else
+                                                 self.search_tokens.copy())
             self._config_button()
 
         # Find the last line entry and restore to that state
@@ -487,23 +569,153 @@ class ImageViewer(tk.Tk):
         tk.Button(slider_win, text="Close", command=slider_win.destroy).pack()
 
     def recalc_max_brightness(self):
-        brightness_values = []
-        for node in self.image_list:
-            data = np.array(node.value)
-            data = self.graph_analyzer.take_avg(data,
-                                                self.settings.line_thickness)
-            data = self.graph_analyzer.moving_average(
-                self._get_brightness_values(data))
-            brightness_values.append(data)
-        self.graph_analyzer.max_sum(brightness_values,
-                                    self.settings.weight_factor)
-
-        self.graph_analyzer.line = \
-            [p for l in self.history.get_lines() for p in l][::-1]
+        line = [p for l in self.history.get_lines() for p in l][::-1]
+        profiles, res = src.pipeline.wavefront(
+            self.stack, line,
+            self.graph_analyzer, self.settings.line_thickness,
+            self.settings.weight_factor)
+        self.graph_analyzer.line = line
+        self.kymograph = self._kymograph_key(line), profiles
 
         self._plot_brightness()
         self._draw()
 
+        if messagebox.askyesno("Save File", "Save output as a CSV file?"):
+            try:
+                file_path = filedialog.asksaveasfilename(
+                    defaultextension=".csv",
+                    filetypes=[("CSV files", "*.csv")])
+
+                if file_path:
+                    src.pipeline.save_csv(file_path, res)
+                    messagebox.showinfo("Success", "Image saved at"
+                                                   f"\n{file_path}\n"
+                                                   "successfully.")
+
+            except OSError as e:
+                messagebox.showerror(
+                    "Error", f"An error occurred while saving graphs:\n{str(e)}")
+
+    def save_profiles(self):
+        """
+        Saves the brightness along the lines of every frame as a CSV file,
+        see ``src.pipeline.save_profiles``.
+        """
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+        if not file_path: return
+
+        try:
+            src.pipeline.save_profiles(file_path,
+                                       self._get_all_brightness_values())
+            messagebox.showinfo("Success", "Brightness profiles saved at"
+                                           f"\n{file_path}\n"
+                                           "successfully.")
+        except OSError as e:
+            messagebox.showerror(
+                "Error", f"An error occurred while saving:\n{str(e)}")
+
+    def show_kymograph(self):
+        """
+        Shows the brightness along the annotated line in every frame as one
+        image, with the last wavefront found.
+        """
+        kymograph = self._get_kymograph()
+        if kymograph is None:
+            messagebox.showwarning("Kymograph",
+                                   "Trace a line before showing its "
+                                   "kymograph.")
+            return
+
+        window = tk.Toplevel(self)
+        window.title("Kymograph")
+        fig = Figure()
+        src.pipeline.plot_kymograph(fig.add_subplot(), kymograph,
+                                    self.graph_analyzer.last)
+        canvas = FigureCanvasTkAgg(fig, master=window)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill="both", expand=True)
+        tk.Button(window, text="Save...", command=self.save_kymograph).pack()
+
+    def save_kymograph(self):
+        """ Saves the kymograph of the annotated line as a TIFF or NPY file. """
+        kymograph = self._get_kymograph()
+        if kymograph is None:
+            messagebox.showwarning("Kymograph",
+                                   "Trace a line before saving its kymograph.")
+            return
+
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".tif", filetypes=src.pipeline.KYMOGRAPH_TYPES)
+        if not file_path: return
+
+        try:
+            src.pipeline.save_kymograph(file_path, kymograph)
+            messagebox.showinfo("Success", "Kymograph saved at"
+                                           f"\n{file_path}\n"
+                                           "successfully.")
+        except OSError as e:
+            messagebox.showerror(
+                "Error", f"An error occurred while saving:\n{str(e)}")
+
+    def save_line(self):
+        """ Saves the annotation, to process other folders with ``batch``. """
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+        if not file_path: return
+
+        try:
+            src.pipeline.save_line(
+                file_path,
+                [p for l in self.history.get_lines() for p in l][::-1])
+            messagebox.showinfo("Success", "Annotation saved at"
+                                           f"\n{file_path}\n"
+                                           "successfully.")
+        except OSError as e:
+            messagebox.showerror(
+                "Error", f"An error occurred while saving:\n{str(e)}")
+
+    def track_stack(self):
+        """
+        Traces the current annotation again on every other frame, following
+        the specimen as it drifts. Frames are shown as they finish.
+        """
+        points = self.history.get_circles()[::-1]
+        lines = [node.value.line for node in self.history.iter_prev()][::-1]
+        if len(points) < 2 or not all(lines[1:]):
+            messagebox.showwarning("Track across stack",
+                                   "Trace a line before tracking it.")
+            return
+
+        curr_type = self.line_tracers.curr_type
+        if curr_type not in BRIGHTEST_TYPES: curr_type = ltt.BRIGHTEST
+
+        token = SearchToken(progress=lambda *args: self.after_idle(
+            self._show_search_progress, *args))
+        keys = [(self.opened, i, self.settings.line_thickness)
+                for i in range(len(self.stack))]
+        # frames of this run still running, counted from the same keys the
+        # tracker goes through, even if the stack grows in the meantime
+        remaining = [len(keys) - 1]
+        with self.lock:
+            # a new run replaces the frames of the previous one
+            if self.track_token: self.track_token.cancel()
+            self.track_token = token
+            self.tracked.clear()
+            self.searching += remaining[0]
+            self.search_tokens.add(token)
+        self._config_button()
+
+        # reads every frame, and submits them a few at a time
+        threading.Thread(
+            target=self.tracker.track,
+            args=(self.scheduler, curr_type, self.stack, keys, points,
+                  lines[1:], self.image_list.curr_id,
+                  self.settings.line_thickness, token,
+                  lambda i, res: self.after_idle(
+                      self._finish_tracking, i, token, res, remaining)),
+            daemon=True).start()
+
     def prev_image(self):
         if not self.image_list.curr_at_first():
             self._change_image(self.image_list.prev().value)
@@ -528,11 +740,15 @@ class ImageViewer(tk.Tk):
         except ArgumentError:
             return
 
+        token = SearchToken(progress=lambda *args: self.after_idle(
+            self._show_search_progress, *args))
         with self.lock:
             action_node = src.history.ActionNode(
                 src.history.Action(Point(x, y)))
             self.history.push(action_node)
+            self.tracked.clear()
             self.searching += 1
+            self.search_tokens.add(token)
 
         # now do UI updates and start thread outside the lock
         self._draw()
@@ -540,14 +756,32 @@ class ImageViewer(tk.Tk):
 
         self.graph_analyzer.last = None
         self.hide_lines = False
+        self._start_livewire()
 
         if self.searching:
-            threading.Thread(
-                target=self._search,
-                args=(np.array(self.orig_image[0]), action_node),
-                daemon=True).start()
+            # identifies the frame and smoothing, so its weights are reused
+            key = (self.opened, self.image_list.curr_id,
+                   self.settings.line_thickness)
+            curr_type = self.line_tracers.curr_type
+            if curr_type in BRIGHTEST_TYPES and action_node.prev.value:
+                # a newer click on the same point supersedes this search
+                self.scheduler.submit(
+                    curr_type, action_node.prev.value.point,
+                    action_node.value.point, self.orig_image,
+                    key, self.settings.line_thickness, token,
+                    lambda line: self._finish_search(action_node, token, line),
+                    group=id(action_node.prev))
+            else:
+                threading.Thread(
+                    target=self._search,
+                    args=(self.orig_image, action_node, key,
+                          token),
+                    daemon=True).start()
 
     def on_motion(self, event):
+        if self.line_tracers.curr_type in BRIGHTEST_TYPES:
+            self._preview(event)
+            return
         if self.line_tracers.curr_type != ltt.FREE: return
 
         if not self.button_down:
@@ -566,12 +800,10 @@ class ImageViewer(tk.Tk):
             self.y_slider.set(self.y_slider.get() - 10)
         self._plot_brightness()
 
-    def _change_image(self, image: ImageFile.ImageFile):
-        # Resize image if it's too large (maintaining aspect ratio)
-        display_size = (800, 600)  # Maximum display size
-        image.thumbnail(display_size, Image.Resampling.LANCZOS)
-
-        self.orig_image = image.copy(), ImageTk.PhotoImage(image)
+    def _change_image(self, image: np.ndarray):
+        self.stack.prefetch(self.image_list.peek().index)
+        self.orig_image = image
+        self._start_livewire()
         self._draw()
         self._config_button()
 
@@ -645,46 +877,182 @@ class ImageViewer(tk.Tk):
         if self.image_list.is_empty(): return
 
         brightness = self.brightness_slider.get() / 100
-        data = np.array(self.image_list.peek().value)
-        data = np.clip(data / self.max_brightness * brightness, 0, 1)
-
-        # Add color
-        data = (get_cmap('viridis')(data)[:, :, :3] * 255).astype(np.uint8)
+        i = self.image_list.peek().index
+        # a shrunk rendition, while everything is analyzed at full resolution
+        data, self.display_map = self.stack.pyramid.show(i)
 
+        lines = self._get_lines()
+        dist = self._get_wavefront()
+        settings = self.settings
+        # everything the annotations depend on, so that they are only drawn
+        # again when one of these changes
+        overlay_key = (self.display_map, self.hide_lines,
+                       tuple(self.history.get_circles()),
+                       tuple(l.tobytes() for l in lines), dist,
+                       settings.circle_radius, settings.circle_color,
+                       settings.line_color, settings.line_thickness)
+        data = self.renderer.render(
+            (self.opened, i), data, self.stack.max_brightness, brightness,
+            overlay_key,
+            lambda layer: self._draw_annotations(layer, lines, dist))
+
+        self.rendered = data
+        self._show(data)
+
+        # the graph does not depend on the brightness
+        plotted = self.opened, i, overlay_key[3], dist, settings.line_thickness
+        if plotted != self.plotted:
+            self.plotted = plotted
+            self.after_idle(self._plot_brightness)
+
+    def _draw_annotations(self, layer, lines, dist):
+        """
+        Draws the waypoints, ``lines`` and the wavefront at ``dist`` pixels
+        along them on the RGBA ``layer``.
+        """
+        # points are drawn at their exact position on the shown frame
+        display_map = self.display_map
+        circle_color = self.settings.circle_color + (255,)
+        line_color = self.settings.line_color + (255,)
         if not self.hide_lines:
             for circle in self.history.get_circles():
-                cv2.circle(data, circle, self.settings.circle_radius,
-                           self.settings.circle_color, -1)
+                cv2.circle(layer, display_map.fixed_point(circle),
+                           display_map.fixed_length(
+                               self.settings.circle_radius),
+                           circle_color, -1, shift=display_map.shift)
 
-            cv2.polylines(data, self.history.get_lines(), False,
-                          self.settings.line_color,
-                          self.settings.line_thickness)
+            cv2.polylines(layer, [display_map.fixed(l) for l in lines], False,
+                          line_color, self.settings.line_thickness,
+                          shift=display_map.shift)
 
         # draw pointer to wavefront
-        line = [p for l in self.history.get_lines() for p in l][::-1]
-        dist = self._get_wavefront()
-        if line and dist:
-            x, y = line[dist]
-            length = 10
+        line = [p for l in lines for p in l][::-1]
+        if line and dist and dist < len(line):
+            x, y = display_map.fixed_point(line[dist])
+            length = display_map.fixed_length(10)
 
-            cv2.rectangle(data, (x - length // 2, y - length // 2),
+            cv2.rectangle(layer, (x - length // 2, y - length // 2),
                           (x + length // 2, y + length // 2),
-                          self.settings.line_color, 2)
+                          line_color, 2, shift=display_map.shift)
 
+    def _show(self, data):
         image = Image.fromarray(data)
         photo = ImageTk.PhotoImage(image)  # Convert to PhotoImage
         self.image_label.configure(image=photo)
         self.curr_image = image, photo  # Keep a reference
-        self.after_idle(self._plot_brightness)
 
-    def _get_brightness_values(self, data):
-        return [data[p[1], p[0]] for l in self.history.get_lines()
-                for p in l][::-1]
+    def _preview(self, event):
+        """
+        Shows the brightest path from the last waypoint to the cursor, once
+        the livewire is ready.
+        """
+        if not self.livewire.ready or self.rendered is None or self.hide_lines:
+            return
+        try:
+            x, y, _ = self._get_coor(event)
+        except ArgumentError:
+            return
+
+        data = self.rendered.copy()
+        line = self.livewire.path_to(Point(x, y))
+        if line is not None:
+            cv2.polylines(data, [self.display_map.fixed(line)], False,
+                          self.settings.line_color,
+                          self.settings.line_thickness,
+                          shift=self.display_map.shift)
+        self._show(data)
+
+    def _start_livewire(self):
+        """
+        Grows the livewire from the last waypoint on the current frame in a
+        worker process, once nothing has changed for ``LIVEWIRE_DELAY`` ms,
+        so that scrolling through frames does not start a tree per frame.
+        Stops the previous one.
+        """
+        if self.livewire_token: self.livewire_token.cancel()
+        self.livewire.stop()
+        self.livewire_token = None
+        if self.livewire_after: self.after_cancel(self.livewire_after)
+        self.livewire_after = self.after(LIVEWIRE_DELAY, self._grow_livewire)
+
+    def _grow_livewire(self):
+        self.livewire_after = None
+        points = self.history.get_circles()
+        if (self.line_tracers.curr_type not in BRIGHTEST_TYPES or not points
+                or self.orig_image is None or self.playing): return
+
+        token = self.livewire_token = SearchToken()
+        key = (self.opened, self.image_list.curr_id,
+               self.settings.line_thickness)
+        self.scheduler.submit_livewire(
+            points[0], self.livewire.radius, self.orig_image, key,
+            self.settings.line_thickness, token,
+            lambda tree: self.livewire.use(tree, token), group="livewire")
+
+    def _get_brightness_values(self, data, i=None, radius=None):
+        """
+        :param data: a frame, at full resolution.
+        :param radius: of the disk averaged around each pixel, as
+         ``GraphAnalyzer.take_avg`` does, ``line_thickness`` by default. If
+         ``0``, the pixels themselves.
+        :return: the brightness of ``data`` along the lines of frame ``i``.
+        """
+        if radius is None: radius = self.settings.line_thickness
+        points = [p for l in self._get_lines(i) for p in l][::-1]
+        return self.graph_analyzer.sample_avg(data, radius, points)
+
+    def _get_all_brightness_values(self):
+        """
+        :return: the raw ``_get_brightness_values`` of every frame, as they
+         are exported. Frames without tracked lines share the annotated
+         lines, so they are sampled all at once, see
+         ``src.pipeline.stack_profiles``.
+        """
+        line = [p for l in self.history.get_lines() for p in l][::-1]
+        kymograph = src.pipeline.stack_profiles(self.stack, line, 0)
+        res = list(kymograph)
+        for i in list(self.tracked):
+            data = self.stack[i]
+            data = np.mean(data, axis=2) if len(data.shape) == 3 else data
+            res[i] = self._get_brightness_values(data, i, 0)
+        return res
+
+    def _get_kymograph(self):
+        """
+        :return: the brightness along the annotated line in every frame, see
+         ``src.pipeline.stack_profiles``, or ``None`` if there is no line.
+         Tracked lines are not used, so that all rows have the same length.
+        """
+        line = [p for l in self.history.get_lines() for p in l][::-1]
+        if not line or not self.stack: return None
+        key = self._kymograph_key(line)
+        if self.kymograph is None or self.kymograph[0] != key:
+            self.kymograph = key, src.pipeline.stack_profiles(
+                self.stack, line, self.settings.line_thickness)
+        return self.kymograph[1]
+
+    def _kymograph_key(self, line):
+        """ :return: identifies the kymograph of ``line``. """
+        return (self.opened, np.asarray(line).tobytes(),
+                self.settings.line_thickness)
+
+    def _get_lines(self, i=None):
+        """
+        :param i: the index of a frame, the current one by default.
+        :return: the lines tracked on frame ``i`` if there are any, else the
+         annotated lines, as returned by ``PointsList.get_lines``.
+        """
+        if i is None: i = self.image_list.curr_id
+        if i not in self.tracked: return self.history.get_lines()
+        return [np.array(line) for line in self.tracked[i][::-1]]
 
     def _get_coor(self, event):
+        """
+        :return: the full-resolution coordinates of the pixel under the
+         cursor, and the frame as shown.
+        """
         try:
             image, _ = self.curr_image
-            orig_height, orig_width = np.array(image).shape[:2]
         except (TypeError, ValueError):
             raise ArgumentError(None, "")
 
@@ -700,15 +1068,10 @@ class ImageViewer(tk.Tk):
         photo_x = event.x - pad_x
         photo_y = event.y - pad_y
 
-        width_scale = orig_width / photo_width
-        height_scale = orig_height / photo_height
-
-        x = int(photo_x * width_scale)
-        y = int(photo_y * height_scale)
-
-        if x < 0 or y < 0 or x >= orig_width or y >= orig_height:
-            raise ArgumentError(None, "")
+        coor = self.display_map and self.display_map.to_full(photo_x, photo_y)
+        if coor is None: raise ArgumentError(None, "")
 
+        x, y = coor
         return x, y, image
 
     def _get_wavefront(self):
@@ -721,27 +1084,32 @@ class ImageViewer(tk.Tk):
                            f"wavefront:\n{str(e)}")
             return None
 
-    def _search(self, orig_image, action_node):
+    def _search(self, orig_image, action_node, key=None, token=None):
         print("")
         if self.line_tracers.curr_type == ltt.FREE:
             while self.button_down: print("")
 
+        line = None
         try:
             if (not action_node.prev.value and
                     self.line_tracers.curr_type != ltt.FREE): return
-            data = self.graph_analyzer.take_avg(orig_image,
-                                                self.settings.line_thickness)
+            # straight and freehand lines do not read the frame
+            data = orig_image
+            if self.line_tracers.curr_type in BRIGHTEST_TYPES:
+                data = self.graph_analyzer.smooth(
+                    key, orig_image, self.settings.line_thickness)
             line = self.line_tracers.get_line_tracer.trace(
                 action_node.prev.value.point if action_node.prev.value else None,
-                action_node.value.point, data, self.mouse_coor)
+                action_node.value.point, data, self.mouse_coor, key=key,
+                token=token)
+        finally:
+            self._finish_search(action_node, token, line)
 
+    def _finish_search(self, action_node, token, line):
+        """ Stores the ``line`` found by a search, unless it was canceled. """
+        try:
             with self.lock:
-                if line:  # and not self.searcher.canceled:
-                    data = np.array(self.image_list.peek().value.copy())
-                    cv2.polylines(data, [np.array(line)], False,
-                                  self.settings.line_color,
-                                  self.settings.line_thickness)
-
+                if line and not (token and token.canceled):
                     # Store result in stack
                     action_node.value.line = line
                     self.after_idle(self._draw)
@@ -749,11 +1117,33 @@ class ImageViewer(tk.Tk):
             with self.lock:
                 self._config_button()
                 self.searching -= 1
+                self.search_tokens.discard(token)
                 self._config_button()
+            self.after_idle(self._show_search_progress)
+
+    def _finish_tracking(self, i, token, lines, remaining):
+        """ Stores the ``lines`` tracked on frame ``i``. """
+        with self.lock:
+            if lines and all(lines) and not token.canceled:
+                self.tracked[i] = lines
+                if i == self.image_list.curr_id: self.after_idle(self._draw)
+            self.searching -= 1
+            remaining[0] -= 1
+            if not remaining[0]: self.search_tokens.discard(token)
+            self._config_button()
+        self.after_idle(self._show_search_progress)
+
+    def _show_search_progress(self, expanded=None, distance=None):
+        if not self.searching:
+            self.search_label.configure(text="")
+        elif expanded is not None:
+            self.search_label.configure(
+                text=f"Searching: {self.searching} running, {expanded} px, "
+                     f"distance {distance:.3g}")
 
     def _set_ylim_graph(self):
         if not self.image_list.is_empty():
-            data = np.array(self.image_list.peek().value)
+            data = self.image_list.peek().value
             self.after_idle(self._plot_brightness, data)
 
     def _play(self):
@@ -770,13 +1160,11 @@ class ImageViewer(tk.Tk):
         self._config_button()
 
     def _plot_brightness(self, data=None):
-        if data is None: data = np.array(self.orig_image[0])
+        if data is None: data = self.orig_image
         data = np.mean(data, axis=2) if len(data.shape) == 3 else data
-        data = self.graph_analyzer.take_avg(Image.fromarray(data),
-                                            self.settings.line_thickness)
 
         brightness_values = self._get_brightness_values(data)
-        if not brightness_values: return
+        if not len(brightness_values): return
 
         moving_average = self.graph_analyzer.moving_average(brightness_values)
 
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+import numpy as np
+
+
+class Colorizer:
+    """
+    Colors frames through a lookup table of the color of every possible
+    value, built once per dtype and normalization, so that 8 and 16-bit
+    frames are colored with a single ``np.take`` from their own pixels,
+    without any float image.
+
+    The table holds exactly the colors that normalizing and coloring each
+    value in floats would give. Frames of other dtypes are colored in
+    floats.
+
+    :ivar colormap: a ``matplotlib`` colormap
+    :ivar max_size: maximum number of tables kept
+    """
+
+    # dtypes colored through a table
+    TABLE_DTYPES = (np.dtype(np.uint8), np.dtype(np.uint16))
+    # number of pixels colored at a time
+    CHUNK = 2 ** 16
+
+    def __init__(self, colormap, max_size: int = 4):
+        self.colormap = colormap
+        self.max_size = max_size
+        self._tables: OrderedDict[Tuple, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, data: np.ndarray, max_brightness: float,
+                 brightness: float) -> np.ndarray:
+        """
+        :return: ``data`` normalized by ``max_brightness``, times
+         ``brightness``, and colored, as an RGB image. Colored through a
+         table, it is a view of an RGBX image.
+        """
+        if data.dtype not in self.TABLE_DTYPES:
+            return self.color(data, max_brightness, brightness)
+        packed = self.packed(data.dtype, max_brightness, brightness)
+        res = np.empty(data.shape, dtype=np.uint32)
+        # `take` converts indices to intp, so a few rows at a time keep that
+        # copy small, and in cache
+        step = max(self.CHUNK // max(data[0].size, 1), 1)
+        for i in range(0, len(data), step):
+            np.take(packed, data[i:i + step], out=res[i:i + step],
+                    mode='clip')
+        return res.view(np.uint8).reshape(data.shape + (4,))[..., :3]
+
+    def color(self, data: np.ndarray, max_brightness: float,
+              brightness: float) -> np.ndarray:
+        """ Colors ``data`` in floats, see ``__call__``. """
+        data = np.clip(data / max_brightness * brightness, 0, 1)
+        # the same as scaling the float colors, without making them
+        return self.colormap(data, bytes=True)[..., :3]
+
+    def table(self, dtype, max_brightness: float, brightness: float) \
+            -> np.ndarray:
+        """
+        :return: the RGB color of every value of ``dtype``, one per row.
+        """
+        packed = self.packed(dtype, max_brightness, brightness)
+        return packed.view(np.uint8).reshape(-1, 4)[:, :3]
+
+    def packed(self, dtype, max_brightness: float, brightness: float) \
+            -> np.ndarray:
+        """
+        :return: ``table``, with each color in the first 3 bytes of a
+         ``uint32``, so that one pixel is colored by taking one element.
+        """
+        key = np.dtype(dtype), max_brightness, brightness
+        with self._lock:
+            if key in self._tables:
+                self._tables.move_to_end(key)
+                return self._tables[key]
+
+        values = np.arange(np.iinfo(dtype).max + 1, dtype=dtype)
+        table = np.zeros(len(values), dtype=np.uint32)
+        table.view(np.uint8).reshape(-1, 4)[:, :3] = self.color(
+            values, max_brightness, brightness)
+        table.flags.writeable = False
+        with self._lock:
+            self._tables[key] = table
+            while len(self._tables) > self.max_size:
+                self._tables.popitem(last=False)
+        return table
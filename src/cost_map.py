@@ -0,0 +1,91 @@
+import numpy as np
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional
+
+
+@dataclass(frozen=True)
+class ExpDecayWeight:
+    """
+    Calculates the edge weight based on pixel intensity, as an exponential
+    decay function. Works on single values as well as whole images.
+
+    Modifying this formula changes how much a pixel's intensity affects the
+    relative cost of traversal.
+
+    :ivar n0: weight of a black pixel
+    :ivar t_half: increase in intensity that halves the weight
+    """
+    n0: float = 2 ** 16
+    t_half: float = 16
+
+    def __call__(self, x: float | np.ndarray) -> float | np.ndarray:
+        # https://www.desmos.com/calculator/8zad7rj8md
+        return self.n0 * 2 ** (-x / self.t_half)
+
+
+class CostMaps:
+    """
+    Computes the weight image of a frame in one vectorized expression, and
+    keeps the most recently used ones so that repeated searches on the same
+    frame skip the computation entirely.
+
+    :ivar weight: the weight function applied to every pixel
+    :ivar max_size: maximum number of weight images kept
+    """
+
+    def __init__(self, weight: ExpDecayWeight = ExpDecayWeight(),
+                 max_size: int = 4):
+        self.weight = weight
+        self.max_size = max_size
+        self._cache: OrderedDict[Hashable, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, data: np.ndarray, key: Optional[Hashable] = None) \
+            -> np.ndarray:
+        """
+        :param data: a grayscale or color image.
+        :param key: identifies ``data``, e.g. its frame number and the line
+         thickness it was smoothed with. If ``None``, nothing is cached.
+        :return: a read-only 2D array of edge weights, one per pixel.
+        """
+        if key is not None:
+            key = key, self.weight
+            with self._lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    return self._cache[key]
+
+        # Convert to grayscale if the image is in color
+        data = np.mean(data, axis=2) if len(data.shape) == 3 else data
+        weights = self.weight(data.astype(float))
+        weights.flags.writeable = False
+
+        if key is not None: self._put(key, weights)
+        return weights
+
+    def put(self, key: Hashable, weights: np.ndarray):
+        """
+        Caches weights computed elsewhere, e.g. by another process, as if
+        ``get`` had computed them.
+
+        :param key: see ``get``.
+        :param weights: what ``get`` would return for ``key``. Not copied.
+        """
+        weights.flags.writeable = False
+        self._put((key, self.weight), weights)
+
+    def _put(self, key, weights):
+        with self._lock:
+            self._cache[key] = weights
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """ :return: ``True`` iff the weights for ``key`` are cached. """
+        with self._lock: return (key, self.weight) in self._cache
+
+    def clear(self):
+        with self._lock: self._cache.clear()
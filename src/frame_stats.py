@@ -0,0 +1,166 @@
+import os
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# the name of the sidecar file of a folder
+SIDECAR = ".stats.npz"
+PERCENTILES = (1., 50., 99., 99.9)
+BINS = 256
+
+
+def sidecar_path(path: str) -> str:
+    """ :return: where the statistics of a folder or of a file are saved. """
+    if os.path.isdir(path): return os.path.join(path, SIDECAR)
+    return path + SIDECAR
+
+
+def file_key(path: str) -> Tuple[str, int, int]:
+    """
+    :return: identifies the contents of ``path`` while it is not modified:
+     its name, modification time and size.
+    """
+    stat = os.stat(path)
+    return os.path.basename(path), stat.st_mtime_ns, stat.st_size
+
+
+class FrameStats:
+    """
+    Statistics of each frame of a stack, computed at full resolution as
+    frames are decoded, and saved next to the stack in a small sidecar file
+    so that they are reused the next time it is opened.
+
+    Frames are matched to the sidecar by file name, modification time, size
+    and page, so that statistics of modified files are computed again.
+
+    :ivar min: the darkest pixel of each frame, ``nan`` if not known yet
+    :ivar max: the brightest pixel of each frame, ``nan`` if not known yet
+    :ivar percentiles: the ``PERCENTILES`` of each frame, one per column
+    :ivar histograms: the number of pixels of each frame in each of ``BINS``
+     bins spanning ``ranges``
+    :ivar ranges: the lowest and highest value of the histogram of each
+     frame, the range of the dtype for integer images
+    """
+
+    def __init__(self, keys: Sequence[Tuple[str, int, int, int]]):
+        """ :param keys: the ``file_key`` and page of each frame. """
+        self.keys = list(keys)
+        n = len(self.keys)
+        self.min = np.full(n, np.nan)
+        self.max = np.full(n, np.nan)
+        self.percentiles = np.full((n, len(PERCENTILES)), np.nan)
+        self.histograms = np.zeros((n, BINS), dtype=np.int64)
+        self.ranges = np.full((n, 2), np.nan)
+        self.dirty = False  # whether there are statistics not saved yet
+
+    def __len__(self): return len(self.keys)
+
+    def __contains__(self, i: int) -> bool:
+        """ :return: ``True`` iff the statistics of frame ``i`` are known. """
+        return not np.isnan(self.max[i])
+
+    @property
+    def complete(self) -> bool: return not np.isnan(self.max).any()
+
+    @property
+    def max_brightness(self) -> float:
+        """ The brightest pixel of the frames known so far, at least 1. """
+        return float(np.nanmax(self.max, initial=1))
+
+    @staticmethod
+    def compute(data: np.ndarray) -> Tuple[float, float, np.ndarray,
+                                           np.ndarray, Tuple[float, float]]:
+        """
+        :param data: a frame, at full resolution.
+        :return: its statistics, as passed to ``set``.
+        """
+        if np.issubdtype(data.dtype, np.integer):
+            info = np.iinfo(data.dtype)
+            lo, hi = float(info.min), float(info.max) + 1
+        else:
+            lo, hi = float(np.min(data)), float(np.max(data))
+            if hi <= lo: hi = lo + 1
+        histogram, _ = np.histogram(data, BINS, (lo, hi))
+        return (float(np.min(data)), float(np.max(data)),
+                np.percentile(data, PERCENTILES), histogram, (lo, hi))
+
+    def set(self, i: int, stats):
+        """ :param stats: the statistics of frame ``i``, see ``compute``. """
+        (self.min[i], self.max[i], self.percentiles[i], self.histograms[i],
+         self.ranges[i]) = stats
+        self.dirty = True
+
+    def reindex(self, keys: Sequence[Tuple[str, int, int, int]]) \
+            -> "FrameStats":
+        """
+        :param keys: the ``file_key`` and page of each frame.
+        :return: the statistics of the frames ``keys``, with those of the
+         frames also in this instance, e.g. once more pages are found.
+        """
+        stats = FrameStats(keys)
+        index = {key: i for i, key in enumerate(self.keys)}
+        frames = [(j, index[key]) for j, key in enumerate(stats.keys)
+                  if key in index]
+        if frames:
+            theirs, mine = (list(t) for t in zip(*frames))
+            for name in ('min', 'max', 'percentiles', 'histograms', 'ranges'):
+                getattr(stats, name)[theirs] = getattr(self, name)[mine]
+        stats.dirty = True  # so that the new pages are saved
+        return stats
+
+    def save(self, file_path: str):
+        """
+        Saves the statistics, ``nan`` for the frames not known yet, replacing
+        ``file_path`` at once.
+        """
+        names, mtimes, sizes, pages = (zip(*self.keys) if self.keys
+                                       else ([], [], [], []))
+        tmp = file_path + ".tmp.npz"
+        np.savez(tmp, names=np.array(names, dtype=str),
+                 mtimes=np.array(mtimes, dtype=np.int64),
+                 sizes=np.array(sizes, dtype=np.int64),
+                 pages=np.array(pages, dtype=np.int64),
+                 min=self.min, max=self.max, percentiles=self.percentiles,
+                 histograms=self.histograms, ranges=self.ranges)
+        os.replace(tmp, file_path)
+        self.dirty = False
+
+    def load(self, file_path: str) -> int:
+        """
+        Reads the statistics of the frames that have not changed since they
+        were saved to ``file_path``.
+
+        :return: the number of frames whose statistics are now known.
+        """
+        with np.load(file_path) as saved:
+            index: Dict[Tuple[str, int, int, int], int] = {
+                key: j for j, key in enumerate(zip(
+                    saved['names'].tolist(), saved['mtimes'].tolist(),
+                    saved['sizes'].tolist(), saved['pages'].tolist()))}
+            frames = [(i, index[key]) for i, key in enumerate(self.keys)
+                      if key in index]
+            if not frames: return 0
+            mine, theirs = (list(t) for t in zip(*frames))
+            for name in ('min', 'max', 'percentiles', 'histograms', 'ranges'):
+                getattr(self, name)[mine] = saved[name][theirs]
+        return int(np.sum(~np.isnan(self.max)))
+
+
+def read_page_counts(file_path: Optional[str]) \
+        -> Dict[Tuple[str, int, int], int]:
+    """
+    :return: the number of pages of each file saved in the sidecar at
+     ``file_path``, by ``file_key``, so that they need not be read again.
+    """
+    if not file_path or not os.path.exists(file_path): return {}
+    counts = {}
+    try:
+        with np.load(file_path) as saved:
+            for name, mtime, size, page in zip(
+                    saved['names'].tolist(), saved['mtimes'].tolist(),
+                    saved['sizes'].tolist(), saved['pages'].tolist()):
+                key = name, mtime, size
+                counts[key] = max(counts.get(key, 0), page + 1)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Could not read {file_path}: {e}")
+    return counts
@@ -1,39 +1,46 @@
-import csv
-from tkinter import filedialog, messagebox
+import functools
+import threading
+from collections import OrderedDict
+from typing import Hashable
 
+import cv2
 import numpy as np
 from scipy.ndimage import gaussian_filter1d
-from scipy.signal import convolve2d
+
+import src.wavefront
 
 
 class GraphAnalyzer:
-    def __init__(self):
+    def __init__(self, max_smoothed: int = 4):
+        """ :param max_smoothed: maximum number of smoothed frames kept. """
         self.window_size = 20
         self.sigma = 5
         self.last = None
         self.line = None
         self.mode = 0
+        self.max_smoothed = max_smoothed
+        self._smoothed: OrderedDict[Hashable, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
 
     def moving_average(self, data):
         """
-        Compute the moving average of a 1D array using a specified window size.
+        Compute the moving average of a 1D array using a specified window size,
+        or of each row of a 2D array, e.g. of a kymograph, at once.
         """
         if self.mode == 3:
-            return gaussian_filter1d(data, self.sigma)
+            return gaussian_filter1d(data, self.sigma, axis=-1)
 
         data = np.array(data)
         if self.window_size < 1:
             raise ValueError("window_size should be at least 1")
-        if self.window_size > len(data):
+        if self.window_size > data.shape[-1]:
             raise ValueError(
                 "window_size should not be larger than the length of the data")
-        res = list(
-            np.convolve(data, np.ones(self.window_size) / self.window_size,
-                        mode='valid'))
+        res = _moving_average(data, self.window_size)
 
-        if self.mode == 0: return -np.gradient(res)
+        if self.mode == 0: return -np.gradient(res, axis=-1)
         if self.mode == 1: return res
-        if self.mode == 2: return res * -np.gradient(res)
+        if self.mode == 2: return res * -np.gradient(res, axis=-1)
 
         # garbage
         return data
@@ -49,29 +56,99 @@ class GraphAnalyzer:
         return dy_dx
 
     @staticmethod
-    def take_avg(image, radius) -> np.ndarray:
+    def disk(radius) -> np.ndarray:
+        """
+        :return: a ``2 * radius + 1`` square mask of the pixels within
+         ``radius`` of its center.
+        """
         size = radius * 2 + 1
         center = radius
         y, x = np.ogrid[:size, :size]
-        mask = (x - center) ** 2 + (y - center) ** 2 <= radius ** 2
+        return (x - center) ** 2 + (y - center) ** 2 <= radius ** 2
+
+    @staticmethod
+    def take_avg(image, radius) -> np.ndarray:
+        """
+        :return: the mean of the disk of ``radius`` around each pixel of
+         ``image``, mirrored at the edges, in ``float64``.
+        """
+        # the same as `convolve2d(..., mode='same', boundary='symm')` since
+        # the kernel is symmetric, but OpenCV switches to a DFT for large
+        # kernels, and is many times faster either way
+        return cv2.filter2D(np.asarray(image, dtype=np.float64), cv2.CV_64F,
+                            _kernel(radius), borderType=cv2.BORDER_REFLECT)
+
+    def smooth(self, key: Hashable, image, radius) -> np.ndarray:
+        """
+        ``take_avg``, kept for the most recently smoothed frames.
+
+        :param key: identifies ``image``, e.g. the index of the frame, or
+         ``None`` not to keep it.
+        :return: a read-only ``take_avg(image, radius)``.
+        """
+        if key is None: return self.take_avg(image, radius)
+        key = key, radius
+        with self._lock:
+            if key in self._smoothed:
+                self._smoothed.move_to_end(key)
+                return self._smoothed[key]
+
+        data = self.take_avg(image, radius)
+        data.flags.writeable = False
+        with self._lock:
+            self._smoothed[key] = data
+            while len(self._smoothed) > self.max_smoothed:
+                self._smoothed.popitem(last=False)
+        return data
 
-        kernel = np.zeros((size, size))
-        kernel[mask] = 1
-        kernel /= kernel.sum()  # normalize so it's an average
+    @staticmethod
+    def sample_avg(image, radius, points) -> np.ndarray:
+        """
+        ``take_avg`` at a few pixels only, averaging the disk around each of
+        them, so that it takes time proportional to the number of pixels
+        rather than to the area of ``image``. Pixels outside of ``image``
+        are mirrored into it, as ``take_avg`` does.
+
+        :param points: the ``x`` and ``y`` coordinates of each pixel.
+        :return: the value of ``take_avg(image, radius)`` at each pixel.
+        """
+        return GraphAnalyzer.sample_stack(image[None], radius, points)[0]
 
-        # Convolve image with circular (disk-like) kernel
-        avg_image = convolve2d(image, kernel, mode='same', boundary='symm')
-        return avg_image
+    @staticmethod
+    def sample_stack(frames, radius, points) -> np.ndarray:
+        """
+        ``sample_avg`` on every frame at once, gathering the disks of all of
+        them with a single fancy index, e.g. of a memory-mapped stack.
+
+        :param frames: the frames, along the first axis. The channels of
+         color frames are averaged too.
+        :param points: the ``x`` and ``y`` coordinates of each pixel.
+        :return: a ``(frames, points)`` kymograph, the value of ``sample_avg``
+         on each frame at each pixel.
+        """
+        points = np.asarray(points, dtype=np.intp).reshape(-1, 2)
+        dy, dx = np.nonzero(GraphAnalyzer.disk(radius))
+        height, width = frames.shape[1:3]
+        y = _reflect(points[:, 1:] + dy - radius, height)
+        x = _reflect(points[:, :1] + dx - radius, width)
+        res = np.empty((len(frames), len(points)))
+        # a few frames at a time, so that the gathered disks stay small
+        step = max(2 ** 22 // max(y.size, 1), 1)
+        for i in range(0, len(frames), step):
+            disks = frames[i:i + step][:, y, x]
+            res[i:i + step] = disks.mean(axis=tuple(range(2, disks.ndim)))
+        return res
 
     def max_sum(self, l, weight_factor):
         """
-        Runs ``_max_sum`` twice, once in an inverted order to allow a strictly
-        decreasing selection.
+        Solves ``_max_sum`` twice, once in an inverted order to allow a
+        strictly decreasing selection, in a single sweep (see
+        ``src.wavefront.max_sum_both``).
         """
-        is_increasing = (self._max_sum(l, 0.)[1] >
-                         self._max_sum([line[::-1] for line in l], 0.)[1])
-        increasing = self._max_sum(l, weight_factor)
-        tmp = self._max_sum([line[::-1] for line in l], weight_factor)
+        print(f"Finding the maximum values in {len(l)} images, "
+              f"each with a line of {len(l[0])} pixels, in both directions")
+        is_increasing, increasing, tmp = src.wavefront.max_sum_both(
+            l, weight_factor)
         decreasing = [(entry[0], len(l[0]) - entry[1]) for entry in tmp[0]], tmp[1]
         res = increasing if is_increasing else decreasing
         res = np.array(res[0])
@@ -79,27 +156,6 @@ class GraphAnalyzer:
         res = [(k[0] + 1, k[1] + error) for k in res]
         self.last = res
 
-        if messagebox.askyesno("Save File", "Save output as a CSV file?"):
-            try:
-                file_path = filedialog.asksaveasfilename(
-                    defaultextension=".csv",
-                    filetypes=[("CSV files", "*.csv")])
-
-                if file_path:
-                    with open(file_path, mode='w', newline='') as file:
-                        writer = csv.writer(file)
-                        writer.writerow(("Image number",
-                                         "Number of pixels from origin"))
-                        writer.writerows(res)
-
-                    messagebox.showinfo("Success", "Image saved at"
-                                                   f"\n{file_path}\n"
-                                                   "successfully.")
-
-            except OSError as e:
-                messagebox.showerror(
-                    "Error", f"An error occurred while saving graphs:\n{str(e)}")
-
         return res
 
     @staticmethod
@@ -115,39 +171,50 @@ class GraphAnalyzer:
 
         ``OPT(i, j) = max(OPT(i + 1, k) + l[i][j] + aj for k in range(j + 1, c))``
 
+        See ``src.wavefront.max_sum``.
+
         :param l: a 2D array with images as rows and number of pixels from the
          origin as columns
         """
         r, c = len(l), len(l[0])
         print(f"Finding the maximum values in {r} images, "
               f"each with a line of {c} pixels")
-
-        m = np.full((r, c), -1)
-        path = np.full((r, c), -1)
-
-        for j in range(c):
-            m[r - 1][j] = l[r - 1][j]
-
-        for i in range(r - 2, -1, -1):
-            for j in range(c):
-                for k in range(j + 1, c):
-                    tmp = m[i + 1][k] + l[i][j] + a * j
-                    if tmp > m[i][j]:
-                        m[i][j] = tmp
-                        path[i][j] = k
-
-        max_value = -1
-        max_pos = -1
-        for j in range(c):
-            if m[0][j] > max_value:
-                max_value = m[0][j]
-                max_pos = j
-
-        i, j = 0, max_pos
-        indices = []
-        while j != -1:
-            indices.append((i, j))
-            j = path[i][j]
-            i += 1
-
-        return indices, max_value
+        return src.wavefront.max_sum(l, a)
+
+
+def _moving_average(data: np.ndarray, window_size: int) -> np.ndarray:
+    """
+    :return: the mean of each ``window_size`` consecutive values along the
+     last axis of ``data``, exactly as ``np.convolve`` of each row gives it.
+    """
+    kernel = np.ones(window_size) / window_size
+    rows = data.reshape(-1, data.shape[-1])
+    length = rows.shape[1] - window_size + 1
+    if len(rows) < 2 or length < rows.shape[1] // 2:
+        res = np.array([np.convolve(row, kernel, mode='valid')
+                        for row in rows]).reshape(-1, length)
+    else:
+        # a single convolution of the rows end to end: the windows across
+        # two rows are dropped, and the others are the same dot products
+        res = np.convolve(rows.ravel(), kernel, mode='valid')
+        res = np.concatenate((res, np.zeros(window_size - 1)))
+        res = res.reshape(rows.shape)[:, :length]
+    return res.reshape(data.shape[:-1] + (length,))
+
+
+@functools.lru_cache(maxsize=None)
+def _kernel(radius) -> np.ndarray:
+    """ :return: the kernel averaging ``GraphAnalyzer.disk(radius)``. """
+    kernel = GraphAnalyzer.disk(radius).astype(np.float64)
+    kernel /= kernel.sum()  # normalize so it's an average
+    kernel.flags.writeable = False
+    return kernel
+
+
+def _reflect(indices: np.ndarray, n: int) -> np.ndarray:
+    """
+    :return: ``indices`` mirrored into ``range(n)``, the edge included, as
+     the ``'symm'`` boundary of ``scipy.signal.convolve2d`` does.
+    """
+    indices = indices % (2 * n)
+    return np.where(indices < n, indices, 2 * n - 1 - indices)
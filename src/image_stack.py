@@ -0,0 +1,380 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from src.frame_stats import FrameStats, file_key, read_page_counts
+from src.pyramid import Pyramid
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff")
+# files that often have several pages, counted before they are decoded
+TIFF_EXTENSIONS = (".tif", ".tiff")
+
+
+def user_cache_dir() -> str:
+    """
+    :return: the folder where this user's caches are kept on disk, unlike
+     the temporary folder, which may be in memory.
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or tempfile.gettempdir()
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or \
+               os.path.expanduser("~/.cache")
+    return os.path.join(base, "cropps-pattern")
+
+
+def list_images(folder: str) -> List[str]:
+    """
+    :return: the paths of the images in ``folder``, oldest first, in the
+     order ``ImageViewer`` opens them.
+    """
+    return sorted([os.path.join(folder, f) for f in os.listdir(folder)
+                   if f.lower().endswith(IMAGE_EXTENSIONS)],
+                  key=os.path.getmtime)
+
+
+def list_pages(paths: Sequence[str], counts: Optional[dict] = None) \
+        -> List[Tuple[str, int]]:
+    """
+    :param counts: the number of pages of files already known, by
+     ``file_key``.
+    :return: a ``(path, page)`` pair for each frame of ``paths``, where
+     multi-page files, e.g. TIFF stacks, have one frame per page. Only reads
+     the headers of the files not in ``counts``.
+    """
+    pages = []
+    for path in paths:
+        count = counts.get(file_key(path)) if counts else None
+        if count is None:
+            with Image.open(path) as image:
+                count = getattr(image, "n_frames", 1)
+        pages.extend((path, page) for page in range(count))
+    return pages
+
+
+class ImageStack:
+    """
+    The frames of a folder or of a multi-page file, decoded only when first
+    needed, so that opening a folder takes the same time whatever its size.
+
+    Each frame is decoded once, and written at full resolution in its own
+    dtype to a memory-mapped cache file. Reading a frame
+    then returns a read-only view of that file, without decoding or copying
+    it, and memory is managed by the page cache of the operating system.
+    Frames of another shape or dtype than the first one are kept in memory
+    instead.
+
+    Once a frame is shown, ``prefetch`` decodes its neighbors on a background
+    thread. When it has nothing else to do, that thread decodes the rest of
+    the stack. Statistics of each frame are computed as it is decoded, and
+    saved to ``stats_file`` when the thread is idle, so that they are known
+    at once the next time the stack is opened.
+
+    Files are not read when the stack is opened: those whose number of
+    pages is not in ``stats_file`` are assumed to have a single page. The
+    background thread first counts the pages of TIFF files, and other files
+    are counted when decoded. Frames are numbered again each time a file
+    turns out to have more pages, see ``on_pages``.
+
+    :ivar pages: the file and page of each frame, see ``list_pages``
+    :ivar stats: the statistics of each frame
+    :ivar stats_file: where ``stats`` are saved, see
+     ``src.frame_stats.sidecar_path``
+    :ivar radius: how many frames on each side of the current one are
+     prefetched
+    :ivar pyramid: shrunk renditions of the frames, to show them
+    :ivar on_max_brightness: called from the background thread with the new
+     ``max_brightness`` each time it increases
+    :ivar on_pages: called with the new index of each former frame each time
+     frames are added, from the thread that counted their pages
+    """
+
+    def __init__(self, paths: Sequence[str], radius: int = 2,
+                 on_max_brightness: Optional[Callable[[float], None]] = None,
+                 cache_dir: Optional[str] = None,
+                 stats_file: Optional[str] = None,
+                 on_pages: Optional[Callable[[np.ndarray], None]] = None):
+        """ :param cache_dir: where the cache file is made, a temporary
+         folder by default. Decoded frames are written to it, so it should
+         be on disk, e.g. ``user_cache_dir()``. """
+        known = read_page_counts(stats_file)
+        self._paths = list(paths)
+        self._keys = {path: file_key(path) for path in self._paths}
+        self._counts = {path: known.get(self._keys[path], 1)
+                        for path in self._paths}
+        self._uncounted = {path for path in self._paths
+                           if self._keys[path] not in known}
+        self._list_pages()
+        self.stats = FrameStats([self._keys[path] + (page,)
+                                 for path, page in self.pages])
+        self.stats_file = stats_file
+        if stats_file and os.path.exists(stats_file):
+            try:
+                print(f"Read the statistics of {self.stats.load(stats_file)} "
+                      f"of {len(self)} frames from {stats_file}")
+            except (OSError, KeyError, ValueError) as e:
+                print(f"Could not read {stats_file}: {e}")
+        self.radius = radius
+        self.pyramid = Pyramid(self.__getitem__)
+        self.on_max_brightness = on_max_brightness
+        self.on_pages = on_pages
+        if cache_dir:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+            except OSError as e:
+                print(f"Could not make {cache_dir}, caching frames in the "
+                      f"temporary folder instead: {e}")
+                cache_dir = None
+        self._dir = tempfile.mkdtemp(prefix="stack-", dir=cache_dir)
+        self._frames: Optional[np.memmap] = None  # made by the first frame
+        self._retired: List[np.memmap] = []  # before frames were added
+        self._others: Dict[int, np.ndarray] = {}
+        self._decoded = np.zeros(len(self.pages), dtype=bool)
+        # by file and page, since frames may be numbered again meanwhile
+        self._loading = set()
+        self._failed = set()  # not retried in the background
+        self._pending: List[int] = []
+        self._undecoded = 0  # frames before this one have been decoded
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __len__(self): return len(self.pages)
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        """ :return: a read-only view of frame ``i``, decoding it if needed. """
+        with self._cond:
+            page = self.pages[i]
+            while page in self._loading: self._cond.wait()
+            i = self._index[page]
+            if not self._decoded[i]: self._loading.add(page)
+            else: return self._view(i)
+        try:
+            self._load(page)
+        finally:
+            with self._cond:
+                self._loading.discard(page)
+                self._cond.notify_all()
+        with self._cond: return self._view(self._index[page])
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        # pages may be added after the current frame as it is decoded
+        i = 0
+        while i < len(self):
+            yield self[i]
+            i += 1
+
+    def __contains__(self, i: int) -> bool:
+        """ :return: ``True`` iff frame ``i`` has been decoded. """
+        with self._cond: return bool(self._decoded[i])
+
+    @property
+    def max_brightness(self) -> float:
+        """ The brightest pixel of the frames known so far, at least 1. """
+        with self._cond: return self.stats.max_brightness
+
+    def array(self) -> np.ndarray:
+        """
+        Decodes every frame.
+
+        :return: a read-only ``(frames, ...)`` view of the cache file.
+        :raise ValueError: if frames are not all in the cache file, e.g.
+         because they differ in shape or dtype.
+        """
+        self.count_pages()
+        for _ in self: pass
+        with self._cond:
+            if self._others or self._frames is None:
+                raise ValueError("the frames are not all in the cache file")
+            data = np.asarray(self._frames).view()
+        data.flags.writeable = False
+        return data
+
+    def prefetch(self, i: int):
+        """
+        Decodes the neighbors of frame ``i`` in the background, closest
+        first. Replaces the previous request.
+        """
+        order = sorted(range(max(i - self.radius, 0),
+                             min(i + self.radius + 1, len(self))),
+                       key=lambda j: abs(j - i))
+        with self._cond:
+            self._pending = order
+            self._cond.notify_all()
+
+    def count_pages(self) -> int:
+        """
+        Reads the number of pages of the TIFF files not counted yet, and adds
+        their frames, see ``on_pages``. The background thread does so before
+        decoding the rest of the stack; call it to know every frame at once.
+        Other files are assumed to have a single page until decoded.
+
+        :return: the number of frames.
+        """
+        with self._cond:
+            paths = [path for path in self._paths if path in self._uncounted
+                     and path.lower().endswith(TIFF_EXTENSIONS)]
+        counts = {}
+        for path in paths:
+            if self._closed: break
+            try:
+                with Image.open(path) as image:
+                    counts[path] = getattr(image, "n_frames", 1)
+            except OSError as e:
+                print(f"Could not read {path}: {e}")
+                counts[path] = 1
+        self._set_counts(counts)
+        return len(self)
+
+    def close(self):
+        """ Stops the background thread and deletes the cache file. """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._save_stats()
+        self.pyramid.clear()
+        with self._cond:
+            self._frames = None
+            self._retired.clear()
+            self._others.clear()
+            self._decoded[:] = False
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _view(self, i):
+        data = self._others.get(i)
+        # a plain array viewing the cache file, not a memmap
+        data = np.asarray(self._frames[i] if data is None else data).view()
+        data.flags.writeable = False
+        return data
+
+    def _list_pages(self):
+        self.pages = [(path, page) for path in self._paths
+                      for page in range(self._counts[path])]
+        self._index = {page: i for i, page in enumerate(self.pages)}
+
+    def _set_counts(self, counts: Dict[str, int]):
+        """
+        Records the number of pages of some files, and numbers the frames
+        again if there are more than assumed.
+        """
+        with self._cond:
+            self._uncounted.difference_update(counts)
+            counts = {path: count for path, count in counts.items()
+                      if count > self._counts[path]}
+            if not counts or self._closed: return
+            old = self.pages
+            self._counts.update(counts)
+            self._list_pages()
+            index = np.array([self._index[page] for page in old], dtype=int)
+
+            decoded = np.zeros(len(self), dtype=bool)
+            decoded[index] = self._decoded
+            if self._frames is not None:
+                frames = np.memmap(
+                    os.path.join(self._dir, f"frames-{len(self)}.raw"),
+                    self._frames.dtype, 'w+',
+                    shape=(len(self),) + self._frames.shape[1:])
+                in_file = self._decoded.copy()
+                in_file[list(self._others)] = False
+                frames[index[in_file]] = self._frames[in_file]
+                # views of the old file may still be in use
+                self._retired.append(self._frames)
+                self._frames = frames
+            self._decoded = decoded
+            self._others = {int(index[i]): data
+                            for i, data in self._others.items()}
+            self._pending = [int(index[i]) for i in self._pending]
+            self._undecoded = 0
+            self.stats = self.stats.reindex([self._keys[path] + (page,)
+                                             for path, page in self.pages])
+            self.pyramid.clear()
+            self._cond.notify_all()
+        print(f"Found {len(self) - len(old)} more frames in "
+              f"{len(counts)} files")
+        if self.on_pages: self.on_pages(index)
+
+    def _load(self, page: Tuple[str, int]):
+        path, number = page
+        with self._cond:
+            uncounted = path in self._uncounted
+            known = self._index[page] in self.stats
+        with Image.open(path) as image:
+            count = getattr(image, "n_frames", 1) if uncounted else None
+            image.seek(number)
+            data = np.ascontiguousarray(image)
+        stats = None if known else FrameStats.compute(data)
+        if count is not None: self._set_counts({path: count})
+
+        with self._cond:
+            if self._closed: raise OSError("the stack is closed")
+            i = self._index[page]
+            if self._frames is None:
+                self._frames = np.memmap(
+                    os.path.join(self._dir, f"frames-{len(self)}.raw"),
+                    data.dtype, 'w+', shape=(len(self),) + data.shape)
+            if self._frames.shape[1:] == data.shape and \
+                    self._frames.dtype == data.dtype:
+                self._frames[i] = data
+            else:
+                self._others[i] = data
+            increased = stats is not None and \
+                        stats[1] > self.stats.max_brightness
+            if stats is not None: self.stats.set(i, stats)
+            self._decoded[i] = True
+        if increased and self.on_max_brightness:
+            self.on_max_brightness(self.max_brightness)
+
+    def _save_stats(self):
+        with self._cond:
+            if not self.stats_file or not self.stats.dirty: return
+            try:
+                self.stats.save(self.stats_file)
+            except OSError as e:
+                print(f"Could not save {self.stats_file}: {e}")
+                self.stats_file = None
+
+    def _done(self, i):
+        return self._decoded[i] or self.pages[i] in self._failed
+
+    def _run(self):
+        self.count_pages()
+        while True:
+            with self._cond:
+                while not self._closed:
+                    self._pending = [j for j in self._pending
+                                     if not self._done(j)]
+                    while self._undecoded < len(self) and \
+                            self._done(self._undecoded):
+                        self._undecoded += 1
+                    todo = [j for j in self._pending + [self._undecoded]
+                            if j < len(self) and
+                            self.pages[j] not in self._loading]
+                    if todo: break
+                    if self.stats.dirty and self.stats_file:
+                        self._save_stats()
+                        continue
+                    self._cond.wait()
+                if self._closed: return
+                page = self.pages[todo[0]]
+                self._loading.add(page)
+
+            try:
+                self._load(page)
+            except OSError as e:
+                if self._closed: return
+                print(f"Could not decode {page[0]}, page {page[1]}: {e}")
+                with self._cond: self._failed.add(page)
+            finally:
+                with self._cond:
+                    self._loading.discard(page)
+                    self._cond.notify_all()
@@ -7,15 +7,15 @@ from typing import List
 
 class LineTracer(ABC):
     @abstractmethod
-    def trace(self, *args) -> List[Point]: pass
+    def trace(self, *args, **kwargs) -> List[Point]: pass
 
 
 class NotALineTracer(LineTracer):
-    def trace(self, *args): raise NotImplementedError()
+    def trace(self, *args, **kwargs): raise NotImplementedError()
 
 
 class StraightLineTracer(LineTracer):
-    def trace(self, orig, dest, *args):
+    def trace(self, orig, dest, *args, **kwargs):
         """
         Implemented with Bresenham's line algorithm.
         """
@@ -38,7 +38,7 @@ class StraightLineTracer(LineTracer):
 
 
 class FreehandLineTracer(LineTracer):
-    def trace(self, _, __, ___, mouse_coor, *args):
+    def trace(self, _, __, ___, mouse_coor, *args, **kwargs):
         assert isinstance(mouse_coor, Queue)
 
         points = []
@@ -1,5 +1,6 @@
 from enum import auto, Enum
 from src.line_tracer import *
+from src.search_engines import AStarSearchEngine, BidirectionalSearchEngine
 from src.searcher import Searcher
 
 
@@ -8,10 +9,15 @@ class LineTracerTypes(Enum):
     LINE = auto()
     FREE = auto()
     BRIGHTEST = auto()
+    BRIGHTEST_ASTAR = auto()
+    BRIGHTEST_BIDIRECTIONAL = auto()
 
 
 ltt = LineTracerTypes
 
+# the types traced by a `Searcher`
+BRIGHTEST_TYPES = ltt.BRIGHTEST, ltt.BRIGHTEST_ASTAR, ltt.BRIGHTEST_BIDIRECTIONAL
+
 
 class LineTracers:
     def __init__(self, initial: ltt = ltt.BRIGHTEST):
@@ -21,6 +27,8 @@ class LineTracers:
             ltt.LINE: StraightLineTracer(),
             ltt.FREE: FreehandLineTracer(),
             ltt.BRIGHTEST: Searcher(),
+            ltt.BRIGHTEST_ASTAR: Searcher(AStarSearchEngine()),
+            ltt.BRIGHTEST_BIDIRECTIONAL: Searcher(BidirectionalSearchEngine()),
         }
 
     @property
@@ -30,6 +38,9 @@ class LineTracers:
     def get_line_tracer(self) -> LineTracer:
         return self._types.get(self._curr_type)
 
+    def get(self, value: LineTracerTypes) -> LineTracer:
+        return self._types.get(value)
+
     def set_curr_type(self, value: LineTracerTypes):
         if not isinstance(value, LineTracerTypes): raise ValueError()
         print(f"Switching from {self._curr_type.name} to {value.name}")
@@ -0,0 +1,120 @@
+import numpy as np
+import threading
+from lib.point import Point
+from src.cost_map import CostMaps
+from src.search_engines import CSGraphSearchEngine, SearchToken, to_index
+from typing import Hashable, Optional
+
+
+class Livewire:
+    """
+    Previews the brightest path from the last waypoint to the cursor.
+
+    Once a waypoint is placed, ``start`` grows the whole shortest-path tree
+    from it, over a box of ``radius`` pixels around it. This is slow and is
+    meant to run in the background, e.g. with ``grow`` in a worker process
+    and then ``use``. ``path_to`` then only follows the
+    predecessors from the cursor back to the waypoint, so each preview takes
+    time proportional to the length of the path, whatever the frame size.
+
+    :ivar radius: how far from the waypoint paths are previewed, in pixels
+    :ivar engine: grows the shortest-path tree
+    :ivar cost_maps: the weight images of recently previewed frames
+    """
+
+    def __init__(self, radius: int = 512):
+        self.radius = radius
+        self.engine = CSGraphSearchEngine()
+        self.cost_maps = CostMaps()
+        self._lock = threading.Lock()
+        # (waypoint, top left corner, box height, box width, predecessors)
+        self._tree = None
+
+    @property
+    def ready(self) -> bool: return self._tree is not None
+
+    def start(self, data: np.ndarray, orig: Point,
+              key: Optional[Hashable] = None,
+              token: Optional[SearchToken] = None) -> bool:
+        """
+        Grows the shortest-path tree from ``orig``, replacing the previous
+        one once done.
+
+        :param data: the smoothed frame.
+        :param key: see ``CostMaps.get``.
+        :param token: cancels growing the tree.
+        :return: ``True`` iff the tree is ready.
+        """
+        return self.use(self.grow(data, orig, key, token), token)
+
+    def grow(self, data: np.ndarray, orig: Point,
+             key: Optional[Hashable] = None,
+             token: Optional[SearchToken] = None) -> Optional[tuple]:
+        """
+        Grows the shortest-path tree from ``orig``, without previewing it, so
+        that it can be grown in another process. Parameters are the same as
+        ``start``.
+
+        :return: the tree, to pass to ``use``, or ``None`` if canceled.
+        """
+        weights = self.cost_maps.get(data, key)
+        height, width = weights.shape
+        x0, y0 = max(orig.x - self.radius, 0), max(orig.y - self.radius, 0)
+        x1 = min(orig.x + self.radius + 1, width)
+        y1 = min(orig.y + self.radius + 1, height)
+        corner = Point(x0, y0)
+
+        predecessors = self.engine.tree(weights[y0:y1, x0:x1],
+                                        to_index(orig - corner, y1 - y0),
+                                        token)
+        if predecessors is None: return None
+        return orig, corner, y1 - y0, x1 - x0, predecessors
+
+    def use(self, tree: Optional[tuple],
+            token: Optional[SearchToken] = None) -> bool:
+        """
+        Previews paths in ``tree``, as returned by ``grow``, replacing the
+        previous tree, unless ``token`` was canceled.
+
+        :return: ``True`` iff the tree is ready.
+        """
+        with self._lock:
+            if tree is None or token and token.canceled: return False
+            self._tree = tree
+        return True
+
+    def stop(self):
+        """
+        Discards the tree, so that nothing is previewed. A tree still being
+        grown is discarded too once it is done if its token is canceled.
+        """
+        with self._lock: self._tree = None
+
+    def path_to(self, dest: Point) -> Optional[np.ndarray]:
+        """
+        :return: the ``x`` and ``y`` coordinates of each pixel of the
+         brightest path from ``dest`` back to, but excluding, the waypoint,
+         or ``None`` if there is no tree or ``dest`` is outside of it. Not
+         converted to ``Points``, since allocating thousands of objects per
+         preview triggers garbage collection pauses of over 10 ms.
+        """
+        with self._lock: tree = self._tree
+        if tree is None: return None
+        orig, corner, height, width, predecessors = tree
+
+        local = dest - corner
+        if local.out_of_bounds(Point(width, height)): return None
+        root = to_index(orig - corner, height)
+
+        # a list of millions of predecessors would make garbage collection
+        # pauses longer than a preview, so look them up one by one
+        item = predecessors.item
+        path = []
+        curr = to_index(local, height)
+        while curr != root:
+            path.append(curr)
+            curr = item(curr)
+            if curr == -1: return None
+        if not path: return None
+        x, y = np.divmod(np.array(path), height)
+        return np.stack([x + corner.x, y + corner.y], axis=1)
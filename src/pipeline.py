@@ -0,0 +1,243 @@
+import csv
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+from src.graph_analyzer import GraphAnalyzer
+from src.image_stack import ImageStack, list_images
+
+# the file types a kymograph can be saved as, for file dialogs
+KYMOGRAPH_TYPES = (("TIFF files", "*.tif"), ("NumPy files", "*.npy"))
+
+
+def save_line(file_path: str, line: Sequence[Sequence[int]]):
+    """
+    Saves an annotation as one ``x, y`` pair per row, starting from the
+    origin of the line.
+    """
+    with open(file_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(("x", "y"))
+        writer.writerows((int(p[0]), int(p[1])) for p in line)
+
+
+def load_line(file_path: str) -> List[Tuple[int, int]]:
+    """ :return: the annotation saved by ``save_line``. """
+    with open(file_path, newline='') as file:
+        rows = csv.reader(file)
+        next(rows)
+        return [(int(x), int(y)) for x, y in rows]
+
+
+def save_csv(file_path: str, res: Iterable[Tuple[int, int]]):
+    """ Saves the wavefront returned by ``GraphAnalyzer.max_sum``. """
+    with open(file_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(("Image number", "Number of pixels from origin"))
+        writer.writerows(res)
+
+
+def brightness_values(data: np.ndarray, line: Sequence[Sequence[int]],
+                      line_thickness: int) -> np.ndarray:
+    """
+    :param line: the pixels of the annotation, starting from its origin.
+    :param line_thickness: the radius of the disk averaged around each
+     pixel, see ``GraphAnalyzer.take_avg``. If ``0``, the raw pixels are
+     read, as exported by the app.
+    :return: the brightness of ``data`` along ``line``.
+    """
+    data = np.mean(data, axis=2) if len(data.shape) == 3 else data
+    return GraphAnalyzer.sample_avg(data, line_thickness, line)
+
+
+def stack_profiles(frames: Iterable[np.ndarray],
+                   line: Sequence[Sequence[int]],
+                   line_thickness: int) -> np.ndarray:
+    """
+    :param frames: an ``ImageStack``, a ``(frames, ...)`` array, or any
+     frames.
+    :param line_thickness: see ``brightness_values``.
+    :return: the ``brightness_values`` of each frame, as a
+     ``(frames, len(line))`` kymograph. The frames of a stack are sampled all
+     at once from its cache file.
+    """
+    if isinstance(frames, ImageStack):
+        try:
+            frames = frames.array()
+        except ValueError:
+            pass
+    if isinstance(frames, np.ndarray):
+        return GraphAnalyzer.sample_stack(frames, line_thickness, line)
+    profiles = [brightness_values(data, line, line_thickness)
+                for data in frames]
+    return np.array(profiles) if profiles else np.empty((0, len(line)))
+
+
+def wavefront(frames: Iterable[np.ndarray], line: Sequence[Sequence[int]],
+              analyzer: GraphAnalyzer, line_thickness: int,
+              weight_factor: float) \
+        -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """
+    Finds where the wavefront is along ``line`` in each frame, with the same
+    line on every frame so that all profiles have the same length.
+
+    :return: the brightness along ``line`` in each frame, see
+     ``stack_profiles``, and the result of ``GraphAnalyzer.max_sum``.
+    """
+    profiles = stack_profiles(frames, line, line_thickness)
+    res = analyzer.max_sum(analyzer.moving_average(profiles), weight_factor)
+    return profiles, res
+
+
+def save_profiles(file_path: str, profiles: Sequence[Sequence[float]]):
+    """
+    Saves the brightness along the line in each frame, one row per frame,
+    for other tools to read. Rows are as long as their profile.
+    """
+    length = max((len(values) for values in profiles), default=0)
+    with open(file_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(("Image number",) + tuple(range(length)))
+        writer.writerows((i,) + tuple(np.asarray(values).tolist())
+                         for i, values in enumerate(profiles, 1))
+
+
+def save_graphs(file_path: str, profiles: Sequence[Sequence[float]]):
+    """
+    Saves the brightness along the line in each frame as pages of a PDF.
+    """
+    with PdfPages(file_path) as pdf:
+        _save_profile_pages(pdf, profiles, range(1, len(profiles) + 1))
+
+
+def save_plots(file_path: str, profiles: Sequence[Sequence[float]],
+               res: Sequence[Tuple[int, int]]):
+    """
+    Saves the brightness along the line in each frame, with the wavefront
+    marked, and then where the wavefront is in each frame, as pages of a PDF.
+    """
+    with PdfPages(file_path) as pdf:
+        numbers, marks = zip(*res) if res else ((), ())
+        _save_profile_pages(pdf, profiles, numbers, marks)
+
+        fig = Figure()
+        ax = fig.add_subplot()
+        ax.set_xlabel('Image number')
+        ax.set_ylabel('Number of pixels from origin')
+        ax.set_title('Wavefront')
+        ax.plot(numbers, marks, marker='.')
+        pdf.savefig(fig)
+
+
+def _save_profile_pages(pdf: PdfPages, profiles: Sequence[Sequence[float]],
+                        numbers: Sequence[int],
+                        marks: Optional[Sequence[int]] = None):
+    """
+    Saves a page for each of ``profiles`` to ``pdf``. All pages are drawn
+    with the same figure, artists and limits, changing only their data, so
+    that they can be compared and their ticks are laid out once.
+
+    :param numbers: the image number of each profile.
+    :param marks: where to mark each profile, e.g. its wavefront.
+    """
+    fig = Figure()
+    ax = fig.add_subplot()
+    ax.set_xlabel('Number of pixels from origin')
+    ax.set_ylabel('Brightness')
+    line, = ax.plot([], [])
+    mark = ax.axvline(0, color='red', visible=marks is not None)
+
+    values = [np.asarray(values) for values in profiles if len(values)]
+    if values:
+        x = [0, max(len(v) for v in values) - 1] + list(marks or [])
+        y = [min(np.nanmin(v) for v in values),
+             max(np.nanmax(v) for v in values)]
+        ax.set_xlim(*_with_margin(min(x), max(x)))
+        ax.set_ylim(*_with_margin(*y))
+
+    for j, (i, values) in enumerate(zip(numbers, profiles)):
+        ax.set_title(f'Brightness Along Selected Line in Image {i}')
+        line.set_data(np.arange(len(values)), values)
+        if marks is not None: mark.set_xdata([marks[j], marks[j]])
+        pdf.savefig(fig)
+
+
+def _with_margin(low: float, high: float, margin: float = .05) \
+        -> Tuple[float, float]:
+    """ :return: ``low`` and ``high`` moved apart, as matplotlib does. """
+    pad = (high - low) * margin or .5
+    return low - pad, high + pad
+
+
+def plot_kymograph(ax, kymograph: np.ndarray,
+                   res: Optional[Sequence[Tuple[int, int]]] = None):
+    """
+    Draws the brightness along the line in every frame on ``ax`` as one
+    image, one row per frame from the top.
+
+    :param kymograph: see ``stack_profiles``.
+    :param res: the wavefront to mark, see ``GraphAnalyzer.max_sum``.
+    """
+    frames, length = kymograph.shape
+    # rows are centered on their image number
+    ax.imshow(kymograph, aspect='auto', interpolation='nearest',
+              extent=(-.5, length - .5, frames + .5, .5))
+    ax.set_xlabel('Number of pixels from origin')
+    ax.set_ylabel('Image number')
+    ax.set_title('Kymograph')
+    if res:
+        i, x = zip(*res)
+        ax.plot(x, i, color='red', marker='.', markersize=2, linewidth=0)
+        ax.set_xlim(-.5, length - .5)
+        ax.set_ylim(frames + .5, .5)
+
+
+def save_kymograph(file_path: str, kymograph: np.ndarray):
+    """
+    Saves ``kymograph`` as a ``.npy`` file in its own dtype, or else as a
+    32-bit float TIFF image.
+    """
+    if file_path.lower().endswith(".npy"):
+        np.save(file_path, kymograph)
+    else:
+        Image.fromarray(np.asarray(kymograph, dtype=np.float32)).save(
+            file_path)
+
+
+def process_folder(folder: str, line: Sequence[Sequence[int]],
+                   output: str, mode: int = 0, window_size: int = 20,
+                   sigma: float = 5, weight_factor: float = 0.,
+                   line_thickness: int = 1,
+                   stats_file: Optional[str] = None) -> str:
+    """
+    Runs the whole pipeline on one experiment: opens every image in
+    ``folder``, finds the wavefront along ``line`` and saves it as
+    ``<output>.csv``, and its plots as ``<output>.pdf``. Does not need a
+    display.
+
+    :param mode: see ``GraphAnalyzer.moving_average``.
+    :param stats_file: where the statistics of the frames are read from and
+     saved, see ``ImageStack``. Not saved by default.
+    :return: the path of the CSV file.
+    """
+    paths = list_images(folder)
+    if not paths: raise ValueError(f"{folder} does not contain any images")
+    stack = ImageStack(paths, stats_file=stats_file)
+    print(f"Processing {stack.count_pages()} images in {folder}")
+
+    analyzer = GraphAnalyzer()
+    analyzer.mode, analyzer.window_size, analyzer.sigma = \
+        mode, window_size, sigma
+    try:
+        profiles, res = wavefront(stack, line, analyzer, line_thickness,
+                                  weight_factor)
+    finally:
+        stack.close()
+
+    save_csv(output + ".csv", res)
+    save_plots(output + ".pdf", profiles, res)
+    print(f"Saved the wavefront of {folder} to {output}.csv")
+    return output + ".csv"
@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence, Tuple
+
+import numpy as np
+
+# frames are shown at the largest level of the pyramid that fits in this size
+DISPLAY_SIZE = (800, 600)
+
+
+def display_level(shape, size=DISPLAY_SIZE) -> int:
+    """
+    :param shape: the shape of a frame at full resolution.
+    :return: the smallest ``level`` such that the frame shrunk ``2 ** level``
+     times fits in ``size``.
+    """
+    height, width = shape[:2]
+    level = 0
+    while (-(-width // 2 ** level) > size[0] or
+           -(-height // 2 ** level) > size[1]): level += 1
+    return level
+
+
+def downsample(data: np.ndarray) -> np.ndarray:
+    """
+    :return: ``data`` shrunk twice, where each pixel is the mean of a 2x2
+     block. The last row and column are repeated if the size is odd.
+     Integer frames keep their dtype, with means rounded half up, so that
+     they can be colored through a table.
+    """
+    dtype = data.dtype
+    integer = np.issubdtype(dtype, np.integer)
+    data = data.astype(np.int64 if integer else np.float32)
+    height, width = data.shape[:2]
+    if height % 2 or width % 2:
+        pad = ((0, height % 2), (0, width % 2)) + ((0, 0),) * (data.ndim - 2)
+        data = np.pad(data, pad, mode='edge')
+    total = (data[::2, ::2] + data[1::2, ::2] +
+             data[::2, 1::2] + data[1::2, 1::2])
+    return ((total + 2) // 4).astype(dtype) if integer else total / 4
+
+
+@dataclass(frozen=True)
+class DisplayMap:
+    """
+    Maps between the pixels of a frame at full resolution, in which
+    everything is analyzed, and the pixels of a level of its pyramid, which
+    is shown.
+
+    Pixel ``u`` of level ``level`` covers pixels ``u * 2 ** level`` to
+    ``(u + 1) * 2 ** level - 1`` at full resolution. Going the other way, a
+    pixel at full resolution is drawn with sub-pixel precision using the
+    fixed-point coordinates of OpenCV, so no rounding is involved either way.
+
+    :ivar level: the level of the pyramid that is shown
+    :ivar shape: the shape of the frame at full resolution
+    """
+    level: int
+    shape: Tuple[int, ...]
+
+    @property
+    def factor(self) -> int: return 2 ** self.level
+
+    @property
+    def shift(self) -> int:
+        """ The number of fractional bits of the points from ``fixed``. """
+        return self.level + 1
+
+    def to_full(self, u: int, v: int) -> Optional[Tuple[int, int]]:
+        """
+        :return: the full-resolution pixel at the center of the shown pixel
+         ``(u, v)``, or ``None`` if it is outside of the frame.
+        """
+        height, width = self.shape[:2]
+        x, y = u * self.factor, v * self.factor
+        if x < 0 or y < 0 or x >= width or y >= height: return None
+        # the last pixels may cover less than `factor` pixels
+        return (min(x + self.factor // 2, width - 1),
+                min(y + self.factor // 2, height - 1))
+
+    def fixed(self, points: Sequence[Sequence[int]]) -> np.ndarray:
+        """
+        :param points: full-resolution ``x`` and ``y`` coordinates.
+        :return: the centers of ``points`` on the shown level, as
+         fixed-point coordinates for OpenCV with ``shift`` fractional bits.
+        """
+        return (np.asarray(points, dtype=np.int32).reshape(-1, 2) * 2 + 1 -
+                self.factor)
+
+    def fixed_point(self, point: Sequence[int]) -> Tuple[int, int]:
+        """ :return: ``fixed`` of a single point, as OpenCV takes it. """
+        x, y = self.fixed(point)[0]
+        return int(x), int(y)
+
+    def fixed_length(self, length: int) -> int:
+        """ :return: ``length`` shown pixels, as a fixed-point length. """
+        return length << self.shift
+
+
+class Pyramid:
+    """
+    Shrunk renditions of frames, each level half the size of the previous
+    one, built only when first shown from the level below it. The most
+    recently used ones are kept.
+
+    :ivar frames: returns a frame at full resolution, which is level ``0``
+    :ivar max_size: maximum number of renditions kept
+    """
+
+    def __init__(self, frames: Callable[[int], np.ndarray],
+                 max_size: int = 32):
+        self.frames = frames
+        self.max_size = max_size
+        self._cache: OrderedDict[Tuple[int, int], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, i: int, level: int) -> np.ndarray:
+        """ :return: a read-only rendition of frame ``i`` at ``level``. """
+        if level == 0: return self.frames(i)
+        with self._lock:
+            if (i, level) in self._cache:
+                self._cache.move_to_end((i, level))
+                return self._cache[i, level]
+
+        data = downsample(self.get(i, level - 1))
+        data.flags.writeable = False
+        with self._lock:
+            self._cache[i, level] = data
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return data
+
+    def show(self, i: int, size=DISPLAY_SIZE) -> Tuple[np.ndarray, DisplayMap]:
+        """
+        :return: the largest rendition of frame ``i`` that fits in ``size``,
+         and how to map it to full resolution.
+        """
+        shape = self.frames(i).shape
+        level = display_level(shape, size)
+        return self.get(i, level), DisplayMap(level, shape)
+
+    def clear(self):
+        with self._lock: self._cache.clear()
@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+import numpy as np
+
+from src.colorizer import Colorizer
+
+
+class Renderer:
+    """
+    Draws the shown frame in two layers, so that only the layer that
+    changed is drawn again:
+
+    - the base layer, the frame normalized and colored, kept for the most
+      recently used frames and brightnesses;
+    - the overlay, the annotations, drawn on their own transparent layer,
+      kept for the last annotations.
+
+    Both are composited only when either changes, by copying the pixels of
+    the overlay onto the base layer.
+
+    :ivar colorize: colors the frames
+    :ivar max_size: maximum number of base layers kept
+    """
+
+    def __init__(self, colormap, max_size: int = 8):
+        """ :param colormap: a ``matplotlib`` colormap. """
+        self.colorize = Colorizer(colormap)
+        self.max_size = max_size
+        self._bases: OrderedDict[Hashable, np.ndarray] = OrderedDict()
+        # (key, flat indices of the drawn pixels, their colors)
+        self._overlay: Optional[Tuple[Hashable, np.ndarray, np.ndarray]] = None
+        # (base key, overlay key, composited image)
+        self._composite = None
+        self._lock = threading.Lock()
+
+    def base(self, key: Hashable, data: np.ndarray, max_brightness: float,
+             brightness: float) -> np.ndarray:
+        """
+        :param key: identifies ``data``, e.g. the index of the frame.
+        :param data: the frame as shown.
+        :return: ``data`` normalized by ``max_brightness``, times
+         ``brightness``, and colored, as an RGB image.
+        """
+        key = key, max_brightness, brightness
+        with self._lock:
+            if key in self._bases:
+                self._bases.move_to_end(key)
+                return self._bases[key]
+
+        data = self.colorize(data, max_brightness, brightness)
+        data.flags.writeable = False
+
+        with self._lock:
+            self._bases[key] = data
+            while len(self._bases) > self.max_size:
+                self._bases.popitem(last=False)
+        return data
+
+    def overlay(self, key: Hashable, shape,
+                draw: Callable[[np.ndarray], None]) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param key: identifies the annotations, and how they are drawn.
+        :param shape: the shape of the shown frame.
+        :param draw: draws the annotations on an RGBA image, in colors whose
+         alpha is 255.
+        :return: the flat indices of the pixels drawn, and their colors.
+        """
+        with self._lock:
+            if self._overlay and self._overlay[0] == key:
+                return self._overlay[1:]
+
+        layer = np.zeros(shape[:2] + (4,), dtype=np.uint8)
+        draw(layer)
+        layer = layer.reshape(-1, 4)
+        indices = np.flatnonzero(layer[:, 3])
+        colors = layer[indices, :3]
+
+        with self._lock: self._overlay = key, indices, colors
+        return indices, colors
+
+    def render(self, base_key: Hashable, data: np.ndarray,
+               max_brightness: float, brightness: float,
+               overlay_key: Hashable, draw: Callable[[np.ndarray], None]) \
+            -> np.ndarray:
+        """
+        :return: the frame with its annotations, see ``base`` and
+         ``overlay``. Read-only, and drawn again only if either changed.
+        """
+        key = (base_key, max_brightness, brightness), overlay_key
+        with self._lock:
+            if self._composite and self._composite[0] == key:
+                return self._composite[1]
+
+        base = self.base(base_key, data, max_brightness, brightness)
+        indices, colors = self.overlay(overlay_key, base.shape, draw)
+        res = base.copy()
+        res.reshape(-1, 3)[indices] = colors
+        res.flags.writeable = False
+
+        with self._lock: self._composite = key, res
+        return res
+
+    def clear(self):
+        with self._lock:
+            self._bases.clear()
+            self._overlay = self._composite = None
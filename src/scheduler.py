@@ -0,0 +1,380 @@
+import atexit
+import heapq
+import itertools
+import multiprocessing
+import numpy as np
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from lib.point import Point
+from multiprocessing.shared_memory import SharedMemory
+from src.search_engines import SearchToken
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+# (shared memory name, shape, dtype, name of the shared weights)
+FrameRef = Tuple[str, Tuple[int, ...], str, str]
+
+
+@dataclass(order=True)
+class SearchRequest:
+    """
+    A segment waiting to be traced. Requests sort newest first.
+
+    :ivar tracer_type: the ``LineTracerTypes`` of the tracer to run
+    :ivar points: the origin and destination, or the waypoints of a polyline
+    :ivar polyline: ``True`` iff every segment of ``points`` is traced
+    :ivar corridor: the lines and width passed to ``corridor_mask``, if the
+     paths must stay close to them
+    :ivar group: requests with the same group supersede each other
+    :ivar callback: receives the traced line (or lines), or ``None``
+    :ivar radius: if not ``0``, the livewire tree of this radius is grown
+     from ``points[0]`` instead, see ``Livewire.grow``
+    """
+    priority: int
+    tracer_type: Any = field(compare=False)
+    points: List[Point] = field(compare=False)
+    polyline: bool = field(compare=False)
+    corridor: Any = field(compare=False)
+    key: Hashable = field(compare=False)
+    line_thickness: int = field(compare=False)
+    token: SearchToken = field(compare=False)
+    group: Hashable = field(compare=False)
+    callback: Callable[[Optional[List[Point]]], Any] = field(compare=False)
+    slot: int = field(default=-1, compare=False)
+    radius: int = field(default=0, compare=False)
+
+
+class SearchScheduler:
+    """
+    Traces segments in a bounded pool of worker processes, so that searches
+    run in parallel instead of competing for the GIL.
+
+    Frames are passed to the workers through shared memory, once per
+    ``key``. So are their weights: the first worker to search a frame computes
+    them, and the others copy them instead of smoothing the frame again.
+    Waiting requests are started newest first, and a new request
+    replaces any request of the same group that is still waiting or running.
+    Callbacks and progress reports are passed to ``dispatch``, e.g.
+    ``tk.Tk.after_idle``, so that they run on the caller's thread.
+
+    :ivar max_workers: maximum number of worker processes
+    :ivar max_frames: maximum number of frames kept in shared memory
+    """
+
+    def __init__(self, dispatch: Callable[..., Any] = None,
+                 max_workers: int = None, max_frames: int = 4):
+        self.dispatch = dispatch or (lambda f, *args: f(*args))
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.max_frames = max_frames
+
+        self._pool = None
+        self._lock = threading.Lock()
+        self._waiting: List[SearchRequest] = []  # heap
+        self._running: Dict[int, SearchRequest] = {}  # by slot
+        self._count = itertools.count()
+        self._frames: OrderedDict[Hashable, FrameRef] = OrderedDict()
+        self._shms: Dict[str, SharedMemory] = {}
+        self._frame_users: Dict[Hashable, int] = {}
+
+        # one byte per running request, set to 1 to cancel it
+        self._flags = None
+        self._progress = None
+        atexit.register(self.shutdown)
+
+    def submit(self, tracer_type, orig: Point, dest: Point, data: np.ndarray,
+               key: Hashable, line_thickness: int, token: SearchToken,
+               callback: Callable[[Optional[List[Point]]], Any],
+               group: Hashable = None):
+        """
+        Queues the search for a path from ``orig`` to ``dest``.
+
+        :param data: the unsmoothed frame. Only copied to shared memory the
+         first time ``key`` is seen.
+        :param key: identifies the frame and line thickness.
+        :param token: cancels the search and receives its progress.
+        :param callback: called through ``dispatch`` with the path, or with
+         ``None`` if the search fails, is canceled or is superseded.
+        :param group: if not ``None``, cancels earlier requests of the same
+         group.
+        """
+        self._submit(SearchRequest(
+            -next(self._count), tracer_type, [orig, dest], False, None, key,
+            line_thickness, token, group, callback), data)
+
+    def submit_polyline(self, tracer_type, points: List[Point],
+                        data: np.ndarray, key: Hashable, line_thickness: int,
+                        token: SearchToken,
+                        callback: Callable[[Optional[List[List[Point]]]],
+                                           Any],
+                        corridor=None, group: Hashable = None):
+        """
+        Queues the search for every segment of the polyline through
+        ``points``, see ``Searcher.trace_polyline``. Parameters are the same
+        as ``submit``.
+
+        :param corridor: ``(lines, width)``. If given, paths only go through
+         pixels within ``width`` of ``lines``, see ``corridor_mask``.
+        """
+        self._submit(SearchRequest(
+            -next(self._count), tracer_type, list(points), True, corridor,
+            key, line_thickness, token, group, callback), data)
+
+    def submit_livewire(self, orig: Point, radius: int, data: np.ndarray,
+                        key: Hashable, line_thickness: int,
+                        token: SearchToken,
+                        callback: Callable[[Optional[tuple]], Any],
+                        group: Hashable = None):
+        """
+        Queues growing the livewire tree of ``radius`` from ``orig``.
+        Parameters are the same as ``submit``.
+
+        :param callback: called through ``dispatch`` with the tree, to pass
+         to ``Livewire.use``, or with ``None``.
+        """
+        self._submit(SearchRequest(
+            -next(self._count), None, [orig], False, None, key,
+            line_thickness, token, group, callback, radius=radius), data)
+
+    def _submit(self, request: SearchRequest, data: np.ndarray):
+        group, key = request.group, request.key
+        superseded = []
+        with self._lock:
+            if group is not None:
+                superseded = [r for r in self._waiting if r.group == group]
+                self._waiting = [r for r in self._waiting if r.group != group]
+                heapq.heapify(self._waiting)
+                for r in self._running.values():
+                    if r.group == group: r.token.cancel()
+
+            # counted first, so that sharing never evicts this frame
+            self._frame_users[key] = self._frame_users.get(key, 0) + 1
+            self._share(key, data)
+            heapq.heappush(self._waiting, request)
+
+        for r in superseded: self._finish(r, None)
+        self._start_waiting()
+
+    def shutdown(self):
+        with self._lock:
+            for r in self._running.values(): r.token.cancel()
+            self._waiting.clear()
+            if self._pool: self._pool.shutdown(wait=False,
+                                               cancel_futures=True)
+            self._pool = None
+            for shm in self._shms.values():
+                shm.close()
+                shm.unlink()
+            self._shms.clear()
+            self._frames.clear()
+            if self._flags:
+                self._flags.close()
+                self._flags.unlink()
+                self._flags = None
+                self._progress = None
+
+    def _share(self, key, data):
+        """ Copies ``data`` to shared memory, unless ``key`` is there. """
+        if key in self._frames:
+            self._frames.move_to_end(key)
+            return
+
+        shm = SharedMemory(create=True, size=max(data.nbytes, 1))
+        np.ndarray(data.shape, data.dtype, buffer=shm.buf)[...] = data
+        # a ready byte, then the weights. Pages are only used once written.
+        weights = SharedMemory(create=True, size=_WEIGHTS_OFFSET +
+                               8 * int(np.prod(data.shape[:2])))
+        self._shms[shm.name] = shm
+        self._shms[weights.name] = weights
+        self._frames[key] = (shm.name, data.shape, data.dtype.str,
+                             weights.name)
+
+        # free the least recently used frames no request needs anymore
+        for old in list(self._frames):
+            if len(self._frames) <= self.max_frames: break
+            if self._frame_users.get(old): continue
+            name, _, _, weights = self._frames.pop(old)
+            for old_shm in self._shms.pop(name), self._shms.pop(weights):
+                old_shm.close()
+                old_shm.unlink()
+
+    def _start_waiting(self):
+        """ Starts the newest waiting requests while workers are free. """
+        with self._lock:
+            if self._pool is None:
+                if self._flags is None:
+                    self._flags = SharedMemory(create=True,
+                                               size=self.max_workers)
+                    self._progress = multiprocessing.Queue()
+                    # restarted pools report to the same watcher
+                    threading.Thread(target=self._watch, daemon=True,
+                                     args=(self._progress,)).start()
+                self._pool = ProcessPoolExecutor(
+                    self.max_workers, initializer=_init_worker,
+                    initargs=(self._flags.name, self._progress))
+
+            started = []
+            while self._waiting and len(self._running) < self.max_workers:
+                request = heapq.heappop(self._waiting)
+                if request.token.canceled or request.key not in self._frames:
+                    started.append((request, None))
+                    continue
+                request.slot = min(set(range(self.max_workers)) -
+                                   set(self._running))
+                self._flags.buf[request.slot] = 0
+                try:
+                    if request.radius:
+                        future = self._pool.submit(
+                            _grow_livewire, request.points[0], request.radius,
+                            self._frames[request.key], request.key,
+                            request.line_thickness, request.slot)
+                    else:
+                        future = self._pool.submit(
+                            _trace, request.tracer_type, request.points,
+                            request.polyline, request.corridor,
+                            self._frames[request.key], request.key,
+                            request.line_thickness, request.slot)
+                except BrokenProcessPool as e:
+                    print(f"SearchScheduler: restarting workers: {e}")
+                    self._pool.shutdown(wait=False)
+                    self._pool = None
+                    started.append((request, None))
+                    break
+                self._running[request.slot] = request
+                started.append((request, future))
+
+        for request, future in started:
+            if future is None:
+                self._finish(request, None)
+            else:
+                future.add_done_callback(
+                    lambda f, r=request: self._done(r, f))
+
+    def _done(self, request, future):
+        with self._lock:
+            self._running.pop(request.slot, None)
+        try:
+            line = None if future.cancelled() else future.result()
+        except Exception as e:
+            print(f"SearchScheduler: search failed: {e}")
+            line = None
+        self._finish(request, None if request.token.canceled else line)
+        self._start_waiting()
+
+    def _finish(self, request, line):
+        with self._lock:
+            self._frame_users[request.key] -= 1
+        self.dispatch(request.callback, line)
+
+    def _watch(self, progress):
+        """
+        Forwards progress reports from the workers to the tokens, and
+        cancellations from the tokens to the workers, until ``shutdown``.
+
+        :param progress: the queue the workers report to.
+        """
+        while self._progress is progress:
+            try:
+                slot, expanded, distance = progress.get(timeout=0.05)
+                request = self._running.get(slot)
+                if request and request.token.progress:
+                    self.dispatch(request.token.progress, expanded, distance)
+            except queue.Empty:
+                pass
+            except (OSError, ValueError):  # shut down
+                return
+
+            with self._lock:
+                for slot, request in self._running.items():
+                    if request.token.canceled and self._flags:
+                        self._flags.buf[slot] = 1
+
+
+class _WorkerToken(SearchToken):
+    """ The worker side of a ``SearchToken``. """
+
+    def __init__(self, slot):
+        super().__init__(progress=lambda *args: _progress.put((slot, *args)))
+        self.slot = slot
+
+    @property
+    def canceled(self): return bool(_flags.buf[self.slot])
+
+
+# the weights follow the ready byte, aligned
+_WEIGHTS_OFFSET = 8
+
+# State of each worker process
+_flags: Optional[SharedMemory] = None
+_progress: Optional[multiprocessing.Queue] = None
+_frames: OrderedDict[str, SharedMemory] = OrderedDict()
+_tracers = None
+_livewire = None
+
+
+def _init_worker(flags_name, progress):
+    global _flags, _progress, _tracers, _livewire
+    from src.line_tracers import LineTracers
+    from src.livewire import Livewire
+
+    _flags = SharedMemory(flags_name)
+    _progress = progress
+    _tracers = LineTracers()
+    _livewire = Livewire()
+
+
+def _attach(name: str) -> SharedMemory:
+    if name not in _frames:
+        _frames[name] = SharedMemory(name)
+        # a frame and its weights are used at a time
+        while len(_frames) > 8: _frames.popitem(last=False)[1].close()
+    _frames.move_to_end(name)
+    return _frames[name]
+
+
+def _frame(frame: FrameRef) -> np.ndarray:
+    name, shape, dtype, _ = frame
+    return np.ndarray(shape, dtype, buffer=_attach(name).buf)
+
+
+def _cache_weights(frame: FrameRef, key, line_thickness, cost_maps):
+    """
+    Puts the weights of ``frame`` in ``cost_maps``, computing them only if no
+    worker has yet. Workers that compute them at the same time write the same
+    values.
+    """
+    from src.graph_analyzer import GraphAnalyzer
+
+    if key in cost_maps: return
+    _, shape, _, name = frame
+    shm = _attach(name)
+    weights = np.ndarray(shape[:2], float, buffer=shm.buf,
+                         offset=_WEIGHTS_OFFSET)
+    if not shm.buf[0]:
+        weights[...] = cost_maps.get(
+            GraphAnalyzer.take_avg(_frame(frame), line_thickness))
+        shm.buf[0] = 1
+    # copied, since the shared memory is closed once evicted
+    cost_maps.put(key, weights.copy())
+
+
+def _trace(tracer_type, points, polyline, corridor, frame: FrameRef, key,
+           line_thickness, slot):
+    from src.tracker import corridor_mask
+
+    data = _frame(frame)
+    tracer = _tracers.get(tracer_type)
+    _cache_weights(frame, key, line_thickness, tracer.cost_maps)
+    if not polyline:
+        return tracer.trace(*points, data, key=key, token=_WorkerToken(slot))
+    return tracer.trace_polyline(
+        points, data, key=key, token=_WorkerToken(slot), max_workers=1,
+        mask=corridor and corridor_mask(data.shape, *corridor))
+
+
+def _grow_livewire(orig, radius, frame: FrameRef, key, line_thickness, slot):
+    _cache_weights(frame, key, line_thickness, _livewire.cost_maps)
+    _livewire.radius = radius
+    return _livewire.grow(_frame(frame), orig, key, _WorkerToken(slot))
@@ -0,0 +1,597 @@
+import heapq
+import numpy as np
+import threading
+from abc import ABC, abstractmethod
+from lib.point import Point
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from typing import Any, Callable, List, Optional, Tuple
+
+
+def to_index(point: Point, height: int) -> int:
+    """
+    Converts ``point`` to a flat pixel index.
+
+    Pixels are numbered column by column (``x * height + y``), so comparing two
+    indices gives the same result as comparing the two ``Point`` tuples. This
+    keeps the order in which ties are popped off the heap unchanged.
+    """
+    return point.x * height + point.y
+
+
+def to_point(index: int, height: int) -> Point:
+    """ Inverse of ``to_index``. """
+    return Point(*divmod(index, height))
+
+
+class SearchToken:
+    """
+    A handle to a single search, used to cancel it and to follow its progress.
+    Heap-based engines poll the token every ``interval`` settled pixels, so a
+    canceled search stops within ``interval`` heap pops.
+    ``CSGraphSearchEngine`` can only poll it between the stages of its search
+    (see ``STAGE_GROWTH``): a canceled search stops once the current stage is
+    over, which may take as long as a whole search of the frame if most pixels
+    lie at about the same distance from the origin.
+
+    :ivar progress: called with the number of pixels settled so far and the
+     distance of the search frontier each time the token is polled
+    :ivar interval: number of settled pixels between two polls
+    """
+
+    def __init__(self, progress: Callable[[int, float], Any] = None,
+                 interval: int = 4096):
+        self.progress = progress
+        self.interval = interval
+        self._canceled = threading.Event()
+
+    @property
+    def canceled(self) -> bool: return self._canceled.is_set()
+
+    def cancel(self): self._canceled.set()
+
+    def poll(self, expanded: int, distance: float) -> bool:
+        """
+        Reports progress.
+
+        :return: ``True`` iff the search should stop.
+        """
+        if self.progress: self.progress(expanded, distance)
+        return self.canceled
+
+
+class SearchEngine(ABC):
+    """
+    Finds the cheapest 4-connected path between two pixels. Entering a pixel
+    costs ``weights[y, x]``.
+
+    Engines may keep data derived from the last ``weights`` they were given,
+    so passing the same (unmodified) array again is cheaper.
+
+    :ivar expanded: the number of pixels settled by the last search
+    """
+    expanded = 0
+
+    @abstractmethod
+    def search(self, weights: np.ndarray, orig: int, dest: int,
+               token: SearchToken = None) -> Optional[List[int]]:
+        """
+        :param weights: a 2D array of edge weights, one per pixel.
+        :param orig: flat index of the origin (see ``to_index``).
+        :param dest: flat index of the destination.
+        :param token: cancels the search and receives its progress.
+        :return: flat indices of the path from ``dest`` back to, but
+         excluding, ``orig``, or ``None`` if there is no path or the search
+         was canceled.
+        """
+        pass
+
+    def search_tree(self, weights: np.ndarray, orig: int, dests: List[int],
+                    token: SearchToken = None) \
+            -> Optional[List[Optional[List[int]]]]:
+        """
+        Finds the paths from ``orig`` to each of ``dests``. Engines that grow
+        a shortest-path tree from ``orig`` reuse it for every destination.
+
+        :return: one path per destination, as returned by ``search``, or
+         ``None`` if the search was canceled.
+        """
+        paths, expanded = [], 0
+        for dest in dests:
+            paths.append(self.search(weights, orig, dest, token))
+            expanded += self.expanded
+            if token and token.canceled: return None
+        self.expanded = expanded
+        return paths
+
+    def distances(self, weights: np.ndarray, orig: int, indices: np.ndarray,
+                  limit: float, reverse: bool = False) -> np.ndarray:
+        """
+        Bounds the cost of reaching ``indices`` from ``orig``, e.g. to prove
+        that no path leaving a search area is cheaper than one inside it.
+        Engines that settle pixels in order of distance answer from their
+        last search. Otherwise, Dijkstra's algorithm is run up to ``limit``.
+
+        :param reverse: bound the cost of reaching ``orig`` from ``indices``
+         instead.
+        :return: for each of ``indices``, a lower bound of its distance from
+         ``orig``, exact if it is less than ``limit``.
+        """
+        graph = self._grid_graph(weights)
+        # leaving a pixel backwards costs its weight, see `grid_graph`
+        return dijkstra(graph.T if reverse else graph, indices=orig,
+                        limit=limit)[indices]
+
+    def _grid_graph(self, weights: np.ndarray) -> csr_matrix:
+        """ :return: ``CSGraphSearchEngine.grid_graph`` of ``weights``. """
+        return CSGraphSearchEngine.grid_graph(
+            weights.ravel(order='F').astype(float), *weights.shape)
+
+
+class HeapSearchEngine(SearchEngine):
+    """
+    Dijkstra's algorithm using a binary heap over flat pixel indices.
+
+    Performs exactly the same heap operations as the original ``Point``-based
+    implementation, so it always returns the same path.
+    """
+
+    def __init__(self):
+        self._last = None, None  # (weights, flattened weights)
+        # (weights, orig, distances, settled pixels, distance of the last
+        # one) of the last tree grown
+        self._tree = None, None, None, None, None
+
+    def search(self, weights, orig, dest, token=None):
+        paths = self.search_tree(weights, orig, [dest], token)
+        return paths and paths[0]
+
+    def search_tree(self, weights, orig, dests, token=None):
+        height, width = weights.shape
+        n = height * width
+        w = self._flatten(weights)
+        remaining = set(dests)
+
+        visited = bytearray(n)
+        distances = [float('inf')] * n
+        distances[orig] = 0
+        predecessors = [-1] * n
+        pq = [(0, orig)]  # binary heap: (dist, index)
+        pop, push = heapq.heappop, heapq.heappush
+        expanded = 0
+        frontier = float('inf')  # every pixel not settled is as far
+
+        while pq:
+            curr_dist, curr = pop(pq)
+            if visited[curr]: continue
+            visited[curr] = 1
+            expanded += 1
+            remaining.discard(curr)
+            if not remaining:
+                frontier = curr_dist
+                break
+            if (token and not expanded % token.interval and
+                    token.poll(expanded, curr_dist)): return None
+
+            y = curr % height
+            # same order as before: +x, +y, -x, -y
+            for neighbor in (curr + height if curr + height < n else -1,
+                             curr + 1 if y + 1 < height else -1,
+                             curr - height,
+                             curr - 1 if y else -1):
+                if neighbor < 0: continue
+                new_weight = curr_dist + w[neighbor]
+                if distances[neighbor] > new_weight:
+                    distances[neighbor] = new_weight
+                    predecessors[neighbor] = curr
+                    push(pq, (new_weight, neighbor))
+
+        self.expanded = expanded
+        self._tree = weights, orig, distances, visited, frontier
+        return [_walk(predecessors, orig, dest) for dest in dests]
+
+    def distances(self, weights, orig, indices, limit, reverse=False):
+        last, last_orig, distances, visited, frontier = self._tree
+        if last is not weights or last_orig != orig or reverse:
+            return super().distances(weights, orig, indices, limit, reverse)
+        return np.array([distances[i] if visited[i] else frontier
+                         for i in np.asarray(indices).tolist()], dtype=float)
+
+    def _flatten(self, weights: np.ndarray) -> List[float]:
+        """ :return: ``weights`` as a list, indexed by flat pixel index. """
+        last, w = self._last
+        if last is not weights:
+            w = weights.ravel(order='F').tolist()
+            self._last = weights, w
+        return w
+
+
+class AStarSearchEngine(HeapSearchEngine):
+    """
+    A* search. The heuristic is the Manhattan distance to ``dest`` times the
+    smallest weight in the frame (i.e. the weight of its brightest pixel).
+    Since every step costs at least that much, the heuristic never
+    overestimates and the path found is as cheap as Dijkstra's, although it
+    may be a different one when several paths are equally cheap.
+    """
+
+    def search_tree(self, weights, orig, dests, token=None):
+        # the heuristic aims at one destination, so not the tree of
+        # `HeapSearchEngine`
+        return SearchEngine.search_tree(self, weights, orig, dests, token)
+
+    def search(self, weights, orig, dest, token=None):
+        height, width = weights.shape
+        n = height * width
+        w = self._flatten(weights)
+        w_min = float(weights.min())
+        dx, dy = divmod(dest, height)
+
+        visited = bytearray(n)
+        distances = [float('inf')] * n
+        distances[orig] = 0
+        predecessors = [-1] * n
+        pq = [(0, orig)]  # binary heap: (dist + heuristic, index)
+        pop, push = heapq.heappop, heapq.heappush
+        expanded = 0
+
+        while pq:
+            _, curr = pop(pq)
+            if visited[curr]: continue
+            visited[curr] = 1
+            expanded += 1
+            if curr == dest: break
+
+            curr_dist = distances[curr]
+            if (token and not expanded % token.interval and
+                    token.poll(expanded, curr_dist)): return None
+            x, y = divmod(curr, height)
+            for neighbor, nx, ny in ((curr + height, x + 1, y),
+                                     (curr + 1 if y + 1 < height else -1,
+                                      x, y + 1),
+                                     (curr - height, x - 1, y),
+                                     (curr - 1 if y else -1, x, y - 1)):
+                if not 0 <= neighbor < n: continue
+                new_weight = curr_dist + w[neighbor]
+                if distances[neighbor] > new_weight:
+                    distances[neighbor] = new_weight
+                    predecessors[neighbor] = curr
+                    push(pq, (new_weight +
+                              w_min * (abs(nx - dx) + abs(ny - dy)),
+                              neighbor))
+
+        self.expanded = expanded
+        return _walk(predecessors, orig, dest)
+
+
+class BidirectionalSearchEngine(HeapSearchEngine):
+    """
+    Dijkstra's algorithm run from both ends at once, always growing the side
+    with the closer frontier. Stops as soon as the two frontiers together
+    are farther than the cheapest path joining them, which typically settles
+    about half as many pixels as a one-sided search.
+
+    Going backwards from ``v`` to ``u`` costs ``w[v]``, the weight of the
+    pixel being left, so both halves add up to the same cost as a forward
+    path. Like ``AStarSearchEngine``, ties may be broken differently than
+    by Dijkstra's algorithm.
+    """
+
+    def search_tree(self, weights, orig, dests, token=None):
+        # each search grows from both of its ends, so not the tree of
+        # `HeapSearchEngine`
+        return SearchEngine.search_tree(self, weights, orig, dests, token)
+
+    def search(self, weights, orig, dest, token=None):
+        height, width = weights.shape
+        n = height * width
+        w = self._flatten(weights)
+        if orig == dest: return None
+
+        inf = float('inf')
+        # index 0 searches forwards from `orig`, 1 backwards from `dest`
+        visited = bytearray(n), bytearray(n)
+        distances = [inf] * n, [inf] * n
+        distances[0][orig] = distances[1][dest] = 0
+        parents = [-1] * n, [-1] * n
+        pqs = [(0, orig)], [(0, dest)]
+        pop, push = heapq.heappop, heapq.heappush
+        best, meet = inf, -1
+        expanded = 0
+
+        while pqs[0] and pqs[1]:
+            if pqs[0][0][0] + pqs[1][0][0] >= best: break
+            side = 0 if pqs[0][0][0] <= pqs[1][0][0] else 1
+            dist, other = distances[side], distances[1 - side]
+
+            curr_dist, curr = pop(pqs[side])
+            if visited[side][curr]: continue
+            visited[side][curr] = 1
+            expanded += 1
+            if (token and not expanded % token.interval and
+                    token.poll(expanded, curr_dist)): return None
+
+            y = curr % height
+            for neighbor in (curr + height, curr + 1 if y + 1 < height else -1,
+                             curr - height, curr - 1 if y else -1):
+                if not 0 <= neighbor < n: continue
+                new_weight = curr_dist + w[neighbor if side == 0 else curr]
+                if dist[neighbor] > new_weight:
+                    dist[neighbor] = new_weight
+                    parents[side][neighbor] = curr
+                    push(pqs[side], (new_weight, neighbor))
+                if new_weight + other[neighbor] < best:
+                    best, meet = new_weight + other[neighbor], neighbor
+
+        self.expanded = expanded
+        if meet < 0:
+            print("Searcher: Path broken, no predecessor found")
+            return None
+
+        # `meet` to `dest` through the backward tree, and to `orig` through the
+        # forward one
+        halves = [], []
+        for side, end in (0, orig), (1, dest):
+            curr = meet
+            while curr != end:
+                curr = parents[side][curr]
+                halves[side].append(curr)
+        return (halves[1][::-1] + [meet] + halves[0])[:-1]
+
+
+class CSGraphSearchEngine(SearchEngine):
+    """
+    Dijkstra's algorithm using ``scipy.sparse.csgraph`` on a grid graph.
+
+    Distances are computed in compiled code. The path is then rebuilt using
+    the same tie-breaking rule as ``HeapSearchEngine``: among the neighbors
+    that give a pixel its distance, the one popped first (smallest distance,
+    then smallest index) is its predecessor. This rule only holds if every
+    step strictly increases the distance; if a weight is too small to change
+    the distance it is added to, the search falls back to ``fallback``.
+
+    :ivar STAGE_GROWTH: ratio between the limits of two consecutive stages of
+     a search that can be canceled
+    """
+
+    STAGE_GROWTH = 2 ** .5
+
+    def __init__(self, fallback: SearchEngine = None):
+        self.fallback = fallback or HeapSearchEngine()
+        self._last = None, None, None  # (weights, flattened weights, graph)
+        # (weights, orig, distances, the limit they were computed to, whether
+        # `fallback` found the paths) of the last search
+        self._tree = None, None, None, None, False
+
+    def search(self, weights, orig, dest, token=None):
+        paths = self.search_tree(weights, orig, [dest], token)
+        return paths and paths[0]
+
+    def search_tree(self, weights, orig, dests, token=None):
+        height, width = weights.shape
+        last, w, graph = self._last
+        if last is not weights:
+            w = weights.ravel(order='F').astype(float)
+            graph = self.grid_graph(w, height, width)
+            self._last = weights, w, graph
+
+        # Any path bounds the distance to a `dest`, so nothing beyond the
+        # farthest one needs to be settled. Use the L-shaped paths through
+        # (dest.x, orig.y), with some slack for rounding.
+        ox, oy = divmod(orig, height)
+        limit = max(weights[oy, min(ox, dx):max(ox, dx) + 1].sum() +
+                    weights[min(oy, dy):max(oy, dy) + 1, dx].sum()
+                    for dx, dy in (divmod(dest, height) for dest in dests)) \
+            * (1 + 1e-6)
+
+        result = self._staged(graph, height, orig, limit, token, dests)
+        if result is None: return None
+        distances, stage = result
+
+        found = distances[dests][np.isfinite(distances[dests])]
+        if found.size and self._has_zero_steps(distances, w, height, width,
+                                               found.max()):
+            print("Searcher: degenerate weights, using fallback engine")
+            paths = self.fallback.search_tree(weights, orig, dests, token)
+            self.expanded += self.fallback.expanded
+            self._tree = weights, orig, None, None, True
+            return paths
+
+        self._tree = weights, orig, distances, stage, False
+
+        return [None if np.isinf(distances[dest]) else
+                self._rebuild(distances, w, height, orig, dest)
+                for dest in dests]
+
+    def _staged(self, graph, height, orig, limit, token, dests=None) \
+            -> Optional[Tuple[np.ndarray, float]]:
+        """
+        Computes the distances from ``orig`` up to ``limit``, or only until
+        every pixel of ``dests`` is reached. Sets ``expanded``.
+
+        :return: the distances, ``inf`` for the pixels not reached, and the
+         limit they were computed to, or ``None`` if the search was canceled.
+        """
+        if not token:
+            distances = dijkstra(graph, indices=orig, limit=limit)
+            self.expanded = int(np.isfinite(distances).sum())
+            return distances, limit
+
+        # The search itself cannot be interrupted, so with a token it is run
+        # in stages of increasing distance, polling the token in between.
+        # Each stage reaches `STAGE_GROWTH` times as far as the previous one,
+        # and resumes where it stopped: it starts from an extra node with an
+        # edge to each settled pixel next to an unsettled one, weighted by
+        # its distance, and the edges from those pixels back into the
+        # settled ones are cut. Each pixel is then only settled once.
+        n, nnz = graph.shape[0], graph.nnz
+        staged = csr_matrix((np.concatenate([graph.data, np.full(n, np.inf)]),
+                             np.concatenate([graph.indices, np.arange(n)]),
+                             np.append(graph.indptr, nnz + n)),
+                            shape=(n + 1, n + 1))
+        data, indices, indptr = staged.data, staged.indices, staged.indptr
+        distances = np.full(n, np.inf)
+        distances[orig] = 0.
+        front = np.array([orig])
+        stage = limit / 8
+        while True:
+            settled = np.isfinite(distances)
+            if token.poll(int(settled.sum()), stage): return None
+            data[nnz + front] = distances[front]
+            distances = np.where(settled, distances, dijkstra(
+                staged, indices=n, limit=stage)[:n])
+            if stage >= limit or dests is not None and \
+                    np.isfinite(distances[dests]).all():
+                break
+            stage = min(stage * self.STAGE_GROWTH, limit)
+
+            data[nnz + front] = np.inf
+            settled = np.isfinite(distances).reshape(-1, height)
+            near = np.zeros_like(settled)
+            near[1:] |= ~settled[:-1]
+            near[:-1] |= ~settled[1:]
+            near[:, 1:] |= ~settled[:, :-1]
+            near[:, :-1] |= ~settled[:, 1:]
+            front = np.flatnonzero(near & settled)
+            counts = indptr[front + 1] - indptr[front]
+            edges = np.arange(counts.sum()) + np.repeat(
+                indptr[front] - np.cumsum(counts) + counts, counts)
+            data[edges[settled.ravel()[indices[edges]]]] = np.inf
+        self.expanded = int(np.isfinite(distances).sum())
+        return distances, stage
+
+    def distances(self, weights, orig, indices, limit, reverse=False):
+        last, last_orig, distances, stage, fallback = self._tree
+        if last is not weights or last_orig != orig or reverse:
+            return super().distances(weights, orig, indices, limit, reverse)
+        if fallback:
+            return self.fallback.distances(weights, orig, indices, limit)
+        # pixels not reached are farther than the limit of the last stage
+        distances = distances[indices]
+        return np.where(np.isfinite(distances), distances, stage)
+
+    def _grid_graph(self, weights):
+        last, _, graph = self._last
+        return graph if last is weights else super()._grid_graph(weights)
+
+    def tree(self, weights: np.ndarray, orig: int,
+             token: SearchToken = None) -> Optional[np.ndarray]:
+        """
+        Grows the whole shortest-path tree from ``orig``.
+
+        Predecessors are chosen with the same rule as the paths ``search``
+        returns, but vectorized over all pixels at once.
+
+        :return: the flat index of the predecessor of every pixel, or -1 for
+         ``orig`` and unreachable pixels, or ``None`` if the search was
+         canceled.
+        """
+        height, width = weights.shape
+        w = weights.ravel(order='F').astype(float)
+        # any pixel can be reached along the row of `orig`, then along its
+        # column, so no distance is larger than the longest such path
+        ox, oy = divmod(orig, height)
+        limit = (max(weights[oy, :ox + 1].sum(), weights[oy, ox:].sum()) +
+                 max(weights[:oy + 1].sum(axis=0).max(),
+                     weights[oy:].sum(axis=0).max())) * (1 + 1e-6)
+        result = self._staged(self.grid_graph(w, height, width), height,
+                              orig, limit, token)
+        if result is None: return None
+        distances = result[0]
+
+        # as in `grid_graph`, neighbors in ascending order, so that the first
+        # of two equally distant ones is kept
+        index = np.arange(height * width)
+        y = index % height
+        best = np.full(height * width, -1)
+        best_dist = np.full(height * width, np.inf)
+        for neighbor, valid in ((index - height, index >= height),
+                                (index - 1, y > 0),
+                                (index + 1, y < height - 1),
+                                (index + height,
+                                 index < (width - 1) * height)):
+            neighbor = np.where(valid, neighbor, 0)
+            d = np.where(valid, distances[neighbor], np.inf)
+            better = (d + w == distances) & (d < best_dist)
+            best[better] = neighbor[better]
+            best_dist[better] = d[better]
+        best[orig] = -1
+        return best
+
+    @staticmethod
+    def _rebuild(distances, w, height, orig, dest) -> Optional[List[int]]:
+        """ :return: the path to ``dest`` in the tree ``distances`` spans. """
+        path = []
+        curr = dest
+        while curr != orig:
+            path.append(curr)
+            y = curr % height
+            best = -1
+            for neighbor in (curr + height, curr + 1 if y + 1 < height else -1,
+                             curr - height, curr - 1 if y else -1):
+                if not 0 <= neighbor < len(w): continue
+                if (distances[neighbor] + w[curr] == distances[curr] and
+                        (best < 0 or (distances[neighbor], neighbor) <
+                         (distances[best], best))):
+                    best = neighbor
+            if best < 0:
+                print("Searcher: Path broken, no predecessor found")
+                return None
+            curr = best
+
+        return path or None
+
+    @staticmethod
+    def grid_graph(w: np.ndarray, height: int, width: int) -> csr_matrix:
+        """
+        :param w: flat (column-major) edge weights.
+        :return: the 4-connected grid as a sparse adjacency matrix, where the
+         edge ``u -> v`` has weight ``w[v]``.
+        """
+        n = height * width
+        index = np.arange(n)
+        y = index % height
+
+        # neighbors of each node in ascending order, -1 if out of bounds
+        nbrs = np.stack([index - height, np.where(y > 0, index - 1, -1),
+                         np.where(y < height - 1, index + 1, -1),
+                         index + height], axis=1)
+        nbrs[nbrs >= n] = -1
+        valid = nbrs >= 0
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(valid.sum(axis=1), out=indptr[1:])
+        indices = nbrs[valid]
+        return csr_matrix((w[indices], indices, indptr), shape=(n, n))
+
+    @staticmethod
+    def _has_zero_steps(distances, w, height, width, bound) -> bool:
+        """
+        :return: ``True`` iff some pixel can be entered from a neighbor no
+         farther than ``bound`` without increasing the distance.
+        """
+        dist = distances.reshape((width, height))
+        weight = w.reshape((width, height))
+        for axis in (0, 1):
+            for a, b in ((slice(None, -1), slice(1, None)),
+                         (slice(1, None), slice(None, -1))):
+                src = [slice(None)] * 2
+                dst = [slice(None)] * 2
+                src[axis], dst[axis] = a, b
+                d = dist[tuple(src)]
+                if np.any((d + weight[tuple(dst)] == d) & (d <= bound)):
+                    return True
+        return False
+
+
+def _walk(predecessors: List[int], orig: int, dest: int) \
+        -> Optional[List[int]]:
+    path = []
+    curr = dest
+    while curr != orig:
+        path.append(curr)
+        curr = predecessors[curr]
+        if curr == -1:
+            print("Searcher: Path broken, no predecessor found")
+            return None
+    return path or None
@@ -1,8 +1,12 @@
-import heapq
+import copy
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from lib.point import Point
+from src.cost_map import CostMaps
 from src.line_tracer import LineTracer
-from typing import List, Optional, Tuple
+from src.search_engines import (CSGraphSearchEngine, SearchEngine,
+                                SearchToken, to_index, to_point)
+from typing import Hashable, List, Optional, Tuple
 
 
 class Searcher(LineTracer):
@@ -10,94 +14,189 @@ class Searcher(LineTracer):
     Stores points using a stack, then searches for the brightest and shortest
     path between the last two points.
 
-    :ivar canceled: ``True`` iff user terminates search
     :ivar clicks: A ``DoublyLinkedList`` of points representing the position
      clicked by user
     :ivar all_lines: A ``DoublyLinkedList`` of lines returned by searcher
+    :ivar engine: The ``SearchEngine`` used to find paths
+    :ivar cost_maps: The weight images of recently searched frames
+    :ivar padding: The minimum number of pixels the search area extends
+     beyond ``orig`` and ``dest``
     """
 
-    def __init__(self):
+    def __init__(self, engine: SearchEngine = None):
         super().__init__()
-        self.canceled = False
+        self.engine = engine or CSGraphSearchEngine()
+        self.cost_maps = CostMaps()
+        self.padding = 16
 
-    def trace(self, orig: Point, dest: Point, data: np.ndarray, *args) \
+    def trace(self, orig: Point, dest: Point, data: np.ndarray, *args,
+              key: Optional[Hashable] = None,
+              token: Optional[SearchToken] = None) \
             -> Optional[List[Tuple[int, int]]]:
         """
         Returns the shortest path between ``orig = self.clicks[-2]`` and
         ``dest = self.clicks[-1]``, where edge weights are determined by
-        ``_calc_weight``.
-
-        Implemented with Dijkstra's algorithm using a binary heap. Overall time
-        complexity is `O(n log n)`, where `n` is the number of pixels (i.e.
-        height x width) of the image. However, its average time complexity is
-        `Θ(d^2 log d)`, where ``d`` is the distance between ``orig`` and
-        ``dest``.
+        ``self.cost_maps.weight``.
+
+        Implemented with Dijkstra's algorithm (see ``self.engine``). Overall
+        time complexity is `O(n log n)`, where `n` is the number of pixels
+        (i.e. height x width) of the image. However, its average time
+        complexity is `Θ(d^2 log d)`, where ``d`` is the distance between
+        ``orig`` and ``dest``.
+
+        Only a padded bounding box around ``orig`` and ``dest`` is searched,
+        so memory and time do not depend on the size of the frame. The box
+        grows until no path leaving it can be cheaper than the path found,
+        see ``_search_tree``.
+
+        :param key: identifies ``data`` (see ``CostMaps.get``), so that its
+         weights are computed only once.
+        :param token: cancels this search and receives its progress.
+        :return: ``None`` if no path is found or the search is canceled.
         """
-        self.canceled = False
-
         print(f"Searcher: starting search with origin at {orig} and "
               f"destination at {dest}...")
 
-        # Convert to grayscale if the image is in color
-        if len(data.shape) == 3: data = np.mean(data, axis=2)
-
-        height, width = data.shape
-        steps = [Point(1, 0), Point(0, 1), Point(-1, 0), Point(0, -1)]
-
-        # init
-        visited = np.full((height, width), False)
-        distances = np.full((height, width), float('inf'))
-        distances[*orig.t] = 0
-        predecessors = np.full((height, width, 2), -1, dtype=int)
-        pq = [(0, orig)]  # binary heap: (dist, node)
-
-        while pq:
-            if self.canceled:
-                print("Searcher: canceled")
-                return None
-
-            curr_dist, curr = heapq.heappop(pq)
-            if visited[*curr.t]: continue
-            visited[*curr.t] = True
-            if curr == dest: break
-
-            for step in steps:
-                neighbor = curr + step
-                if neighbor.out_of_bounds(Point(width, height)): continue
-
-                # use inverse brightness as weight
-                new_weight = curr_dist + self._calc_weight(float(
-                    data[*neighbor.t]))
-
-                if distances[*neighbor.t] > new_weight:
-                    distances[*neighbor.t] = new_weight
-                    predecessors[*neighbor.t] = curr.x, curr.y
-                    heapq.heappush(pq, (new_weight, neighbor))
-
-        # reconstruct path
-        path = []
-        curr = dest
-        while curr != orig:
-            path.append(curr)
-            curr = Point(*predecessors[*curr.t])
-            if curr == Point(-1, -1):
-                print("Searcher: Path broken, no predecessor found")
-                return None
-        if not path: return None
+        weights = self.cost_maps.get(data, key)
+        paths = self._search_tree(self.engine, weights, orig, [dest], token)
+        if paths is None:
+            print("Searcher: canceled")
+            return None
+        if not paths[0]: return None
 
         print("Searcher: path found!")
-        return path
+        return paths[0]
+
+    def trace_polyline(self, points: List[Point], data: np.ndarray, *args,
+                       key: Optional[Hashable] = None,
+                       token: Optional[SearchToken] = None,
+                       max_workers: Optional[int] = None,
+                       mask: Optional[np.ndarray] = None) \
+            -> Optional[List[Optional[List[Point]]]]:
+        """
+        Traces every segment of the polyline through ``points`` at once, e.g.
+        to trace a saved annotation again on another frame.
+
+        A single shortest-path tree is grown from every other point and serves
+        both the segment ending there and the one starting there, so only
+        about half as many searches are run as there are segments. Since
+        entering a pixel costs its weight, reversing a path changes its cost by
+        the same amount as any other path between the same two points, so the
+        reversed paths are still the cheapest. When several paths are equally
+        cheap, a different one than ``trace`` returns may be chosen.
+
+        Trees do not depend on each other and are grown in parallel, by up to
+        ``max_workers`` threads.
+
+        :param key: see ``trace``.
+        :param token: cancels all the searches and receives their progress.
+        :param mask: if given, paths only go through pixels where it is
+         ``True``.
+        :return: for each segment, the path as ``trace`` returns it, or
+         ``None`` if the search is canceled.
+        """
+        print(f"Searcher: starting search of {len(points) - 1} segments...")
+
+        weights = self.cost_maps.get(data, key)
+        if mask is not None: weights = np.where(mask, weights, np.inf)
+        roots = range(1, len(points), 2)
+
+        def grow(i):
+            dests = [points[i - 1]] + points[i + 1:i + 2]
+            # engines keep state, so each thread uses its own
+            return self._search_tree(copy.copy(self.engine), weights,
+                                     points[i], dests, token)
+
+        with ThreadPoolExecutor(max_workers) as pool:
+            trees = list(pool.map(grow, roots))
+        if token and token.canceled or None in trees:
+            print("Searcher: canceled")
+            return None
+
+        lines = []
+        for i, tree in zip(roots, trees):
+            # the tree is rooted at the end of the incoming segment
+            incoming = tree[0]
+            lines.append(incoming and [points[i]] + incoming[:0:-1])
+            lines.extend(tree[1:])
+
+        print(f"Searcher: {sum(bool(line) for line in lines)} paths found!")
+        return lines
+
+    def _search_tree(self, engine: SearchEngine, weights: np.ndarray,
+                     orig: Point, dests: List[Point],
+                     token: Optional[SearchToken]) \
+            -> Optional[List[Optional[List[Point]]]]:
+        """
+        Searches a padded bounding box around ``orig`` and ``dests``, which
+        grows until the paths found are the cheapest in the whole frame.
+
+        Any path that leaves the box does so through one of its sides that
+        is not an edge of the frame, from a pixel it reaches inside the box,
+        and comes back through one of them to a pixel from which it reaches
+        its destination inside the box. So it costs at least the distance of
+        the closest of those pixels from ``orig``, plus that of the closest
+        one to the destination. Once that is no less than the cost of the
+        path found, no path leaving the box is cheaper.
+
+        :return: the path from each of ``dests`` back to, but excluding,
+         ``orig``, or ``None`` if the search is canceled.
+        """
+        height, width = weights.shape
+        padding = max(self.padding,
+                      *(max(abs(dest - orig)) // 2 for dest in dests))
+
+        while True:
+            # search a padded bounding box of `orig` and `dests`, in local
+            # coordinates relative to its top left corner
+            x0 = max(min(orig.x, *(d.x for d in dests)) - padding, 0)
+            y0 = max(min(orig.y, *(d.y for d in dests)) - padding, 0)
+            x1 = min(max(orig.x, *(d.x for d in dests)) + padding + 1, width)
+            y1 = min(max(orig.y, *(d.y for d in dests)) + padding + 1, height)
+            corner = Point(x0, y0)
+            is_full = (x0, y0, x1, y1) == (0, 0, width, height)
+
+            roi = weights if is_full else weights[y0:y1, x0:x1]
+            paths = engine.search_tree(
+                roi, to_index(orig - corner, y1 - y0),
+                [to_index(dest - corner, y1 - y0) for dest in dests], token)
+            if paths is None or token and token.canceled: return None
+            if is_full or all(paths) and self._is_cheapest(
+                    engine, roi, to_index(orig - corner, y1 - y0), paths,
+                    (x0 > 0, y0 > 0, x1 < width, y1 < height)):
+                return [path and [to_point(i, y1 - y0) + corner
+                                  for i in path] for path in paths]
+
+            # the best path may leave the box, so grow it
+            padding *= 2
+            print(f"Searcher: growing search area to {padding} px padding")
 
     @staticmethod
-    def _calc_weight(x: float) -> int | float:
+    def _is_cheapest(engine: SearchEngine, roi: np.ndarray, orig: int,
+                     paths: List[List[int]], sides: Tuple[bool, ...]) -> bool:
         """
-        Calculates the edge weight based on pixel intensity.
-
-        Modifying this formula changes how much a pixel's intensity affects the
-        relative cost of traversal.
+        :param roi: the weights of the box searched.
+        :param paths: the paths found in the box, from ``engine``.
+        :param sides: whether the left, top, right and bottom sides of the
+         box are inside the frame.
+        :return: ``True`` iff no path leaving the box through ``sides`` is
+         cheaper than the one of ``paths`` to the same destination.
         """
-        # I propose an exponential decay function with:
-        n0 = 2 ** 16
-        t_half = 16
-        # https://www.desmos.com/calculator/8zad7rj8md
-        return n0 * 2 ** (-x / t_half)
+        height, width = roi.shape
+        w = roi.ravel(order='F')
+        # summed from `orig`, as the engines do, so that costs compare exactly
+        costs = [float(np.cumsum(w[path[::-1]])[-1]) for path in paths]
+
+        y, x = np.arange(height), np.arange(width)
+        left, top, right, bottom = sides
+        border = np.concatenate([
+            y if left else [], x * height if top else [],
+            (width - 1) * height + y if right else [],
+            x * height + height - 1 if bottom else []]).astype(int)
+        if not border.size: return True
+
+        out = engine.distances(roi, orig, border, max(costs)).min()
+        # back into the box, and then to each destination
+        return all(cost <= out or cost <= out + engine.distances(
+            roi, path[0], border, cost - out, reverse=True).min()
+                   for path, cost in zip(paths, costs))
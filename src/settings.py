@@ -1,4 +1,5 @@
 import tkinter as tk
+from src.image_stack import user_cache_dir
 
 
 class Settings:
@@ -11,6 +12,8 @@ class Settings:
         self.line_color = (255, 0, 0)
         self.area_color = (255, 0, 0)
         self.weight_factor = 0.
+        # decoded frames are cached here, on disk rather than in memory
+        self.cache_dir = user_cache_dir()
         self.closed = True
 
     def show_window(self, root):
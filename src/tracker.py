@@ -0,0 +1,134 @@
+import cv2
+import numpy as np
+import threading
+from lib.point import Point
+from src.graph_analyzer import GraphAnalyzer
+from src.search_engines import SearchToken
+from typing import Any, Callable, Hashable, List, Optional, Sequence
+
+
+class StackTracker:
+    """
+    Follows an annotation traced on one frame through every other frame of
+    the stack, so that it does not go stale when the specimen drifts.
+
+    Frame by frame, outwards from the annotated frame, each waypoint is moved
+    to the brightest pixel within ``radius`` of where it was in the
+    neighboring frame. This is cheap, and is the only part that depends on
+    the previous frame. As soon as its waypoints are known, the frame is
+    traced on its own, confined to a corridor around the annotated path
+    shifted by how far its waypoints moved. These searches are the expensive
+    part, and run in parallel.
+
+    :ivar radius: how far a waypoint may move between two frames, in pixels
+    :ivar corridor: how far a path may stray from the shifted annotated path,
+     in pixels. If ``0``, paths are not confined.
+    """
+
+    def __init__(self, radius: int = 8, corridor: int = 16):
+        self.radius = radius
+        self.corridor = corridor
+
+    def track(self, scheduler, tracer_type, frames: Sequence[np.ndarray],
+              keys: Sequence[Hashable], points: List[Point],
+              lines: List[List[Point]], start: int, line_thickness: int,
+              token: SearchToken,
+              callback: Callable[[int, Optional[List[List[Point]]]], Any],
+              batch: int = None) -> int:
+        """
+        Traces the annotation on every frame of ``keys`` but ``start`` in
+        ``scheduler``. Frames closest to ``start`` are traced first, and each
+        result is passed to ``callback`` as soon as it is found.
+
+        Reads every frame and copies it to shared memory, and returns once
+        the last one is submitted, so it should not be called from the UI
+        thread.
+
+        :param frames: the unsmoothed frames of the stack, e.g. an
+         ``ImageStack``. Frames past those of ``keys`` are ignored.
+        :param keys: identifies each frame, see ``SearchScheduler.submit``.
+        :param points: the waypoints clicked on frame ``start``.
+        :param lines: the paths between consecutive ``points``, as returned
+         by ``Searcher.trace``.
+        :param callback: called once for each frame with its index and its
+         paths, or ``None`` if the search fails or is canceled.
+        :param batch: how many frames are submitted at a time, so that at
+         most that many are in shared memory at once. The next frame is
+         submitted when one finishes. ``scheduler.max_frames`` by default.
+        :return: the number of frames ``callback`` is called for, i.e.
+         ``len(keys) - 1``.
+        """
+        # each frame drifts from its neighbor closer to `start`, which comes
+        # before it
+        todo = sorted((i for i in range(len(keys)) if i != start),
+                      key=lambda i: abs(i - start))
+        waypoints = {start: list(points)}
+        path = [p for line in lines for p in line[::-1]]
+        free = threading.Semaphore(batch or scheduler.max_frames)
+
+        def done(i, res):
+            callback(i, res)
+            free.release()
+
+        for i in todo:
+            prev = waypoints[i - 1 if i > start else i + 1]
+            data = None
+            if not token.canceled:
+                try:
+                    data = frames[i]
+                except OSError as e:
+                    print(f"StackTracker: could not read frame {i}: {e}")
+            if data is None:
+                # the next frame drifts from the same waypoints
+                waypoints[i] = prev
+                callback(i, None)
+                continue
+            waypoints[i] = [self.snap(data, p, line_thickness) for p in prev]
+
+            corridor = None
+            if self.corridor:
+                shift = Point(*np.round(np.mean(
+                    np.subtract(waypoints[i], points), axis=0)).astype(int))
+                corridor = [[p + shift for p in points[:1] + path],
+                            waypoints[i]], self.corridor
+
+            free.acquire()
+            scheduler.submit_polyline(
+                tracer_type, waypoints[i], data, keys[i], line_thickness,
+                token, lambda res, i=i: done(i, res), corridor=corridor,
+                group=("track", i))
+        return len(todo)
+
+    def snap(self, data: np.ndarray, point: Point, line_thickness: int) \
+            -> Point:
+        """
+        :return: the brightest pixel within ``radius`` of ``point``, after
+         smoothing like the searcher does.
+        """
+        data = np.mean(data, axis=2) if len(data.shape) == 3 else data
+        r = self.radius + line_thickness
+        x0, y0 = max(point.x - r, 0), max(point.y - r, 0)
+        window = GraphAnalyzer.take_avg(
+            data[y0:point.y + r + 1, x0:point.x + r + 1], line_thickness)
+
+        y, x = np.ogrid[y0:y0 + window.shape[0], x0:x0 + window.shape[1]]
+        dist = (x - point.x) ** 2 + (y - point.y) ** 2
+        window[dist > self.radius ** 2] = -np.inf
+
+        # the closest of the brightest pixels, so that waypoints do not slide
+        # along a uniformly bright filament
+        dist = np.where(window == window.max(), dist, np.inf)
+        y, x = np.unravel_index(np.argmin(dist), dist.shape)
+        return Point(int(x) + x0, int(y) + y0)
+
+
+def corridor_mask(shape, lines: List[List[Point]], width: int) -> np.ndarray:
+    """
+    :return: a boolean mask of the pixels within ``width`` of ``lines``.
+    """
+    mask = np.zeros(shape[:2], dtype=np.uint8)
+    cv2.polylines(mask, [np.array(line, dtype=np.int32) for line in lines],
+                  False, 1, 2 * width)
+    for line in lines:
+        for p in line: cv2.circle(mask, p, width, 1, -1)
+    return mask.astype(bool)
@@ -0,0 +1,124 @@
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+
+def backpointer_dtype(c: int) -> np.dtype:
+    """
+    :return: the smallest signed integer type that holds every index of a row
+     of ``c`` values, and -1.
+    """
+    # a signed type that fits -c fits c - 1
+    return np.min_scalar_type(-max(c, 1))
+
+
+def max_sum(l: Sequence[Sequence[float]], a: float = 0.,
+            backpointers: Optional[str] = None) \
+        -> Tuple[List[Tuple[int, int]], float]:
+    """
+    Chooses one value in each row of ``l``, at strictly increasing indices,
+    such that their sum plus ``a`` times the sum of the indices (but the last)
+    is maximal.
+
+    Let ``OPT(i, j)`` be the best sum of rows ``i`` onwards when ``j`` is
+    chosen in row ``i``. Then
+
+    ``OPT(i, j) = l[i][j] + aj + max(OPT(i + 1, k) for k in range(j + 1, c))``
+
+    with ``OPT(r - 1, j) = l[r - 1][j]``. The maximum over ``k`` is the
+    suffix maximum of row ``i + 1``, so each row is solved in a few
+    vectorized operations, in `O(r c)` overall.
+    Sums are kept in float64, and ``-inf`` marks the choices that leave too
+    few indices for the remaining rows. Ties go to the smallest index.
+
+    Only two rows of sums are kept at a time, and rows of ``l`` are read one
+    at a time, so ``l`` can be a memory-mapped array, e.g. from
+    ``np.load(file, mmap_mode='r')``. Backpointers use the smallest integer
+    type that fits (see ``backpointer_dtype``).
+
+    :param l: a 2D array with images as rows and number of pixels from the
+     origin as columns.
+    :param backpointers: if given, the file the backpointers are memory-mapped
+     to, instead of keeping them in memory.
+    :return: the chosen ``(row, index)`` pairs and their sum, or ``[]`` and
+     ``-inf`` if there are more rows than indices.
+    """
+    return _solve(l, [a], [False], backpointers)[0]
+
+
+def max_sum_both(l: Sequence[Sequence[float]], a: float = 0.,
+                 backpointers: Optional[str] = None) \
+        -> Tuple[bool, Tuple[List[Tuple[int, int]], float],
+                 Tuple[List[Tuple[int, int]], float]]:
+    """
+    Solves ``max_sum`` for ``l``, and for ``l`` with every row reversed
+    (i.e. for strictly decreasing indices), both with ``a = 0`` to choose a
+    direction and with ``a``. All of these are stacked and solved in a
+    single sweep over the rows of ``l``.
+
+    :return: ``True`` iff increasing indices give the larger sum with
+     ``a = 0``, then the result of ``max_sum`` with ``a`` for increasing
+     indices and for decreasing ones. Indices of the latter are indices into
+     the reversed rows.
+    """
+    a_values = [0., a] if a else [0.]
+    res = _solve(l, [v for v in a_values for _ in range(2)],
+                 [False, True] * len(a_values), backpointers)
+    return res[0][1] > res[1][1], res[-2], res[-1]
+
+
+def _solve(l, a_values, flips, backpointers=None):
+    """
+    Solves ``max_sum`` for several ``a``, stacked along a new first axis of
+    each row, where the row is reversed if ``flips`` says so.
+
+    Rows are indexed from the end (``q = c - 1 - j``), so that the suffix
+    maxima are cumulative maxima of contiguous memory.
+    """
+    r, c = len(l), len(l[0])
+    a = np.array(a_values, dtype=float)[:, None]
+    flips = np.array(flips)[:, None]
+    shape = (r, len(a_values), c)
+    dtype = backpointer_dtype(c)
+    path = (np.lib.format.open_memmap(backpointers, 'w+', dtype, shape)
+            if backpointers else np.empty(shape, dtype))
+    aj = a * np.arange(c - 1, -1, -1)
+    q = np.arange(c)
+    best = np.empty((len(a_values), c))
+    best[:, 0] = -np.inf
+    first = np.empty((len(a_values), c), dtype=int)
+    first[:, 0] = -1
+
+    def row(i):
+        values = np.asarray(l[i], dtype=float)
+        return np.where(flips, values, values[::-1])
+
+    opt = row(r - 1)
+    path[r - 1] = -1
+    for i in range(r - 2, -1, -1):
+        # the maximum of `opt[:q]` and its last occurrence, i.e. the first
+        # in `j`
+        running = np.maximum.accumulate(opt, axis=1)
+        best[:, 1:] = running[:, :-1]
+        first[:, 1:] = np.maximum.accumulate(
+            np.where(opt == running, q, 0), axis=1)[:, :-1]
+
+        opt = best + row(i) + aj
+        path[i] = np.where(np.isfinite(opt), first, -1)
+        opt[~np.isfinite(opt)] = -np.inf
+    if backpointers: path.flush()
+
+    res = []
+    for n, problem in enumerate(opt):
+        # the first maximum in `j` is the last one in `q`
+        k = c - 1 - int(np.argmax(problem[::-1]))
+        max_value = float(problem[k])
+        if max_value == -np.inf:
+            res.append(([], max_value))
+            continue
+
+        indices = []
+        for i in range(r):
+            indices.append((i, c - 1 - k))
+            k = int(path[i, n, k])
+        res.append((indices, max_value))
+    return res
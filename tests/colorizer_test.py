@@ -0,0 +1,50 @@
+import init
+import numpy as np
+import unittest
+from matplotlib import colormaps
+
+from src.colorizer import Colorizer
+
+
+def legacy(data, max_brightness, brightness):
+    """ How ``ImageViewer._draw`` colored a frame before tables. """
+    data = np.clip(data / max_brightness * brightness, 0, 1)
+    return (colormaps['viridis'](data)[:, :, :3] * 255).astype(np.uint8)
+
+
+class ColorizerTest(unittest.TestCase):
+    def setUp(self):
+        self.colorize = Colorizer(colormaps['viridis'])
+        self.rng = np.random.default_rng(0)
+
+    def test_same_colors(self):
+        """Tables should give the colors of the float computation."""
+        for dtype, max_brightness in ((np.uint8, 200), (np.uint16, 4095),
+                                      (np.uint16, 65535)):
+            data = self.rng.integers(0, np.iinfo(dtype).max, (30, 40),
+                                     dtype=dtype, endpoint=True)
+            for brightness in (0.3, 1, 2.5):
+                np.testing.assert_array_equal(
+                    legacy(data, max_brightness, brightness),
+                    self.colorize(data, max_brightness, brightness))
+
+    def test_other_dtypes(self):
+        """Frames that cannot index a table should be colored in floats."""
+        for data in (self.rng.random((30, 40)) * 100,
+                     self.rng.integers(0, 100, (30, 40), dtype=np.int32)):
+            np.testing.assert_array_equal(legacy(data, 100, 1),
+                                          self.colorize(data, 100, 1))
+
+    def test_tables(self):
+        """Tables should be built once per dtype and normalization."""
+        table = self.colorize.table(np.uint16, 4095, 1)
+        self.assertEqual((65536, 3), table.shape)
+        packed = self.colorize.packed(np.uint16, 4095, 1)
+        self.assertIs(packed, self.colorize.packed(np.uint16, 4095, 1))
+        self.assertIsNot(packed, self.colorize.packed(np.uint16, 4095, 2))
+        np.testing.assert_array_equal(
+            table, packed.view(np.uint8).reshape(-1, 4)[:, :3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import threading
+
+import init
+import numpy as np
+import unittest
+
+from image_stack_test import make_folder
+from src.frame_stats import BINS, FrameStats, file_key, sidecar_path
+from src.image_stack import ImageStack, list_pages
+
+
+class FrameStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.paths = make_folder(self.dir.name, 10)
+        self.sidecar = sidecar_path(self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def open(self):
+        stack = ImageStack(self.paths, stats_file=self.sidecar)
+        for _ in range(200):
+            if stack.stats.complete: break
+            threading.Event().wait(0.05)
+        stack.close()
+        return stack
+
+    def test_compute(self):
+        """Statistics should describe the whole frame."""
+        data = np.arange(1000, dtype=np.uint16).reshape(20, 50)
+        low, high, percentiles, histogram, ranges = FrameStats.compute(data)
+        self.assertEqual((0, 999), (low, high))
+        np.testing.assert_allclose(np.percentile(data, [1, 50, 99, 99.9]),
+                                   percentiles)
+        self.assertEqual((BINS,), histogram.shape)
+        self.assertEqual(1000, histogram.sum())
+        self.assertEqual((0, 2 ** 16), ranges)
+
+    def test_sidecar(self):
+        """Statistics should be reused on reopen, unless a file changed."""
+        self.assertFalse(os.path.exists(self.sidecar))
+        first = self.open()
+        self.assertTrue(os.path.exists(self.sidecar))
+
+        os.utime(self.paths[3], ns=(0, 0))
+        stack = ImageStack(self.paths, stats_file=self.sidecar)
+        try:
+            self.assertEqual([i != 3 for i in range(10)],
+                             [i in stack.stats for i in range(10)])
+            np.testing.assert_array_equal(
+                np.delete(first.stats.histograms, 3, axis=0),
+                np.delete(stack.stats.histograms, 3, axis=0))
+            self.assertEqual(109, stack.max_brightness)
+        finally:
+            stack.close()
+
+    def test_page_counts(self):
+        """Files whose page count is known should not be read."""
+        path = os.path.join(self.dir.name, "broken.tif")
+        with open(path, 'wb') as file: file.write(b"not an image")
+        self.assertEqual([(path, 0), (path, 1), (path, 2)],
+                         list_pages([path], {file_key(path): 3}))
+
+
+if __name__ == '__main__':
+    unittest.main()
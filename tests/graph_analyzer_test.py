@@ -0,0 +1,213 @@
+import itertools
+import os
+import tempfile
+
+import init
+import numpy as np
+import src.wavefront
+import unittest
+from scipy.ndimage import gaussian_filter1d
+from scipy.signal import convolve2d
+from src.graph_analyzer import GraphAnalyzer
+
+
+def legacy_max_sum(l, a):
+    """ The triple loop ``GraphAnalyzer._max_sum`` used to run. """
+    r, c = len(l), len(l[0])
+    m = np.full((r, c), -1)
+    path = np.full((r, c), -1)
+
+    for j in range(c):
+        m[r - 1][j] = l[r - 1][j]
+
+    for i in range(r - 2, -1, -1):
+        for j in range(c):
+            for k in range(j + 1, c):
+                tmp = m[i + 1][k] + l[i][j] + a * j
+                if tmp > m[i][j]:
+                    m[i][j] = tmp
+                    path[i][j] = k
+
+    max_value = -1
+    max_pos = -1
+    for j in range(c):
+        if m[0][j] > max_value:
+            max_value = m[0][j]
+            max_pos = j
+
+    i, j = 0, max_pos
+    indices = []
+    while j != -1:
+        indices.append((i, j))
+        j = path[i][j]
+        i += 1
+
+    return indices, max_value
+
+
+def brute_max_sum(l, a):
+    """ Tries every strictly increasing choice of indices. """
+    r, c = len(l), len(l[0])
+    best, best_value = [], -np.inf
+    for indices in itertools.combinations(range(c), r):
+        value = sum(l[i][j] + (a * j if i < r - 1 else 0)
+                    for i, j in enumerate(indices))
+        if value > best_value:
+            best, best_value = list(enumerate(indices)), value
+    return best, best_value
+
+
+def legacy_moving_average(data, mode, window_size=20, sigma=5):
+    """ How ``GraphAnalyzer.moving_average`` smoothed a single profile. """
+    if mode == 3: return gaussian_filter1d(data, sigma)
+    res = list(np.convolve(np.array(data), np.ones(window_size) / window_size,
+                           mode='valid'))
+    if mode == 0: return -np.gradient(res)
+    if mode == 1: return res
+    return res * -np.gradient(res)
+
+
+def legacy_take_avg(image, radius):
+    """ How ``GraphAnalyzer.take_avg`` smoothed before OpenCV. """
+    size = radius * 2 + 1
+    y, x = np.ogrid[:size, :size]
+    mask = (x - radius) ** 2 + (y - radius) ** 2 <= radius ** 2
+    kernel = np.zeros((size, size))
+    kernel[mask] = 1
+    kernel /= kernel.sum()
+    return convolve2d(image, kernel, mode='same', boundary='symm')
+
+
+class GraphAnalyzerTest(unittest.TestCase):
+    def test_max_sum(self):
+        """The solver should find the best choice, the first one on ties."""
+        rng = np.random.default_rng(0)
+        for n in range(200):
+            r, c = rng.integers(1, 7, size=2)
+            # halves add up exactly, so that ties are ties in any order
+            l = [rng.integers(-3, 4, size=(r, c)),
+                 np.round(rng.normal(0, 4, size=(r, c))) / 2][n % 2]
+            a = [0., .5, 1., -.5][n // 2 % 4]
+            expected = brute_max_sum(l, a)
+            self.assertEqual(expected, GraphAnalyzer._max_sum(l, a))
+
+    def test_max_sum_float(self):
+        """Float values should not be truncated."""
+        rng = np.random.default_rng(1)
+        for _ in range(50):
+            l = rng.random((4, 7)) * 2 - 1
+            indices, value = src.wavefront.max_sum(l, .1)
+            expected, expected_value = brute_max_sum(l, .1)
+            self.assertEqual(expected, indices)
+            self.assertAlmostEqual(expected_value, value)
+        self.assertEqual([(0, 1), (1, 2)],
+                         src.wavefront.max_sum([[.4, .6, 0], [0, 0, .9]])[0])
+
+    def test_max_sum_stream(self):
+        """Rows and backpointers on disk should give the same result."""
+        l = np.random.default_rng(2).random((30, 200))
+        with tempfile.TemporaryDirectory() as folder:
+            np.save(os.path.join(folder, "l.npy"), l)
+            res = src.wavefront.max_sum(
+                np.load(os.path.join(folder, "l.npy"), mmap_mode='r'), .01,
+                backpointers=os.path.join(folder, "path.npy"))
+            self.assertEqual(src.wavefront.max_sum(l, .01), res)
+            self.assertEqual(np.int16, np.load(os.path.join(folder, "path.npy")).dtype)
+
+    def test_max_sum_both(self):
+        """One sweep should give the results of four separate solves."""
+        rng = np.random.default_rng(3)
+        for a in 0., .2:
+            l = rng.random((20, 60))
+            reverse = [line[::-1] for line in l]
+            is_increasing, increasing, decreasing = \
+                src.wavefront.max_sum_both(l, a)
+            self.assertEqual(src.wavefront.max_sum(l, 0.)[1] >
+                             src.wavefront.max_sum(reverse, 0.)[1],
+                             is_increasing)
+            self.assertEqual(src.wavefront.max_sum(l, a), increasing)
+            self.assertEqual(src.wavefront.max_sum(reverse, a), decreasing)
+
+    def test_backpointer_dtype(self):
+        self.assertEqual(np.int8, src.wavefront.backpointer_dtype(127))
+        self.assertEqual(np.int16, src.wavefront.backpointer_dtype(4000))
+        self.assertEqual(np.int32, src.wavefront.backpointer_dtype(40000))
+
+    def test_moving_average(self):
+        """Smoothing a kymograph should smooth each row, to the bit."""
+        rng = np.random.default_rng(8)
+        analyzer = GraphAnalyzer()
+        for data in (rng.random((40, 300)) * 500, rng.random((40, 301))[:, 1:],
+                     rng.integers(0, 255, (3, 50))):
+            for mode in range(4):
+                for window_size in (1, 20, 200, 299):
+                    # at least 2 values are left, for the gradient
+                    if window_size >= data.shape[1]: continue
+                    analyzer.mode, analyzer.window_size = mode, window_size
+                    np.testing.assert_array_equal(
+                        [legacy_moving_average(row, mode, window_size)
+                         for row in data], analyzer.moving_average(data))
+                    np.testing.assert_array_equal(
+                        legacy_moving_average(data[0], mode, window_size),
+                        analyzer.moving_average(data[0]))
+        analyzer.mode = 1
+        self.assertRaises(ValueError, analyzer.moving_average, data[:, :10])
+
+    def test_take_avg(self):
+        """Smoothing should match the direct convolution, edges included."""
+        rng = np.random.default_rng(5)
+        for shape, radius in (((30, 40), 0), ((30, 40), 1), ((60, 50), 9),
+                              ((7, 9), 5), ((3, 4), 6)):
+            for data in (rng.integers(0, 4096, shape, dtype=np.uint16),
+                         rng.random(shape).astype(np.float32)):
+                res = GraphAnalyzer.take_avg(data, radius)
+                self.assertEqual(np.float64, res.dtype)
+                np.testing.assert_allclose(legacy_take_avg(data, radius), res,
+                                           rtol=1e-12, atol=1e-9)
+
+    def test_smooth(self):
+        """Smoothed frames should be kept by key and radius."""
+        analyzer = GraphAnalyzer(max_smoothed=2)
+        data = np.random.default_rng(6).random((20, 30))
+        res = analyzer.smooth(0, data, 2)
+        self.assertFalse(res.flags.writeable)
+        self.assertIs(res, analyzer.smooth(0, data, 2))
+        self.assertIsNot(res, analyzer.smooth(0, data, 3))
+        analyzer.smooth(1, data, 2)
+        self.assertIsNot(res, analyzer.smooth(0, data, 2))
+        self.assertIsNot(analyzer.smooth(None, data, 2),
+                         analyzer.smooth(None, data, 2))
+
+    def test_sample_avg(self):
+        """Sampling should give ``take_avg`` at the pixels, edges included."""
+        rng = np.random.default_rng(4)
+        for shape, radius in (((30, 40), 0), ((30, 40), 3), ((7, 9), 5)):
+            data = rng.integers(0, 4096, shape, dtype=np.uint16)
+            y, x = np.indices(shape).reshape(2, -1)
+            np.testing.assert_allclose(
+                GraphAnalyzer.take_avg(data, radius)[y, x],
+                GraphAnalyzer.sample_avg(data, radius, np.stack((x, y), 1)))
+        self.assertEqual((0,), GraphAnalyzer.sample_avg(data, 2, []).shape)
+
+    def test_sample_stack(self):
+        """Sampling a stack should sample each of its frames."""
+        rng = np.random.default_rng(7)
+        frames = rng.integers(0, 4096, (5, 20, 30), dtype=np.uint16)
+        points = rng.integers(0, 20, (50, 2))
+        res = GraphAnalyzer.sample_stack(frames, 3, points)
+        self.assertEqual((5, 50), res.shape)
+        for data, profile in zip(frames, res):
+            np.testing.assert_allclose(
+                GraphAnalyzer.sample_avg(data, 3, points), profile)
+        color = rng.random((2, 20, 30, 3))
+        np.testing.assert_allclose(
+            [GraphAnalyzer.sample_avg(data.mean(axis=2), 2, points)
+             for data in color],
+            GraphAnalyzer.sample_stack(color, 2, points))
+
+    def test_too_many_rows(self):
+        self.assertEqual(([], -np.inf), src.wavefront.max_sum(np.ones((3, 2))))
+
+
+if __name__ == '__main__':
+    unittest.main()
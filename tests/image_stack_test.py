@@ -0,0 +1,152 @@
+import os
+import tempfile
+import threading
+
+import init
+import numpy as np
+import unittest
+from PIL import Image
+
+from src.image_stack import ImageStack
+
+
+def make_folder(folder, frames, size=(40, 60)):
+    """ Frames whose pixels are all their index, but for one brighter one. """
+    paths = []
+    for i in range(frames):
+        data = np.full(size, i, dtype=np.uint16)
+        data[0, 0] = 100 + i
+        paths.append(os.path.join(folder, f"{i}.tif"))
+        Image.fromarray(data).save(paths[-1])
+    return paths
+
+
+class ImageStackTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.paths = make_folder(self.dir.name, 10)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_frames(self):
+        """Frames should be decoded on demand, once, in their own dtype."""
+        stack = ImageStack(self.paths, radius=0)
+        try:
+            for i in (4, 0, 9, 5):
+                self.assertEqual(i, stack[i][1, 1])
+            self.assertEqual(np.uint16, stack[4].dtype)
+            self.assertTrue(np.shares_memory(stack[4], stack[4]))
+            self.assertFalse(stack[4].flags.writeable)
+        finally:
+            stack.close()
+
+    def test_cache_dir(self):
+        """Frames should be cached in ``cache_dir``, made if missing."""
+        cache_dir = os.path.join(self.dir.name, "cache", "stacks")
+        stack = ImageStack(self.paths, radius=0, cache_dir=cache_dir)
+        try:
+            self.assertEqual(3, stack[3][1, 1])
+            self.assertEqual(1, len(os.listdir(cache_dir)))
+        finally:
+            stack.close()
+        self.assertEqual([], os.listdir(cache_dir))
+
+    def test_pages(self):
+        """Each page of a multi-page file should be a frame."""
+        path = os.path.join(self.dir.name, "stack.tif")
+        pages = [Image.open(p) for p in self.paths[:3]]
+        pages[0].save(path, save_all=True, append_images=pages[1:])
+        for page in pages: page.close()
+
+        added = threading.Event()
+        stack = ImageStack([path] + self.paths[3:5],
+                           on_pages=lambda _: added.set())
+        try:
+            self.assertTrue(added.wait(10))
+            self.assertEqual(5, len(stack))
+            self.assertEqual(list(range(5)), [f[1, 1] for f in stack])
+        finally:
+            stack.close()
+
+    def test_lazy_pages(self):
+        """Files should not be read when the stack is opened, and other \
+        files than TIFFs should only be found to have more pages once \
+        decoded."""
+        broken = os.path.join(self.dir.name, "broken.png")
+        with open(broken, 'wb') as file: file.write(b"not an image")
+        stack = ImageStack([broken])
+        self.assertEqual(1, len(stack))
+        stack.close()
+
+        path = os.path.join(self.dir.name, "stack.gif")
+        frames = [Image.fromarray(np.full((40, 60), 50 * i, dtype=np.uint8))
+                  for i in range(3)]
+        frames[0].save(path, save_all=True, append_images=frames[1:])
+        indices = []
+        stack = ImageStack([path, self.paths[5]], radius=0,
+                           on_pages=indices.append)
+        try:
+            self.assertEqual(4, len(list(stack)))
+            self.assertEqual([[0, 3]], [list(i) for i in indices])
+            self.assertEqual(5, stack[3][1, 1])
+            self.assertEqual(4, len(stack.stats))
+        finally:
+            stack.close()
+
+    def test_array(self):
+        """The whole stack should be one array, if its frames are alike."""
+        stack = ImageStack(self.paths)
+        try:
+            data = stack.array()
+            self.assertEqual((10, 40, 60), data.shape)
+            self.assertEqual(list(range(10)), list(data[:, 1, 1]))
+            self.assertFalse(data.flags.writeable)
+        finally:
+            stack.close()
+
+        Image.fromarray(np.zeros((5, 5), dtype=np.uint16)).save(self.paths[3])
+        stack = ImageStack(self.paths)
+        try:
+            self.assertRaises(ValueError, stack.array)
+        finally:
+            stack.close()
+
+    def test_full_resolution(self):
+        """Frames should keep their resolution, only their renditions not."""
+        stack = ImageStack(self.paths)
+        try:
+            self.assertEqual((40, 60), stack[0].shape)
+            data, display_map = stack.pyramid.show(0, (30, 30))
+            self.assertEqual((20, 30), data.shape)
+            self.assertEqual((40, 60), stack[0].shape)
+            self.assertEqual(1, display_map.level)
+        finally:
+            stack.close()
+
+    def test_prefetch(self):
+        """Neighbors should be decoded in the background."""
+        stack = ImageStack(self.paths, radius=2)
+        try:
+            stack.prefetch(5)
+            for _ in range(100):
+                if all(i in stack for i in range(3, 8)): break
+                threading.Event().wait(0.05)
+            self.assertTrue(all(i in stack for i in range(3, 8)))
+        finally:
+            stack.close()
+
+    def test_max_brightness(self):
+        """The brightest pixel of all frames should be found eventually."""
+        found = threading.Event()
+        stack = ImageStack(self.paths, on_max_brightness=lambda m: m == 109
+                           and found.set())
+        try:
+            self.assertTrue(found.wait(10))
+            self.assertEqual(109, stack.max_brightness)
+        finally:
+            stack.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import csv
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+import init
+import numpy as np
+import unittest
+from PIL import Image
+from matplotlib.figure import Figure
+
+import batch
+import src.pipeline
+from src.graph_analyzer import GraphAnalyzer
+from src.image_stack import ImageStack, list_images
+
+
+def make_folder(folder, frames):
+    """ A bright front moving right along a horizontal line. """
+    for i in range(frames):
+        data = np.full((40, 120), 20, dtype=np.uint8)
+        data[:, :30 + 10 * i] = 200
+        path = os.path.join(folder, f"{i}.png")
+        Image.fromarray(data).save(path)
+        # the viewer opens images by modification time
+        os.utime(path, (i, i))
+
+
+class PipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.line = [(x, 20) for x in range(5, 115)]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_no_tkinter(self):
+        """The pipeline should not need a display."""
+        code = ("import sys, src.pipeline, batch; "
+                "sys.exit('tkinter' in sys.modules)")
+        self.assertEqual(0, subprocess.run(
+            [sys.executable, "-c", code], cwd=os.path.dirname(
+                os.path.dirname(os.path.abspath(__file__)))).returncode)
+
+    def test_line(self):
+        """A saved annotation should load back unchanged."""
+        path = os.path.join(self.dir.name, "line.csv")
+        src.pipeline.save_line(path, [np.array(p) for p in self.line])
+        self.assertEqual(self.line, src.pipeline.load_line(path))
+
+    def test_stack_profiles(self):
+        """A stack should be sampled as its frames are one by one."""
+        make_folder(self.dir.name, 4)
+        stack = ImageStack(list_images(self.dir.name))
+        try:
+            frames = [np.array(data) for data in stack]
+            res = src.pipeline.stack_profiles(stack, self.line, 2)
+        finally:
+            stack.close()
+        self.assertEqual((4, len(self.line)), res.shape)
+        np.testing.assert_allclose(
+            [src.pipeline.brightness_values(data, self.line, 2)
+             for data in frames], res)
+        np.testing.assert_allclose(
+            res, src.pipeline.stack_profiles(iter(frames), self.line, 2))
+        self.assertEqual((0, len(self.line)), src.pipeline.stack_profiles(
+            [], self.line, 2).shape)
+
+        # a radius of 0 reads the raw pixels
+        x, y = np.transpose(self.line)
+        np.testing.assert_array_equal(
+            [data[y, x] for data in frames],
+            src.pipeline.stack_profiles(np.array(frames), self.line, 0))
+
+    def test_profiles(self):
+        """Profiles of any length should be saved one per row, and plotted
+        one per page."""
+        profiles = [np.array([1.5, 2., 3.]), np.array([4., 5.])]
+        path = os.path.join(self.dir.name, "profiles.csv")
+        src.pipeline.save_profiles(path, profiles)
+        with open(path) as file: rows = list(csv.reader(file))
+        self.assertEqual([["Image number", "0", "1", "2"],
+                          ["1", "1.5", "2.0", "3.0"], ["2", "4.0", "5.0"]],
+                         rows)
+
+        path = os.path.join(self.dir.name, "graphs.pdf")
+        src.pipeline.save_graphs(path, profiles)
+        with open(path, 'rb') as file:
+            self.assertEqual(2, len(re.findall(rb"/Type /Page\b(?!s)",
+                                               file.read())))
+
+    def test_kymograph(self):
+        """A kymograph should save as one image or array, and plot."""
+        kymograph = np.random.default_rng(0).random((6, 110)) * 300
+        for name in ("k.tif", "k.npy"):
+            path = os.path.join(self.dir.name, name)
+            src.pipeline.save_kymograph(path, kymograph)
+            res = (np.load(path) if name.endswith(".npy")
+                   else np.array(Image.open(path)))
+            np.testing.assert_allclose(kymograph, res, rtol=1e-6)
+
+        ax = Figure().add_subplot()
+        src.pipeline.plot_kymograph(ax, kymograph, [(1, 10), (6, 100)])
+        self.assertEqual((6, 110), ax.images[0].get_array().shape)
+        np.testing.assert_array_equal([[10, 1], [100, 6]],
+                                      ax.lines[0].get_xydata())
+
+    def test_batch(self):
+        """Each folder should get the wavefront ``GraphAnalyzer`` finds, \
+        even if folders have the same name, and be left unchanged."""
+        folders = []
+        for name in ("a", "b"):
+            folders.append(os.path.join(self.dir.name, name, "day1"))
+            os.makedirs(folders[-1])
+            make_folder(folders[-1], 6)
+        line = os.path.join(self.dir.name, "line.csv")
+        src.pipeline.save_line(line, self.line)
+        output = os.path.join(self.dir.name, "out")
+
+        self.assertEqual(0, batch.main(
+            [os.path.join(self.dir.name, "[ab]", "day1"), "--line", line,
+             "--output", output, "--mode", "1", "--window-size", "3",
+             "--workers", "2"]))
+
+        analyzer = GraphAnalyzer()
+        analyzer.mode, analyzer.window_size = 1, 3
+        stack = ImageStack(list_images(folders[0]))
+        try:
+            _, res = src.pipeline.wavefront(stack, self.line, analyzer, 1, 0.)
+        finally:
+            stack.close()
+        self.assertEqual(6, len(res))
+        for name, folder in zip(("a", "b"), folders):
+            self.assertEqual(6, len(os.listdir(folder)))
+            name = os.path.join(output, name, "day1")
+            self.assertTrue(os.path.exists(name + ".pdf"))
+            with open(name + ".csv") as file:
+                rows = [tuple(map(int, row))
+                        for row in list(csv.reader(file))[1:]]
+            self.assertEqual([(int(i), int(x)) for i, x in res], rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
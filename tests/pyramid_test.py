@@ -0,0 +1,64 @@
+import init
+import numpy as np
+import unittest
+
+from src.pyramid import DisplayMap, Pyramid, display_level, downsample
+
+
+class PyramidTest(unittest.TestCase):
+    def test_display_level(self):
+        """Frames should be shrunk by the smallest power of 2 that fits."""
+        self.assertEqual(0, display_level((600, 800)))
+        self.assertEqual(1, display_level((600, 801)))
+        self.assertEqual(2, display_level((2048, 2048)))
+        self.assertEqual(3, display_level((2048, 2048, 3), (300, 300)))
+
+    def test_downsample(self):
+        """Each pixel should be the mean of a block, edges repeated."""
+        data = np.arange(15, dtype=np.float32).reshape(3, 5)
+        np.testing.assert_array_equal(
+            [[3, 5, 6.5], [10.5, 12.5, 14]], downsample(data))
+        # rounded half up in the same dtype
+        rounded = downsample(data.astype(np.uint16))
+        self.assertEqual(np.uint16, rounded.dtype)
+        np.testing.assert_array_equal([[3, 5, 7], [11, 13, 14]], rounded)
+
+    def test_to_full(self):
+        """Shown pixels should map to the pixel at their center."""
+        display_map = DisplayMap(2, (10, 14))
+        self.assertEqual((2, 2), display_map.to_full(0, 0))
+        self.assertEqual((13, 9), display_map.to_full(3, 2))
+        self.assertIsNone(display_map.to_full(4, 0))
+        self.assertIsNone(display_map.to_full(0, -1))
+        self.assertEqual((5, 3), DisplayMap(0, (10, 14)).to_full(5, 3))
+
+    def test_fixed(self):
+        """Full-resolution pixels should be drawn at their exact center."""
+        for level in range(4):
+            display_map = DisplayMap(level, (100, 100))
+            f = display_map.factor
+            for x in (0, 5, 37):
+                fixed = display_map.fixed_point((x, x))
+                self.assertEqual((x + 0.5) / f - 0.5,
+                                 fixed[0] / 2 ** display_map.shift)
+            # and a shown pixel should come back to itself
+            for u in (0, 3, 9):
+                x, y = display_map.to_full(u, u)
+                self.assertEqual(u, round(
+                    display_map.fixed_point((x, y))[0] /
+                    2 ** display_map.shift))
+
+    def test_pyramid(self):
+        """Renditions should be built once, from the level below them."""
+        calls = []
+        frame = np.arange(64, dtype=np.uint8).reshape(8, 8)
+        pyramid = Pyramid(lambda i: calls.append(i) or frame, max_size=2)
+        data = pyramid.get(0, 2)
+        np.testing.assert_array_equal(downsample(downsample(frame)), data)
+        self.assertIs(data, pyramid.get(0, 2))
+        self.assertEqual([0], calls)
+        self.assertFalse(data.flags.writeable)
+
+
+if __name__ == '__main__':
+    unittest.main()
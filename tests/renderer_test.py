@@ -0,0 +1,61 @@
+import init
+import cv2
+import numpy as np
+import unittest
+from matplotlib import colormaps
+
+from src.renderer import Renderer
+
+
+def legacy(data, max_brightness, brightness, draw):
+    """ How ``ImageViewer._draw`` drew a frame before layers. """
+    data = np.clip(data / max_brightness * brightness, 0, 1)
+    data = (colormaps['viridis'](data)[:, :, :3] * 255).astype(np.uint8)
+    draw(data, 3)
+    return data
+
+
+def draw(layer, channels=4):
+    color = (255, 0, 0, 255)[:channels]
+    cv2.circle(layer, (10, 10), 3, color, -1)
+    cv2.polylines(layer, [np.array([[10, 10], [40, 25], [5, 35]])], False,
+                  (0, 0, 0, 255)[:channels], 2)
+
+
+class RendererTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.data = rng.integers(0, 4096, (40, 50)).astype(np.uint16)
+        self.renderer = Renderer(colormaps['viridis'])
+
+    def test_same_image(self):
+        """Layers should give the image drawn directly on the frame."""
+        for brightness in (0.5, 1, 3):
+            np.testing.assert_array_equal(
+                legacy(self.data, 4000, brightness,
+                       lambda data, channels: draw(data, channels)),
+                self.renderer.render(0, self.data, 4000, brightness, 0, draw))
+
+    def test_dirty_layers(self):
+        """Only the layer that changed should be drawn again."""
+        calls = []
+
+        def counted(layer):
+            calls.append(1)
+            draw(layer)
+
+        first = self.renderer.render(0, self.data, 4000, 1, 'a', counted)
+        self.assertIs(first, self.renderer.render(0, self.data, 4000, 1, 'a',
+                                                  counted))
+        self.renderer.render(0, self.data, 4000, 2, 'a', counted)
+        self.assertEqual(1, len(calls))
+
+        base = self.renderer.base(0, self.data, 4000, 2)
+        self.renderer.render(0, self.data, 4000, 2, 'b', counted)
+        self.assertEqual(2, len(calls))
+        self.assertIs(base, self.renderer.base(0, self.data, 4000, 2))
+        self.assertFalse(first.flags.writeable)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import pickle
+import threading
+
+import init
+import numpy as np
+import unittest
+from lib.point import Point
+from src.cost_map import CostMaps
+from src.graph_analyzer import GraphAnalyzer
+from src.line_tracers import LineTracerTypes as ltt
+from src.livewire import Livewire
+from src.scheduler import SearchScheduler
+from src.search_engines import SearchToken
+from src.searcher import Searcher
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = SearchScheduler(max_workers=2)
+        self.results = {}
+        self.done = threading.Condition()
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+
+    def submit(self, name, orig, dest, data, key, group=None):
+        def callback(line):
+            with self.done:
+                self.results[name] = line
+                self.done.notify_all()
+
+        self.scheduler.submit(ltt.BRIGHTEST, orig, dest, data, key, 1,
+                              SearchToken(), callback, group=group)
+
+    def wait(self, count):
+        with self.done:
+            self.assertTrue(self.done.wait_for(
+                lambda: len(self.results) >= count, timeout=60))
+
+    def test_point_pickle(self):
+        """Points should survive being sent to a worker."""
+        self.assertEqual(Point(3, 4), pickle.loads(pickle.dumps(Point(3, 4))))
+
+    def test_same_path(self):
+        """Workers should find the path a local ``Searcher`` finds."""
+        rng = np.random.default_rng(0)
+        data = (rng.random((64, 64)) * 255).astype(np.uint8)
+        orig, dest = Point(2, 3), Point(60, 50)
+        self.submit('a', orig, dest, data, key=0)
+        self.wait(1)
+        self.assertEqual(Searcher().trace(
+            orig, dest, GraphAnalyzer.take_avg(data, 1)), self.results['a'])
+
+    def test_shared_weights(self):
+        """The weights a worker computes should be shared with the others."""
+        rng = np.random.default_rng(2)
+        data = (rng.random((64, 64)) * 255).astype(np.uint8)
+        self.submit('a', Point(2, 3), Point(60, 50), data, key=0)
+        self.wait(1)
+        _, shape, _, name = self.scheduler._frames[0]
+        shm = self.scheduler._shms[name]
+        self.assertEqual(1, shm.buf[0])
+        np.testing.assert_array_equal(
+            CostMaps().get(GraphAnalyzer.take_avg(data, 1)),
+            np.ndarray(shape, float, buffer=shm.buf, offset=8))
+
+    def test_supersede(self):
+        """A newer request of the same group should replace an older one."""
+        data = np.zeros((64, 64), dtype=np.uint8)
+        for i in range(4):
+            self.submit(i, Point(0, i), Point(63, 63), data, key=0, group=0)
+        self.wait(4)
+        self.assertIsNotNone(self.results[3])
+        self.assertEqual([None] * 3, [self.results[i] for i in range(3)])
+
+    def test_busy_frames(self):
+        """A new frame should be traced even if every shared frame is still \
+        in use."""
+        data = np.zeros((64, 64), dtype=np.uint8)
+        for key in range(self.scheduler.max_frames + 1):
+            self.submit(key, Point(0, 0), Point(63, 63), data, key=key)
+        self.wait(self.scheduler.max_frames + 1)
+        self.assertNotIn(None, self.results.values())
+
+    def test_livewire(self):
+        """A livewire grown by a worker should preview the paths of one \
+        grown locally."""
+        rng = np.random.default_rng(1)
+        data = (rng.random((64, 64)) * 255).astype(np.uint8)
+        orig = Point(30, 20)
+
+        def callback(tree):
+            with self.done:
+                self.results['tree'] = tree
+                self.done.notify_all()
+
+        self.scheduler.submit_livewire(orig, 15, data, 0, 1, SearchToken(),
+                                       callback)
+        self.wait(1)
+        remote, local = Livewire(radius=15), Livewire(radius=15)
+        self.assertTrue(remote.use(self.results['tree']))
+        self.assertTrue(local.start(GraphAnalyzer.take_avg(data, 1), orig))
+        for dest in (Point(40, 30), Point(16, 5), Point(45, 35)):
+            np.testing.assert_array_equal(local.path_to(dest),
+                                          remote.path_to(dest))
+
+
+if __name__ == '__main__':
+    unittest.main()
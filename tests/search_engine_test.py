@@ -0,0 +1,278 @@
+import heapq
+
+import init
+import numpy as np
+import unittest
+from lib.point import Point
+from src.cost_map import CostMaps, ExpDecayWeight
+from src.search_engines import (AStarSearchEngine, BidirectionalSearchEngine,
+                                CSGraphSearchEngine, HeapSearchEngine,
+                                SearchToken, to_index, to_point)
+from src.livewire import Livewire
+from src.searcher import Searcher
+
+
+def legacy_search(orig, dest, data):
+    """ The ``Point``-based loop ``Searcher.trace`` used to run. """
+    height, width = data.shape
+    steps = [Point(1, 0), Point(0, 1), Point(-1, 0), Point(0, -1)]
+    weights = ExpDecayWeight()(data.astype(float))
+
+    visited = np.full((height, width), False)
+    distances = np.full((height, width), float('inf'))
+    distances[*orig.t] = 0
+    predecessors = np.full((height, width, 2), -1, dtype=int)
+    pq = [(0, orig)]
+
+    while pq:
+        curr_dist, curr = heapq.heappop(pq)
+        if visited[*curr.t]: continue
+        visited[*curr.t] = True
+        if curr == dest: break
+
+        for step in steps:
+            neighbor = curr + step
+            if neighbor.out_of_bounds(Point(width, height)): continue
+            new_weight = curr_dist + float(weights[*neighbor.t])
+            if distances[*neighbor.t] > new_weight:
+                distances[*neighbor.t] = new_weight
+                predecessors[*neighbor.t] = curr.x, curr.y
+                heapq.heappush(pq, (new_weight, neighbor))
+
+    path = []
+    curr = dest
+    while curr != orig:
+        path.append(curr)
+        curr = Point(*predecessors[*curr.t])
+        if curr == Point(-1, -1): return None
+    return path or None
+
+
+class SearchEngineTest(unittest.TestCase):
+    def test_index(self):
+        """Flat indices should sort like the points they represent."""
+        points = [Point(x, y) for x in range(4) for y in range(3)]
+        indices = [to_index(p, 3) for p in points]
+        self.assertEqual(sorted(points), [to_point(i, 3)
+                                          for i in sorted(indices)])
+
+    def test_same_path(self):
+        """Every engine should return the path the old loop returned."""
+        rng = np.random.default_rng(0)
+        engines = [HeapSearchEngine(), CSGraphSearchEngine()]
+        for i in range(30):
+            height, width = rng.integers(2, 40, size=2)
+            # few distinct values, so that there are plenty of ties
+            data = rng.integers(0, 4, size=(height, width)) * 60
+            if i % 3 == 0: data = rng.random((height, width)) * 255
+            orig, dest = (Point(int(rng.integers(width)),
+                                int(rng.integers(height))) for _ in range(2))
+
+            expected = legacy_search(orig, dest, data)
+            weights = ExpDecayWeight()(data.astype(float))
+            for engine in engines:
+                path = engine.search(weights, to_index(orig, height),
+                                     to_index(dest, height))
+                self.assertEqual(expected, path and
+                                 [to_point(j, height) for j in path])
+
+    def test_optimal(self):
+        """A* and bidirectional paths should be connected and as cheap as \
+        Dijkstra's."""
+        rng = np.random.default_rng(1)
+        for i in range(30):
+            height, width = rng.integers(2, 40, size=2)
+            data = rng.integers(0, 4, size=(height, width)) * 60
+            weights = ExpDecayWeight()(data.astype(float))
+            orig, dest = (int(rng.integers(height * width)) for _ in range(2))
+
+            expected = HeapSearchEngine().search(weights, orig, dest)
+            for engine in AStarSearchEngine(), BidirectionalSearchEngine():
+                path = engine.search(weights, orig, dest)
+                if expected is None:
+                    self.assertIsNone(path)
+                    continue
+
+                points = [to_point(j, height) for j in path + [orig]]
+                self.assertEqual(to_point(dest, height), points[0])
+                for a, b in zip(points, points[1:]):
+                    self.assertEqual(1, sum(abs(a - b)))
+                self.assertAlmostEqual(
+                    weights.T.ravel()[expected].sum(),
+                    weights.T.ravel()[path].sum(), delta=1e-6)
+
+    def test_fallback(self):
+        """Weights that vanish next to large distances use the fallback."""
+        data = np.zeros((5, 30))
+        data[2, :] = 2 ** 14
+        orig, dest = Point(0, 0), Point(29, 4)
+        path = CSGraphSearchEngine().search(ExpDecayWeight()(data),
+                                            to_index(orig, 5),
+                                            to_index(dest, 5))
+        self.assertEqual(legacy_search(orig, dest, data),
+                         [to_point(j, 5) for j in path])
+
+    def test_roi(self):
+        """Searching a box around the clicks should give the same path as \
+        searching the whole frame, growing the box if needed."""
+        data = np.full((200, 200), 150.)
+        # a dark wall that is cheapest to go around just at the top border of
+        # the first box
+        data[85:141, 45] = 0
+        full = Searcher()
+        full.padding = 200
+        for orig, dest in ((Point(50, 100), Point(80, 120)),
+                           (Point(30, 100), Point(60, 100))):
+            self.assertEqual(full.trace(orig, dest, data),
+                             Searcher().trace(orig, dest, data))
+
+        # a wall whose only gap is far outside of the first box: the path
+        # through the wall does not touch the border of the box, yet the one
+        # around it is much cheaper
+        data = np.full((200, 200), 150.)
+        data[:, 55] = 0
+        data[150, 55] = 150
+        line = Searcher().trace(Point(50, 100), Point(60, 100), data)
+        self.assertEqual(full.trace(Point(50, 100), Point(60, 100), data),
+                         line)
+        self.assertEqual(110, len(line))
+
+    def test_roi_optimal(self):
+        """Paths found in a box should be as cheap as the cheapest in the \
+        whole frame, whatever the engine."""
+        rng = np.random.default_rng(6)
+        # bright and dark blocks, so that the cheapest paths wander far
+        data = np.kron(rng.integers(0, 2, size=(12, 12)) * 150.,
+                       np.ones((10, 10)))
+        weights = ExpDecayWeight()(data)
+        engines = (HeapSearchEngine(), CSGraphSearchEngine(),
+                   AStarSearchEngine(), BidirectionalSearchEngine())
+        for _ in range(20):
+            orig, dest = (Point(*rng.integers(0, 120, size=2).tolist())
+                          for _ in range(2))
+            if orig == dest: continue
+            expected = CSGraphSearchEngine().search(
+                weights, to_index(orig, 120), to_index(dest, 120))
+            cost = weights.T.ravel()[expected].sum()
+            for engine in engines:
+                searcher = Searcher(engine)
+                searcher.padding = 4
+                line = searcher.trace(orig, dest, data)
+                self.assertAlmostEqual(
+                    cost, sum(weights[p.y, p.x] for p in line), delta=1e-6)
+
+    def test_searcher_engines(self):
+        """Tracing should search with the engine of the searcher, not \
+        always with Dijkstra's algorithm."""
+        rng = np.random.default_rng(5)
+        data = rng.integers(0, 256, size=(200, 200))
+        weights = ExpDecayWeight()(data.astype(float))
+        orig, dest = Point(20, 30), Point(170, 160)
+        dijkstra = HeapSearchEngine()
+        expected = Searcher(dijkstra).trace(orig, dest, data)
+        for engine in AStarSearchEngine(), BidirectionalSearchEngine():
+            line = Searcher(engine).trace(orig, dest, data)
+            self.assertNotEqual(dijkstra.expanded, engine.expanded)
+            self.assertAlmostEqual(sum(weights[p.y, p.x] for p in expected),
+                                   sum(weights[p.y, p.x] for p in line),
+                                   delta=1e-6)
+
+    def test_polyline(self):
+        """Every segment of a polyline should be as cheap as tracing it on \
+        its own."""
+        rng = np.random.default_rng(2)
+        data = rng.integers(0, 256, size=(120, 150))
+        weights = ExpDecayWeight()(data.astype(float))
+        points = [Point(int(rng.integers(150)), int(rng.integers(120)))
+                  for _ in range(6)]
+        searcher = Searcher()
+        lines = searcher.trace_polyline(points, data, max_workers=2)
+        self.assertEqual(len(points) - 1, len(lines))
+        for orig, dest, line in zip(points, points[1:], lines):
+            expected = searcher.trace(orig, dest, data)
+            self.assertEqual(dest, line[0])
+            for a, b in zip(line, line[1:] + [orig]):
+                self.assertEqual(1, sum(abs(a - b)))
+            self.assertAlmostEqual(sum(weights[p.y, p.x] for p in expected),
+                                   sum(weights[p.y, p.x] for p in line),
+                                   delta=1e-6)
+
+    def test_livewire(self):
+        """Previews should be the paths a search in the same box finds."""
+        rng = np.random.default_rng(3)
+        data = rng.integers(0, 4, size=(50, 60)) * 60
+        weights = ExpDecayWeight()(data.astype(float))
+        orig = Point(30, 20)
+        livewire = Livewire(radius=15)
+        self.assertIsNone(livewire.path_to(orig))
+        self.assertTrue(livewire.start(data, orig))
+
+        box = weights[5:36, 15:46]
+        corner = Point(15, 5)
+        for _ in range(30):
+            dest = Point(int(rng.integers(15, 46)), int(rng.integers(5, 36)))
+            path = CSGraphSearchEngine().search(
+                box, to_index(orig - corner, 31), to_index(dest - corner, 31))
+            preview = livewire.path_to(dest)
+            self.assertEqual(path and [to_point(i, 31) + corner
+                                       for i in path],
+                             preview if preview is None else
+                             [Point(*p) for p in preview.tolist()])
+        self.assertIsNone(livewire.path_to(Point(0, 0)))
+
+        livewire.stop()
+        self.assertFalse(livewire.ready)
+
+    def test_cancel(self):
+        """A canceled search should stop at its next poll, after reporting \
+        its progress."""
+        weights = ExpDecayWeight()(np.zeros((100, 100)))
+        for engine in (HeapSearchEngine(), CSGraphSearchEngine(),
+                       AStarSearchEngine(), BidirectionalSearchEngine()):
+            reports = []
+            token = SearchToken(
+                progress=lambda *args: [reports.append(args), token.cancel()],
+                interval=100)
+            self.assertIsNone(engine.search(weights, 0, 100 * 100 - 1, token))
+            self.assertEqual(1, len(reports))
+            self.assertLessEqual(reports[0][0], 100)
+
+    def test_stages(self):
+        """With a token, the csgraph engine should poll it between stages \
+        that grow by ``STAGE_GROWTH``, and still find the cheapest path."""
+        weights = ExpDecayWeight()(np.random.default_rng(2).random(
+            (100, 100)) * 10)
+        engine = CSGraphSearchEngine()
+        reports = []
+        path = engine.search(weights, 0, 100 * 100 - 1,
+                             SearchToken(progress=lambda *a: reports.append(a)))
+        self.assertEqual(HeapSearchEngine().search(weights, 0, 100 * 100 - 1),
+                         path)
+        stages = [distance for _, distance in reports]
+        self.assertGreater(len(stages), 4)
+        for previous, stage in zip(stages, stages[1:]):
+            self.assertLessEqual(stage, previous * engine.STAGE_GROWTH * 1.001)
+
+        reports.clear()
+        tree = engine.tree(weights, 5050, SearchToken(
+            progress=lambda *a: reports.append(a)))
+        self.assertGreater(len(reports), 4)
+        np.testing.assert_array_equal(engine.tree(weights, 5050), tree)
+
+    def test_cost_maps(self):
+        """Weights should be computed once per key and match the scalar \
+        formula."""
+        data = np.arange(12, dtype=np.uint8).reshape((3, 4))
+        cost_maps = CostMaps(max_size=1)
+        weights = cost_maps.get(data, key=(0, 1))
+        self.assertIs(weights, cost_maps.get(data, key=(0, 1)))
+        self.assertIsNot(weights, cost_maps.get(data, key=(1, 1)))
+        self.assertIsNot(weights, cost_maps.get(data, key=(0, 1)))
+        self.assertIsNot(weights, cost_maps.get(data))
+        for (y, x), value in np.ndenumerate(data):
+            self.assertAlmostEqual(ExpDecayWeight()(float(value)),
+                                   weights[y, x])
+
+
+if __name__ == '__main__':
+    unittest.main()
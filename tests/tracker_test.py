@@ -0,0 +1,135 @@
+import threading
+import time
+
+import init
+import numpy as np
+import unittest
+from lib.point import Point
+from src.graph_analyzer import GraphAnalyzer
+from src.line_tracers import LineTracerTypes as ltt
+from src.scheduler import SearchScheduler
+from src.search_engines import SearchToken
+from src.searcher import Searcher
+from src.tracker import StackTracker, corridor_mask
+
+
+def make_stack(frames, drift):
+    """ A bright diagonal filament on a dark background, drifting right. """
+    stack = []
+    for i in range(frames):
+        data = np.full((80, 100), 20, dtype=np.uint8)
+        for y in range(80):
+            x = 20 + y // 2 + i * drift
+            data[y, x - 1:x + 2] = 200
+        stack.append(data)
+    return stack
+
+
+class TrackerTest(unittest.TestCase):
+    def test_corridor_mask(self):
+        """The mask should cover the lines and nothing far from them."""
+        mask = corridor_mask((50, 60), [[Point(10, 10), Point(40, 10)]], 3)
+        self.assertTrue(mask[10, 10:41].all())
+        self.assertTrue(mask[13, 25] and not mask[14, 25])
+        self.assertFalse(mask[30:, :].any())
+
+    def test_snap(self):
+        """Waypoints should move straight onto a filament, and stay on it."""
+        data = np.full((40, 40), 20, dtype=np.uint8)
+        data[:, 24:27] = 200
+        tracker = StackTracker(radius=5)
+        self.assertEqual(Point(25, 20), tracker.snap(data, Point(21, 20), 1))
+        self.assertEqual(Point(25, 20), tracker.snap(data, Point(25, 20), 1))
+        self.assertEqual(Point(15, 20), tracker.snap(data, Point(15, 20), 1))
+
+    def test_track(self):
+        """Tracked paths should follow the drifting filament."""
+        stack = make_stack(5, 2)
+        points = [Point(24, 0), Point(39, 30), Point(59, 70)]
+        searcher = Searcher()
+        lines = [searcher.trace(a, b, GraphAnalyzer.take_avg(stack[2], 1))
+                 for a, b in zip(points, points[1:])]
+
+        results = {}
+        done = threading.Condition()
+
+        def callback(i, res):
+            with done:
+                results[i] = res
+                done.notify_all()
+
+        scheduler = SearchScheduler(max_workers=2)
+        try:
+            count = StackTracker().track(
+                scheduler, ltt.BRIGHTEST, stack, range(len(stack)), points,
+                lines, 2, 1, SearchToken(), callback)
+            with done:
+                self.assertTrue(done.wait_for(
+                    lambda: len(results) == count, timeout=60))
+        finally:
+            scheduler.shutdown()
+
+        self.assertEqual({0, 1, 3, 4}, set(results))
+        for i, res in results.items():
+            self.assertEqual(len(points) - 1, len(res))
+            on_filament = [stack[i][p.y, p.x] == 200
+                           for line in res for p in line]
+            self.assertTrue(on_filament[-1])
+            self.assertGreater(np.mean(on_filament), 0.9)
+
+    def test_keys(self):
+        """Only the frames of ``keys`` should be tracked, even if there are \
+        more."""
+        stack = make_stack(5, 1)
+        points = [Point(24, 0), Point(59, 70)]
+        lines = [Searcher().trace(*points, GraphAnalyzer.take_avg(stack[1], 1))]
+        results = {}
+        scheduler = SearchScheduler(max_workers=1)
+        try:
+            count = StackTracker().track(
+                scheduler, ltt.BRIGHTEST, stack, range(3), points, lines, 1, 1,
+                SearchToken(), lambda i, res: results.update({i: res}))
+            self.assertEqual(2, count)
+            self.assertTrue(wait_for(lambda: len(results) == count))
+        finally:
+            scheduler.shutdown()
+        self.assertEqual({0, 2}, set(results))
+        self.assertTrue(all(results.values()))
+
+    def test_batches(self):
+        """At most ``batch`` frames should be in shared memory at once, and \
+        a canceled run should still report every frame."""
+        stack = make_stack(8, 1)
+        points = [Point(24, 0), Point(59, 70)]
+        lines = [Searcher().trace(*points, GraphAnalyzer.take_avg(stack[0], 1))]
+        scheduler = SearchScheduler(max_workers=1, max_frames=2)
+        shared = []
+
+        def callback(i, res):
+            shared.append(len(scheduler._frames))
+            results[i] = res
+
+        try:
+            for canceled in (False, True):
+                results = {}
+                token = SearchToken()
+                if canceled: token.cancel()
+                count = StackTracker().track(
+                    scheduler, ltt.BRIGHTEST, stack, range(len(stack)),
+                    points, lines, 0, 1, token, callback)
+                self.assertTrue(wait_for(lambda: len(results) == count))
+                self.assertEqual(set(range(1, 8)), set(results))
+                self.assertEqual(canceled, not any(results.values()))
+        finally:
+            scheduler.shutdown()
+        self.assertLessEqual(max(shared), 2)
+
+
+def wait_for(predicate, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline: time.sleep(0.01)
+    return predicate()
+
+
+if __name__ == '__main__':
+    unittest.main()